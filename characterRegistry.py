@@ -0,0 +1,202 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Players we know about (us included), kept up to date from who/look/stat/exp
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# One Character per player, keyed by first name (that's what "Also here" and
+# most game messages use), fed from the parser's events:
+#
+#   WhoEntry        alignment, title, gang (and the full name)
+#   LookedAt        what they're wearing, slot -> item (reported as "equipment:<slot>"),
+#                   each look replaces the lot so taken off items go (reported as (item, None))
+#   StatBlock       our own race/class/level/hits/AC/DR/stats
+#   ExpStatus       our own exp/level/exp needed
+#
+# "who" gets polled a lot and a full list is ~60 players that almost never
+# change, so every update is a diff: each field is compared and only the ones
+# that actually changed are written and reported in one CharacterUpdated event.
+# An unchanged who-list costs a dict hit and a few compares per row and
+# produces no events at all. Names are interned, Characters use __slots__.
+#
+#   registry = PlayerRegistry()
+#   registry.attach(parser)
+#   parser.subscribe(CharacterUpdated, lambda event: print(event.name, event.changes))
+
+import sys
+
+from parserEvents import CharacterUpdated, ExpStatus, LookedAt, StatBlock, WhoEntry
+
+# stat block field -> Character attribute, for the plain number fields
+STAT_NUMBERS = {
+    "Exp": "exp",
+    "Level": "level",
+    "Perception": "perception",
+    "Stealth": "stealth",
+    "Thievery": "thievery",
+    "Traps": "traps",
+    "Picklocks": "picklocks",
+    "Tracking": "tracking",
+    "Martial Arts": "martialArts",
+    "MagicRes": "magicRes",
+    "Strength": "strength",
+    "Agility": "agility",
+    "Intellect": "intellect",
+    "Health": "health",
+    "Willpower": "willpower",
+    "Charm": "charm",
+}
+
+# stat block fields that are two numbers "a/b" -> (attribute for a, attribute for b)
+STAT_PAIRS = {
+    "Lives/CP": ("lives", "cp"),
+    "Hits": ("hits", "maxHits"),
+    "Armour Class": ("armourClass", "damageResist"),
+}
+
+
+class Character(object):
+    __slots__ = ("name", "fullName", "alignment", "title", "gang", "race", "className", "level", "exp", "expNeeded",
+                 "lives", "cp", "hits", "maxHits", "armourClass", "damageResist",
+                 "perception", "stealth", "thievery", "traps", "picklocks", "tracking", "martialArts", "magicRes",
+                 "strength", "agility", "intellect", "health", "willpower", "charm",
+                 "equipment")
+
+    def __init__(self, name):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        self.name = name
+        self.equipment = {}
+
+    # set the fields that differ, returns {field: (old, new)} for those
+    def apply(self, fields):
+        changes = None
+        for field, value in fields.items():
+            old = getattr(self, field)
+            if old != value:
+                setattr(self, field, value)
+                if changes is None:
+                    changes = {}
+                changes[field] = (old, value)
+        return changes
+
+    def asDict(self):
+        fields = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is not None:
+                fields[field] = dict(value) if field == "equipment" else value
+        return fields
+
+    def __repr__(self):
+        return "Character(%s)" % ", ".join("%s=%r" % item for item in self.asDict().items())
+
+
+# "9/2" -> (9, 2), None for anything else
+def numberPair(text):
+    first, slash, second = text.partition("/")
+    if slash and first.isdigit() and second.isdigit():
+        return int(first), int(second)
+    return None
+
+
+class PlayerRegistry(object):
+
+    def __init__(self):
+        self.players = {}       # interned first name -> Character
+        self.me = None          # our own Character, once a stat block was seen
+        self.parser = None
+
+    def __len__(self):
+        return len(self.players)
+
+    def __contains__(self, name):
+        return name in self.players
+
+    def get(self, name):
+        return self.players.get(name.split(" ", 1)[0])
+
+    # Character for a (first or full) name, created the first time
+    def player(self, name):
+        first = name.split(" ", 1)[0]
+        character = self.players.get(first)
+        if character is None:
+            first = sys.intern(first)
+            character = Character(first)
+            self.players[first] = character
+        return character
+
+    def attach(self, parser):
+        self.parser = parser
+        parser.subscribe(WhoEntry, self.onWhoEntry)
+        parser.subscribe(LookedAt, self.onLookedAt)
+        parser.subscribe(StatBlock, self.onStatBlock)
+        parser.subscribe(ExpStatus, self.onExpStatus)
+
+    # apply fields to a character and tell subscribers what changed
+    def update(self, character, fields):
+        changes = character.apply(fields)
+        if changes:
+            self.report(character, changes)
+        return changes
+
+    def report(self, character, changes):
+        if self.parser is not None:
+            callbacks = self.parser.subscribers.get(CharacterUpdated)
+            if callbacks:
+                self.parser.emit(callbacks, CharacterUpdated(character.name, changes))
+
+    ####################################
+    #       EVENTS                     #
+    ####################################
+
+    def onWhoEntry(self, event):
+        character = self.player(event.name)
+        self.update(character, {"fullName": event.name, "alignment": event.alignment, "title": event.title,
+                                "gang": event.gang})
+
+    def onLookedAt(self, event):
+        if not event.player:
+            return
+        character = self.player(event.player)
+        equipment = character.equipment
+        changes = {}
+        for slot, item in event.equipment.items():
+            old = equipment.get(slot)
+            if old != item:
+                changes["equipment:" + slot] = (old, item)
+        for slot, old in equipment.items():
+            if slot not in event.equipment:
+                changes["equipment:" + slot] = (old, None)
+        if changes:
+            character.equipment = dict(event.equipment)
+            self.report(character, changes)
+
+    def onStatBlock(self, event):
+        stats = event.fields
+        name = stats.get("Name")
+        if not name:
+            return
+
+        fields = {"fullName": name}
+        if "Race" in stats:
+            fields["race"] = stats["Race"]
+        if "Class" in stats:
+            fields["className"] = stats["Class"]
+        for key, field in STAT_NUMBERS.items():
+            value = stats.get(key)
+            if value is not None and value.isdigit():
+                fields[field] = int(value)
+        for key, (first, second) in STAT_PAIRS.items():
+            pair = numberPair(stats.get(key, ""))
+            if pair is not None:
+                fields[first], fields[second] = pair
+
+        self.me = self.player(name)
+        self.update(self.me, fields)
+
+    # the exp line doesn't say who it's about, it's always us
+    def onExpStatus(self, event):
+        if self.me is None:
+            return
+        self.update(self.me, {"exp": event.exp, "level": event.level, "expNeeded": event.needed})
@@ -0,0 +1,311 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Combat rounds, damage per actor and exp/hr from the parser's combat events
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Listens to CombatState, CombatHit, ExperienceGained and DamageTally and keeps:
+#
+#   rounds          the last `roundWindow` rounds as parallel arrays (start time,
+#                   damage dealt by us, damage taken by us, hits, exp)
+#   actors          per actor running totals plus a ring of their per-round
+#                   damage dealt/taken over the same window
+#   expMeter        exp over the last hour in one minute buckets -> exp/hr
+#   damageMeter     our damage over the last `roundWindow` rounds -> damage/round
+#
+# Everything is a fixed size ring updated in O(1) per line, so a session left
+# running for days uses the same memory as one that just started. Only the
+# actor table grows with new names, and it's capped at maxActors (least
+# recently seen goes first).
+#
+# The game doesn't mark round boundaries, so a round ends at the "(Dmg:.. Tot:..)"
+# tally, at "*Combat Off*", or when nothing combat related was seen for ROUND_GAP
+# seconds (a round's messages arrive in one burst, rounds are ~5 s apart).
+#
+#   tracker = CombatTracker()
+#   tracker.attach(parser)
+#   ...
+#   tracker.expPerHour(), tracker.damagePerRound(), tracker.actor("Laverne").dealtRecent()
+
+import time
+from array import array
+
+from parserEvents import CombatHit, CombatState, DamageTally, ExperienceGained
+
+ROUND_WINDOW = 256
+ROUND_GAP = 2.5
+
+# exp/hr window, in buckets of BUCKET_SECONDS
+EXP_WINDOW = 3600
+BUCKET_SECONDS = 60
+
+MAX_ACTORS = 512
+
+# how we show up as attacker ("You whap ...") and target ("... smashes you ...")
+YOU = "You"
+
+
+# sum of values over the last `window` seconds, kept in fixed buckets
+class RollingSum(object):
+    __slots__ = ("buckets", "bucketSeconds", "bucket", "total", "started")
+
+    def __init__(self, window=EXP_WINDOW, bucketSeconds=BUCKET_SECONDS):
+        self.buckets = array("d", bytes(8 * max(1, int(window // bucketSeconds))))
+        self.bucketSeconds = bucketSeconds
+        self.bucket = None      # absolute bucket number the ring was last advanced to
+        self.total = 0.0
+        self.started = None
+
+    # move the ring up to `now`, emptying the buckets that fell out of the window
+    def advance(self, now):
+        bucket = int(now // self.bucketSeconds)
+        if self.bucket is None:
+            self.bucket = bucket
+            self.started = now
+            return
+
+        size = len(self.buckets)
+        buckets = self.buckets
+        # at most one full lap, however long we were idle
+        for number in range(self.bucket + 1, min(bucket, self.bucket + size) + 1):
+            slot = number % size
+            self.total -= buckets[slot]
+            buckets[slot] = 0.0
+        if bucket > self.bucket:
+            self.bucket = bucket
+
+    def add(self, now, value):
+        self.advance(now)
+        self.buckets[self.bucket % len(self.buckets)] += value
+        self.total += value
+
+    # sum over the window and the seconds it actually covers
+    def window(self, now):
+        self.advance(now)
+        covered = min(len(self.buckets) * self.bucketSeconds, now - self.started) if self.started is not None else 0.0
+        return self.total, covered
+
+
+# mean of the last `size` values
+class RollingMean(object):
+    __slots__ = ("values", "next", "count", "total")
+
+    def __init__(self, size=ROUND_WINDOW):
+        self.values = array("d", bytes(8 * size))
+        self.next = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        values = self.values
+        self.total += value - values[self.next]
+        values[self.next] = value
+        self.next = (self.next + 1) % len(values)
+        if self.count < len(values):
+            self.count += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class ActorStats(object):
+    __slots__ = ("name", "dealt", "taken", "hits", "crits", "roundDealt", "roundTaken", "roundNumber")
+
+    def __init__(self, name, window=ROUND_WINDOW):
+        self.name = name
+        self.dealt = 0
+        self.taken = 0
+        self.hits = 0
+        self.crits = 0
+
+        # per round damage, slot = round number % window
+        self.roundDealt = array("i", bytes(4 * window))
+        self.roundTaken = array("i", bytes(4 * window))
+        self.roundNumber = array("q", [-1]) * window
+
+    # the ring slot for a round, cleared if it still holds an older round
+    def slot(self, number):
+        slot = number % len(self.roundNumber)
+        if self.roundNumber[slot] != number:
+            self.roundNumber[slot] = number
+            self.roundDealt[slot] = 0
+            self.roundTaken[slot] = 0
+        return slot
+
+    # damage over the rounds still in the ring
+    def dealtRecent(self):
+        return sum(dealt for dealt, number in zip(self.roundDealt, self.roundNumber) if number != -1)
+
+    def takenRecent(self):
+        return sum(taken for taken, number in zip(self.roundTaken, self.roundNumber) if number != -1)
+
+    def asDict(self):
+        return {"name": self.name, "dealt": self.dealt, "taken": self.taken, "hits": self.hits, "crits": self.crits,
+                "dealtRecent": self.dealtRecent(), "takenRecent": self.takenRecent()}
+
+
+class CombatTracker(object):
+
+    def __init__(self, roundWindow=ROUND_WINDOW, roundGap=ROUND_GAP, expWindow=EXP_WINDOW,
+                 bucketSeconds=BUCKET_SECONDS, maxActors=MAX_ACTORS, clock=time.monotonic):
+        self.roundWindow = roundWindow
+        self.roundGap = roundGap
+        self.maxActors = maxActors
+        self.clock = clock
+
+        self.engaged = False
+        self.lastSeen = None
+
+        # finished rounds, slot = round number % roundWindow
+        self.roundStart = array("d", bytes(8 * roundWindow))
+        self.roundDealt = array("i", bytes(4 * roundWindow))
+        self.roundTaken = array("i", bytes(4 * roundWindow))
+        self.roundHits = array("H", bytes(2 * roundWindow))
+        self.roundExp = array("i", bytes(4 * roundWindow))
+        self.rounds = 0                 # rounds finished so far
+        self.roundOpen = False
+
+        # name -> ActorStats, ordered least recently seen first
+        self.actors = {}
+
+        # lifetime totals
+        self.dealt = 0
+        self.taken = 0
+        self.experience = 0
+
+        self.expMeter = RollingSum(expWindow, bucketSeconds)
+        self.damageMeter = RollingMean(roundWindow)
+
+    def attach(self, parser):
+        parser.subscribe(CombatState, self.onCombatState)
+        parser.subscribe(CombatHit, self.onHit)
+        parser.subscribe(ExperienceGained, self.onExperience)
+        parser.subscribe(DamageTally, self.onDamageTally)
+
+    ####################################
+    #       ROUNDS                     #
+    ####################################
+
+    # slot of the round in progress, starting one if needed
+    def currentRound(self, now):
+        if self.roundOpen and now - self.lastSeen > self.roundGap:
+            self.closeRound()
+
+        slot = self.rounds % self.roundWindow
+        if not self.roundOpen:
+            self.roundOpen = True
+            self.roundStart[slot] = now
+            self.roundDealt[slot] = 0
+            self.roundTaken[slot] = 0
+            self.roundHits[slot] = 0
+            self.roundExp[slot] = 0
+        self.lastSeen = now
+        return slot
+
+    def closeRound(self):
+        if not self.roundOpen:
+            return
+        self.damageMeter.add(self.roundDealt[self.rounds % self.roundWindow])
+        self.rounds += 1
+        self.roundOpen = False
+
+    # the last `count` finished rounds, oldest first, as dicts
+    def recentRounds(self, count=None):
+        available = min(self.rounds, self.roundWindow)
+        count = available if count is None else min(count, available)
+        rounds = []
+        for number in range(self.rounds - count, self.rounds):
+            slot = number % self.roundWindow
+            rounds.append({"round": number, "start": self.roundStart[slot], "dealt": self.roundDealt[slot],
+                           "taken": self.roundTaken[slot], "hits": self.roundHits[slot], "exp": self.roundExp[slot]})
+        return rounds
+
+    ####################################
+    #       ACTORS                     #
+    ####################################
+
+    def actor(self, name):
+        return self.actors.get(name)
+
+    # stats for an actor, moved to the most recently seen end
+    def touchActor(self, name):
+        actors = self.actors
+        stats = actors.pop(name, None)
+        if stats is None:
+            stats = ActorStats(name, self.roundWindow)
+            if len(actors) >= self.maxActors:
+                del actors[next(iter(actors))]
+        actors[name] = stats
+        return stats
+
+    ####################################
+    #       EVENTS                     #
+    ####################################
+
+    def onCombatState(self, event):
+        if not event.engaged:
+            self.closeRound()
+        self.engaged = event.engaged
+
+    def onHit(self, event):
+        now = self.clock()
+        slot = self.currentRound(now)
+        number = self.rounds
+        damage = event.damage
+
+        attacker = self.touchActor(YOU if event.attacker == YOU else event.attacker)
+        attacker.dealt += damage
+        attacker.hits += 1
+        if event.critical:
+            attacker.crits += 1
+        attacker.roundDealt[attacker.slot(number)] += damage
+
+        target = self.touchActor(YOU if event.target == "you" else event.target)
+        target.taken += damage
+        target.roundTaken[target.slot(number)] += damage
+
+        self.roundHits[slot] = min(self.roundHits[slot] + 1, 0xFFFF)
+        if attacker.name == YOU:
+            self.roundDealt[slot] += damage
+            self.dealt += damage
+        elif target.name == YOU:
+            self.roundTaken[slot] += damage
+            self.taken += damage
+
+    def onExperience(self, event):
+        now = self.clock()
+        slot = self.currentRound(now)
+        self.roundExp[slot] += event.amount
+        self.experience += event.amount
+        self.expMeter.add(now, event.amount)
+
+    # the tally is the last thing the game prints for our round
+    def onDamageTally(self, event):
+        self.closeRound()
+
+    ####################################
+    #       METERS                     #
+    ####################################
+
+    # exp per hour over the last expWindow seconds (or since the first exp, if less)
+    def expPerHour(self, now=None):
+        total, covered = self.expMeter.window(self.clock() if now is None else now)
+        if covered <= 0:
+            return 0.0
+        return total * 3600.0 / max(covered, self.expMeter.bucketSeconds)
+
+    # our mean damage over the last roundWindow rounds
+    def damagePerRound(self):
+        return self.damageMeter.mean()
+
+    def snapshot(self):
+        return {
+            "engaged": self.engaged,
+            "rounds": self.rounds,
+            "dealt": self.dealt,
+            "taken": self.taken,
+            "experience": self.experience,
+            "expPerHour": self.expPerHour(),
+            "damagePerRound": self.damagePerRound(),
+            "actors": [stats.asDict() for stats in self.actors.values()],
+        }
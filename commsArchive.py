@@ -0,0 +1,492 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Append-only archive of channel traffic (gossip/telepath/says) with a full text index
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Gossip is where patch notes and intel go by ("Bloodrock gossips: sun robes
+# added to gear shop in naz ..."), so every Communication event the parser
+# emits is kept, in a directory holding two files:
+#
+#   comms.log   append-only, one message per line:
+#               time <tab> channel <tab> speaker <tab> target <tab> text
+#   comms.idx   a checkpoint of the index, and how much of comms.log it covers
+#
+# The index lives in memory as arrays: per message its offset in comms.log,
+# time, channel and speaker, and postings (ascending message ids) for every
+# word, speaker and channel. Adding a message is one write to the log and a
+# few array appends. Opening the archive loads the checkpoint and only indexes
+# what was appended to comms.log after it, so a crash costs a re-read of the
+# tail and months of captures are never rescanned. A damaged or missing
+# checkpoint is rebuilt from comms.log.
+#
+# search() intersects the postings of the words/speaker/channel asked for,
+# smallest list first with a C bisect into the others, and bisects the time
+# range on the times array (messages are appended in time order), so a query
+# costs about the size of its rarest term, not of the archive. Only the
+# messages returned are read back from comms.log.
+#
+# Checkpoint layout (native byte order, like gameSnapshot.py):
+#
+#   HEADER      magic, format version, log bytes covered, message count, metadata length
+#   METADATA    json: speakers, channels, words and how many postings each has
+#   ARRAYS      offsets 'q', times 'd', channel 'B', speaker 'i', then the
+#               word, speaker and channel postings 'i' back to back
+#
+#   archive = CommsArchive("comms")
+#   archive.attach(parser)
+#   archive.search(keywords="robes", channel="gossip", since=time.time() - 86400)
+#
+#   python commsArchive.py import 2025-03-31_10-56-19.log    archive a capture
+#   python commsArchive.py search --speaker Bloodrock robes
+#   python commsArchive.py benchmark --messages 1000000
+
+import json
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from parserEvents import Communication
+
+ARCHIVE_MAGIC = b"MMCOMM\x00\x01"
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct("<8sIQQI")
+
+LOG_NAME = "comms.log"
+INDEX_NAME = "comms.idx"
+
+# words are runs of letters, digits and apostrophes, lower cased
+WORD = re.compile(r"[a-z0-9']+")
+
+# messages between checkpoints while attached to a parser
+CHECKPOINT_EVERY = 10000
+
+# a message read back from comms.log
+Message = namedtuple("Message", ["id", "time", "channel", "speaker", "target", "text"])
+
+
+# ascending ids in every one of `postings` (each sorted), smallest list drives
+def intersect(postings):
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for other in postings[1:]:
+        size = len(other)
+        kept = array("i")
+        for value in result:
+            position = bisect_left(other, value)
+            if position < size and other[position] == value:
+                kept.append(value)
+        result = kept
+        if not result:
+            break
+    return result
+
+
+class PostingTable(object):
+
+    def __init__(self):
+        self.keys = {}          # key -> index into postings
+        self.postings = []      # array('i') of message ids per key
+
+    def add(self, key, messageId):
+        index = self.keys.get(key)
+        if index is None:
+            index = self.keys[key] = len(self.postings)
+            self.postings.append(array("i"))
+        postings = self.postings[index]
+        # a word twice in one message is still one posting
+        if not postings or postings[-1] != messageId:
+            postings.append(messageId)
+        return index
+
+    def get(self, key):
+        index = self.keys.get(key)
+        return None if index is None else self.postings[index]
+
+    def names(self):
+        return list(self.keys)
+
+    # for the checkpoint: the keys, how many postings each has, and all of them in one array
+    def dump(self):
+        counts = [len(postings) for postings in self.postings]
+        joined = array("i")
+        for postings in self.postings:
+            joined.extend(postings)
+        return self.names(), counts, joined
+
+    @classmethod
+    def restore(cls, names, counts, joined):
+        table = cls()
+        start = 0
+        for name, count in zip(names, counts):
+            table.keys[name] = len(table.postings)
+            table.postings.append(joined[start:start + count])
+            start += count
+        return table
+
+
+class CommsArchive(object):
+
+    def __init__(self, directory, clock=time.time, checkpointEvery=CHECKPOINT_EVERY):
+        self.directory = directory
+        self.logPath = os.path.join(directory, LOG_NAME)
+        self.indexPath = os.path.join(directory, INDEX_NAME)
+        self.clock = clock
+        self.checkpointEvery = checkpointEvery
+        os.makedirs(directory, exist_ok=True)
+
+        # per message
+        self.offsets = array("q")
+        self.times = array("d")
+        self.channelIds = array("B")
+        self.speakerIds = array("i")
+
+        self.words = PostingTable()
+        self.speakers = PostingTable()     # lower cased speaker
+        self.channels = PostingTable()
+        self.speakerNames = []             # speaker id -> name as the game printed it
+        self.channelNames = []
+
+        self.ordered = True                # times never went backwards, so time ranges can bisect
+        self.logSize = 0
+        self.sinceCheckpoint = 0
+        self.badRecords = 0                # lines in comms.log catchUp() couldn't read, skipped
+
+        self.loadIndex()
+        self.catchUp()
+        self.log = open(self.logPath, "ab")
+        self.reader = open(self.logPath, "rb")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def attach(self, parser):
+        parser.subscribe(Communication, self.onCommunication)
+
+    def onCommunication(self, event):
+        self.add(event.channel, event.speaker, event.text, event.target)
+        if self.sinceCheckpoint >= self.checkpointEvery:
+            self.save()
+
+    ####################################
+    #       WRITING                    #
+    ####################################
+
+    # append one message, returns its id
+    def add(self, channel, speaker, text, target=None, when=None):
+        if when is None:
+            when = self.clock()
+        fields = (channel, speaker, target or "", text)
+        line = ("%.3f\t" % when + "\t".join(field.replace("\t", " ").replace("\n", " ") for field in fields)
+                + "\n").encode("utf-8")
+        offset = self.logSize
+        self.log.write(line)
+        self.log.flush()
+        self.logSize += len(line)
+        self.sinceCheckpoint += 1
+        return self.index(offset, when, channel, speaker, text)
+
+    def index(self, offset, when, channel, speaker, text):
+        messageId = len(self.offsets)
+        if self.times and when < self.times[-1]:
+            self.ordered = False
+
+        channelId = self.channels.add(channel, messageId)
+        if channelId == len(self.channelNames):
+            self.channelNames.append(channel)
+        speakerId = self.speakers.add(speaker.lower(), messageId)
+        if speakerId == len(self.speakerNames):
+            self.speakerNames.append(speaker)
+
+        self.offsets.append(offset)
+        self.times.append(when)
+        self.channelIds.append(channelId)
+        self.speakerIds.append(speakerId)
+
+        words = self.words
+        for word in WORD.findall(text.lower()):
+            words.add(word, messageId)
+        return messageId
+
+    # write the index checkpoint (to a temporary file first, so a crash can't leave half of one)
+    def save(self):
+        self.log.flush()
+        wordNames, wordCounts, wordPostings = self.words.dump()
+        speakerNames, speakerCounts, speakerPostings = self.speakers.dump()
+        channelNames, channelCounts, channelPostings = self.channels.dump()
+        metadata = json.dumps({
+            "byteorder": sys.byteorder,
+            "ordered": self.ordered,
+            "speakerNames": self.speakerNames,
+            "channelNames": self.channelNames,
+            "words": [wordNames, wordCounts],
+            "speakers": [speakerNames, speakerCounts],
+            "channels": [channelNames, channelCounts],
+        }).encode("utf-8")
+
+        temporary = self.indexPath + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, self.logSize, len(self.offsets), len(metadata)))
+            file.write(metadata)
+            for values in (self.offsets, self.times, self.channelIds, self.speakerIds,
+                           wordPostings, speakerPostings, channelPostings):
+                values.tofile(file)
+        os.replace(temporary, self.indexPath)
+        self.sinceCheckpoint = 0
+
+    def close(self):
+        if self.log is not None:
+            self.save()
+            self.log.close()
+            self.reader.close()
+            self.log = None
+            self.reader = None
+
+    ####################################
+    #       LOADING                    #
+    ####################################
+
+    def loadIndex(self):
+        try:
+            with open(self.indexPath, "rb") as file:
+                magic, version, logSize, count, metadataLength = ARCHIVE_HEADER.unpack(file.read(ARCHIVE_HEADER.size))
+                if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+                    return
+                if logSize > os.path.getsize(self.logPath):
+                    return
+                metadata = json.loads(file.read(metadataLength))
+                if metadata["byteorder"] != sys.byteorder:
+                    return
+
+                def read(typecode, length):
+                    values = array(typecode)
+                    values.fromfile(file, length)
+                    return values
+
+                offsets = read("q", count)
+                times = read("d", count)
+                channelIds = read("B", count)
+                speakerIds = read("i", count)
+                tables = [PostingTable.restore(names, counts, read("i", sum(counts)))
+                          for names, counts in (metadata["words"], metadata["speakers"], metadata["channels"])]
+        except (OSError, EOFError, ValueError, KeyError, struct.error):
+            # no checkpoint, or a bad one: catchUp() indexes the whole log
+            return
+
+        self.offsets, self.times, self.channelIds, self.speakerIds = offsets, times, channelIds, speakerIds
+        self.words, self.speakers, self.channels = tables
+        self.speakerNames = metadata["speakerNames"]
+        self.channelNames = metadata["channelNames"]
+        self.ordered = metadata["ordered"]
+        self.logSize = logSize
+
+    # index whatever comms.log has past the checkpoint
+    def catchUp(self):
+        if not os.path.exists(self.logPath):
+            return
+        with open(self.logPath, "rb") as file:
+            file.seek(self.logSize)
+            offset = self.logSize
+            for line in file:
+                # a line cut short by a crash mid write is dropped (and overwritten by the next append)
+                if not line.endswith(b"\n"):
+                    break
+                # a whole line that isn't a record (bad utf-8, missing fields, no time) stays
+                # in the log but isn't indexed, the records after it still are
+                try:
+                    when, channel, speaker, _, text = line[:-1].decode("utf-8").split("\t", 4)
+                    when = float(when)
+                except ValueError:
+                    self.badRecords += 1
+                else:
+                    self.index(offset, when, channel, speaker, text)
+                    self.sinceCheckpoint += 1
+                offset += len(line)
+        if offset != os.path.getsize(self.logPath):
+            with open(self.logPath, "r+b") as file:
+                file.truncate(offset)
+        self.logSize = offset
+
+    ####################################
+    #       QUERIES                    #
+    ####################################
+
+    def message(self, messageId):
+        start = self.offsets[messageId]
+        self.reader.seek(start)
+        # one line, a skipped bad record may sit between this message and the next
+        when, channel, speaker, target, text = self.reader.readline()[:-1].decode("utf-8").split("\t", 4)
+        return Message(messageId, float(when), channel, speaker, target or None, text)
+
+    # message ids matching everything given, ascending
+    #   keywords: words that must all appear (a string is split into words)
+    #   since/until: time range, until exclusive
+    def matchIds(self, keywords=None, speaker=None, channel=None, since=None, until=None):
+        postings = []
+        if keywords:
+            if isinstance(keywords, str):
+                keywords = [keywords]
+            for word in (word for keyword in keywords for word in WORD.findall(keyword.lower())):
+                found = self.words.get(word)
+                if found is None:
+                    return array("i")
+                postings.append(found)
+        for table, key in ((self.speakers, speaker and speaker.lower()), (self.channels, channel)):
+            if key:
+                found = table.get(key)
+                if found is None:
+                    return array("i")
+                postings.append(found)
+
+        low, high = 0, len(self.times)
+        if self.ordered:
+            if since is not None:
+                low = bisect_left(self.times, since)
+            if until is not None:
+                high = bisect_left(self.times, until)
+
+        if postings:
+            ids = intersect(postings)
+            ids = ids[bisect_left(ids, low):bisect_right(ids, high - 1)]
+        else:
+            ids = array("i", range(low, high))
+
+        if not self.ordered and (since is not None or until is not None):
+            times = self.times
+            ids = array("i", (messageId for messageId in ids
+                              if (since is None or times[messageId] >= since) and (until is None or times[messageId] < until)))
+        return ids
+
+    # Messages matching everything given, newest first
+    def search(self, keywords=None, speaker=None, channel=None, since=None, until=None, limit=50):
+        ids = self.matchIds(keywords, speaker, channel, since, until)
+        return [self.message(messageId) for messageId in reversed(ids[-limit:] if limit else ids)]
+
+    # how many messages each speaker has, most first
+    def topSpeakers(self, count=10):
+        totals = sorted(((len(self.speakers.postings[index]), self.speakerNames[index])
+                         for index in self.speakers.keys.values()), reverse=True)
+        return [(name, total) for total, name in totals[:count]]
+
+
+####################################
+#       COMMAND LINE               #
+####################################
+
+# every Communication in a capture file into the archive, stamped with the time its file name gives
+def importCapture(archive, path):
+    from majormudParser import majormudParser
+
+    base = os.path.basename(path)
+    try:
+        when = time.mktime(time.strptime(base[:19], "%Y-%m-%d_%H-%M-%S"))
+    except ValueError:
+        when = os.path.getmtime(path)
+
+    parser = majormudParser()
+    before = len(archive)
+    parser.subscribe(Communication, lambda event: archive.add(event.channel, event.speaker, event.text, event.target, when))
+    with open(path, "rb") as file:
+        chunk = file.read(4096)
+        while chunk:
+            parser.feed(chunk)
+            chunk = file.read(4096)
+    parser.flush()
+    return len(archive) - before
+
+
+def benchmark(archive, messages):
+    import random
+
+    random.seed(1)
+    channels = ("gossip", "gossip", "gossip", "telepath", "say", "auction")
+    speakers = ["Player%d" % number for number in range(400)]
+    vocabulary = ["word%d" % number for number in range(20000)] + ["robes", "naz", "platinum", "bracers", "haste"]
+    start = time.time() - messages * 10.0
+
+    began = time.perf_counter()
+    for number in range(messages):
+        text = " ".join(random.choice(vocabulary) for _ in range(random.randint(3, 12)))
+        archive.add(random.choice(channels), random.choice(speakers), text, when=start + number * 10.0)
+    elapsed = time.perf_counter() - began
+    print("added %d messages in %.1f s (%.1f us each)" % (messages, elapsed, elapsed / messages * 1e6))
+
+    began = time.perf_counter()
+    archive.save()
+    print("checkpoint %.1f MB in %.2f s" % (os.path.getsize(archive.indexPath) / 1e6, time.perf_counter() - began))
+
+    began = time.perf_counter()
+    reopened = CommsArchive(archive.directory)
+    print("reopened in %.2f s" % (time.perf_counter() - began))
+
+    queries = (
+        ("keyword", dict(keywords="robes")),
+        ("two keywords", dict(keywords="robes naz")),
+        ("speaker", dict(speaker="Player7")),
+        ("speaker + keyword", dict(speaker="Player7", keywords="platinum")),
+        ("channel + last day", dict(channel="telepath", since=start + messages * 10.0 - 86400)),
+        ("keyword + time range", dict(keywords="haste", since=start, until=start + messages * 5.0)),
+    )
+    for label, query in queries:
+        rounds = 20
+        began = time.perf_counter()
+        for _ in range(rounds):
+            found = reopened.search(**query)
+        elapsed = (time.perf_counter() - began) / rounds
+        print("  %-22s %8.3f ms  %d results" % (label, elapsed * 1e3, len(found)))
+    reopened.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import shutil
+    import tempfile
+
+    arguments = argparse.ArgumentParser(description="archive and search channel traffic")
+    arguments.add_argument("--archive", default="comms", help="archive directory")
+    commands = arguments.add_subparsers(dest="command", required=True)
+
+    importing = commands.add_parser("import", help="archive the traffic in capture files")
+    importing.add_argument("captures", nargs="+")
+
+    searching = commands.add_parser("search", help="search the archive")
+    searching.add_argument("keywords", nargs="*")
+    searching.add_argument("--speaker")
+    searching.add_argument("--channel")
+    searching.add_argument("--days", type=float, help="only the last N days")
+    searching.add_argument("--limit", type=int, default=20)
+
+    benchmarking = commands.add_parser("benchmark", help="time adding and searching a synthetic archive")
+    benchmarking.add_argument("--messages", type=int, default=200000)
+
+    options = arguments.parse_args()
+
+    if options.command == "benchmark":
+        directory = tempfile.mkdtemp()
+        try:
+            archive = CommsArchive(directory)
+            benchmark(archive, options.messages)
+            archive.close()
+        finally:
+            shutil.rmtree(directory)
+        sys.exit(0)
+
+    archive = CommsArchive(options.archive)
+    try:
+        if options.command == "import":
+            # oldest first keeps the times in order
+            for path in sorted(options.captures):
+                print("%s: %d messages" % (path, importCapture(archive, path)))
+        else:
+            since = time.time() - options.days * 86400 if options.days else None
+            for message in archive.search(options.keywords, options.speaker, options.channel, since, limit=options.limit):
+                stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(message.time))
+                target = " (to %s)" % message.target if message.target else ""
+                print("%s  %-9s %s%s: %s" % (stamp, message.channel, message.speaker, target, message.text))
+    finally:
+        archive.close()
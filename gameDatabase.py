@@ -0,0 +1,322 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Lazily loaded, indexed access to the MajorMUD v1.11p game data files
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# The *-v1.11p.json files are one JSON object per line. Nothing gets decoded
+# up front: the first time a table is touched the file is memory-mapped and a
+# single hop over its newlines records the byte span, Number and Name of every
+# line. A record is only run through json when somebody actually asks for it,
+# and then it is cached.
+
+import json
+import mmap
+import os
+import re
+from collections import namedtuple
+
+from gameSnapshot import openSnapshot, snapshotIsFresh
+
+# table name -> data file
+TABLE_FILES = {
+    "monsters": "monsters-v1.11p.json",
+    "items": "items-v1.11p.json",
+    "spells": "spells-v1.11p.json",
+    "shops": "shops-v1.11p.json",
+    "classes": "classes-v1.11p.json",
+    "races": "races-v1.11p.json",
+}
+
+# every line starts with the Number and (almost always) the Name, so this is all
+# the index needs to see of it
+LINE_HEADER = re.compile(rb'\{"Number":(\d+)(?:,"Name":"((?:[^"\\]|\\.)*)")?')
+
+# cross references inside the data, e.g. "Item #119", "Shop(sell) #5", "Monster #486(10%)", "Room 1/2140"
+REFERENCE = re.compile(r'(Item|Monster|NPC|Spell|Shop(?:\((?:sell|nogen)\))?|Textblock) #(\d+)(?:\(([\d.]+)%\))?|Room (\d+)/(\d+)')
+
+# reference kind -> table it points into (Textblock and Room have no table)
+REFERENCE_TABLES = {
+    "Item": "items",
+    "Monster": "monsters",
+    "NPC": "monsters",
+    "Spell": "spells",
+    "Shop": "shops",
+    "Shop(sell)": "shops",
+    "Shop(nogen)": "shops",
+}
+
+# one resolved cross reference, record is None when there is no table for it
+# (or the number isn't in the data), for rooms number is "map/room"
+Reference = namedtuple("Reference", ["kind", "number", "percent", "record"])
+
+
+class GameTable(object):
+
+    def __init__(self, path):
+        self.path = path
+
+        # built by load() on first use
+        self.file = None
+        self.data = None
+        self.spans = None       # Number -> (start, end) byte span of the line
+        self.names = None       # lower case Name -> [Number, ...] in file order
+        self.loadedStat = None  # (size, mtime) of the file when it was loaded
+
+        # records that have been decoded so far
+        self.records = {}
+
+    def load(self):
+        if self.spans is not None:
+            return
+
+        self.file = open(self.path, "rb")
+        stat = os.fstat(self.file.fileno())
+        self.loadedStat = (stat.st_size, stat.st_mtime_ns)
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        spans = {}
+        names = {}
+        data = self.data
+        size = len(data)
+
+        # hop from newline to newline (memchr speed) and only look at line headers
+        start = 0
+        while start < size:
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = size
+
+            match = LINE_HEADER.match(data, start, end)
+            lineStart = start
+            start = end + 1
+            if match is None:
+                continue
+
+            number = int(match.group(1))
+            spans[number] = (lineStart, end)
+
+            rawName = match.group(2)
+            if rawName is not None:
+                name = self.decodeName(rawName).lower()
+                names.setdefault(name, []).append(number)
+
+        self.spans = spans
+        self.names = names
+
+    # True if the file was loaded and has been written to since
+    def isStale(self):
+        if self.loadedStat is None:
+            return False
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns) != self.loadedStat
+
+    # names almost never have escapes in them, only pay for json when they do
+    def decodeName(self, rawName):
+        if b"\\" in rawName:
+            return json.loads(b'"' + rawName + b'"')
+        return rawName.decode("utf-8")
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+        self.file = None
+        self.data = None
+        self.spans = None
+        self.names = None
+        self.loadedStat = None
+        self.records = {}
+
+    # record for a Number, or None
+    def get(self, number):
+        record = self.records.get(number)
+        if record is not None:
+            return record
+
+        self.load()
+        span = self.spans.get(number)
+        if span is None:
+            return None
+
+        record = json.loads(self.data[span[0]:span[1]])
+        self.records[number] = record
+        return record
+
+    # first record with this name (names are not unique, e.g. "giant rat"), or None
+    def byName(self, name):
+        self.load()
+        numbers = self.names.get(name.lower())
+        if numbers is None:
+            return None
+        return self.get(numbers[0])
+
+    # every record with this name
+    def allByName(self, name):
+        self.load()
+        return [self.get(number) for number in self.names.get(name.lower(), ())]
+
+    # Numbers in the table, in file order
+    def numbers(self):
+        self.load()
+        return list(self.spans)
+
+    def __contains__(self, number):
+        self.load()
+        return number in self.spans
+
+    def __len__(self):
+        self.load()
+        return len(self.spans)
+
+    def __iter__(self):
+        for number in self.numbers():
+            yield self.get(number)
+
+
+class GameDatabase(object):
+
+    # dataDir defaults to the directory this file lives in (where the json files ship)
+    def __init__(self, dataDir=None):
+        if dataDir is None:
+            dataDir = os.path.dirname(os.path.abspath(__file__))
+        self.dataDir = dataDir
+
+        # tables are created on first access, see table()
+        self.tables = {}
+
+        # columnar snapshots (gameSnapshot.py), opened on first access
+        self.snapshots = {}
+
+        # table name -> how many times reloadIfChanged() has reloaded it, so
+        # anything caching records (ItemResolver, MonsterMatcher) knows to drop them
+        self.versions = {}
+
+    def table(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            table = GameTable(os.path.join(self.dataDir, TABLE_FILES[name]))
+            self.tables[name] = table
+        return table
+
+    @property
+    def monsters(self):
+        return self.table("monsters")
+
+    @property
+    def items(self):
+        return self.table("items")
+
+    @property
+    def spells(self):
+        return self.table("spells")
+
+    @property
+    def shops(self):
+        return self.table("shops")
+
+    @property
+    def classes(self):
+        return self.table("classes")
+
+    @property
+    def races(self):
+        return self.table("races")
+
+    # memory-mapped columnar snapshot of a table, rebuilt first if the json changed
+    def snapshot(self, name):
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            snapshot = openSnapshot(os.path.join(self.dataDir, TABLE_FILES[name]))
+            self.snapshots[name] = snapshot
+        return snapshot
+
+    # forget the table and snapshot if the json changed since the snapshot was opened
+    # (or, for a table only ever read as json, since it was loaded), the next access
+    # loads the new data (True if that happened)
+    # The old snapshot isn't closed: ThreatTable, SpawnIndex, ... may still be reading
+    # it, and it is unmapped once the last of them lets go of it. The rebuilt .snap
+    # file replaces it on disk rather than overwriting it, so their view stays intact.
+    def reloadIfChanged(self, name):
+        snapshot = self.snapshots.get(name)
+        if snapshot is None:
+            table = self.tables.get(name)
+            if table is None or not table.isStale():
+                return False
+        elif snapshotIsFresh(snapshot, os.path.join(self.dataDir, TABLE_FILES[name])):
+            return False
+        else:
+            del self.snapshots[name]
+        table = self.tables.pop(name, None)
+        if table is not None:
+            table.close()
+        self.versions[name] = self.versions.get(name, 0) + 1
+        return True
+
+    # bumped every time reloadIfChanged() reloads the table
+    def version(self, name):
+        return self.versions.get(name, 0)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+        for snapshot in self.snapshots.values():
+            snapshot.close()
+        self.snapshots = {}
+
+    ####################################
+    #       CROSS REFERENCES           #
+    ####################################
+
+    # turn a reference string like "Shop #170, Monster #82(100%), Room 1/2140"
+    # into a list of Reference tuples
+    def resolveReferences(self, text):
+        refs = []
+        if not text:
+            return refs
+
+        for match in REFERENCE.finditer(text):
+            kind = match.group(1)
+            if kind is None:
+                refs.append(Reference("Room", match.group(4) + "/" + match.group(5), None, None))
+                continue
+
+            number = int(match.group(2))
+            percent = match.group(3)
+            if percent is not None:
+                percent = float(percent)
+
+            tableName = REFERENCE_TABLES.get(kind)
+            record = None
+            if tableName is not None:
+                record = self.table(tableName).get(number)
+
+            refs.append(Reference(kind, number, percent, record))
+
+        return refs
+
+    # item records a shop stocks, from its Item-0..Item-N columns (0 is an empty slot)
+    def shopItems(self, shop):
+        items = []
+        slot = 0
+        while ("Item-%d" % slot) in shop:
+            number = shop["Item-%d" % slot]
+            if number:
+                item = self.items.get(number)
+                if item is not None:
+                    items.append(item)
+            slot += 1
+        return items
+
+    # where a spell is learned from (usually "Item #N", sometimes "NPC #N")
+    def spellLearnedFrom(self, spell):
+        return self.resolveReferences(spell.get("Learned From"))
+
+    # what casts a spell (monsters, items, other spells, rooms, ...)
+    def spellCastedBy(self, spell):
+        return self.resolveReferences(spell.get("Casted By"))
+
+    # where an item can be had (shops, monster drops, rooms, ...)
+    def itemObtainedFrom(self, item):
+        return self.resolveReferences(item.get("Obtained From"))
@@ -0,0 +1,378 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Compact columnar binary snapshots of the v1.11p game data tables
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Every *-v1.11p.json row is a wide, flat object and most of its values are
+# small ints, so re-parsing the whole thing with json on every launch is a
+# waste. buildSnapshot() converts a table once into a column store:
+#
+#   - each numeric column becomes one typed array ('b', 'h', 'i', 'q' picked by
+#     value range, 'd' when any value is a float)
+#   - strings are interned into one table per file, columns hold indices into it
+#   - the repeated suffix columns (AttName-0..4, ClassRest-0..9, Item-0..19,
+#     Abil-0..9/AbilVal-0..9, ...) are folded into one fixed width column each,
+#     stored row major so row r, slot s lives at r * width + s
+#
+# File layout (native byte order, recorded in the metadata):
+#
+#   HEADER      magic, format version, crc32/size/mtime of the source json,
+#               row count, metadata length
+#   METADATA    json describing every column (kind, typecode, width, offset)
+#   COLUMNS     the arrays, each starting on an 8 byte boundary
+#   STRINGS     uint32 offsets followed by one utf-8 blob
+#
+# openSnapshot() memory-maps the file and hands out zero-copy memoryview casts
+# of the columns, so loading costs a header read. The source checksum is
+# compared first by size/mtime and then by crc32, and a stale snapshot is
+# rebuilt automatically.
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+
+SNAPSHOT_MAGIC = b"MMSNAP\x00\x01"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIIQqQI")
+SNAPSHOT_SUFFIX = ".snap"
+
+# "AttName-3" -> ("AttName", 3)
+FOLDED_KEY = re.compile(r"^(.*)-(\d+)$")
+
+# smallest integer typecode that holds a range, in order of preference
+INT_TYPECODES = (("b", -128, 127), ("h", -32768, 32767), ("i", -2147483648, 2147483647), ("q", -2**63, 2**63 - 1))
+
+# index stored in string columns for "this row has no such key"
+MISSING_STRING = -1
+
+
+# crc32 of a whole file, read in blocks
+def fileChecksum(path):
+    crc = 0
+    with open(path, "rb") as file:
+        block = file.read(1 << 20)
+        while block:
+            crc = zlib.crc32(block, crc)
+            block = file.read(1 << 20)
+    return crc
+
+
+def pickIntTypecode(values):
+    low = min(values) if values else 0
+    high = max(values) if values else 0
+    for typecode, minimum, maximum in INT_TYPECODES:
+        if minimum <= low and high <= maximum:
+            return typecode
+    raise ValueError("integer column out of range")
+
+
+####################################
+#       BUILD                      #
+####################################
+
+# convert one *-v1.11p.json file into a snapshot file
+def buildSnapshot(jsonPath, snapshotPath=None):
+    if snapshotPath is None:
+        snapshotPath = os.path.splitext(jsonPath)[0] + SNAPSHOT_SUFFIX
+
+    with open(jsonPath, "rb") as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+
+    # work out the columns, folding NAME-N keys into one column of width max(N)+1
+    # (keys keep the order they first show up in)
+    plain = []
+    folded = {}
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key in seen:
+                continue
+            seen.add(key)
+            match = FOLDED_KEY.match(key)
+            if match is None:
+                plain.append(key)
+            else:
+                name = match.group(1)
+                slot = int(match.group(2))
+                if name not in folded:
+                    plain.append(name)
+                    folded[name] = 0
+                folded[name] = max(folded[name], slot + 1)
+
+    strings = []
+    stringIndex = {}
+    columns = []
+    blobs = []
+    offset = 0
+
+    for name in plain:
+        width = folded.get(name, 1)
+        if name in folded:
+            keys = ["%s-%d" % (name, slot) for slot in range(width)]
+        else:
+            keys = [name]
+
+        cells = [row.get(key) for row in rows for key in keys]
+        present = [cell for cell in cells if cell is not None]
+        nullable = len(present) != len(cells)
+
+        if any(isinstance(cell, str) for cell in present):
+            kind = "str"
+            values = []
+            for cell in cells:
+                if cell is None:
+                    values.append(MISSING_STRING)
+                    continue
+                cell = str(cell)
+                index = stringIndex.get(cell)
+                if index is None:
+                    index = len(strings)
+                    stringIndex[cell] = index
+                    strings.append(cell)
+                values.append(index)
+            data = array(pickIntTypecode(values + [MISSING_STRING]), values)
+        elif nullable or any(isinstance(cell, float) for cell in present):
+            # floats, or ints with holes in them (NaN marks the holes)
+            kind = "int" if all(isinstance(cell, int) for cell in present) else "float"
+            data = array("d", [math.nan if cell is None else cell for cell in cells])
+        else:
+            kind = "int"
+            data = array(pickIntTypecode(cells), cells)
+
+        # keep every column on an 8 byte boundary
+        padding = -offset % 8
+        if padding:
+            blobs.append(b"\x00" * padding)
+            offset += padding
+
+        raw = data.tobytes()
+        columns.append({
+            "name": name,
+            "kind": kind,
+            "typecode": data.typecode,
+            "width": width,
+            "folded": name in folded,
+            "nullable": nullable,
+            "offset": offset,
+            "nbytes": len(raw),
+        })
+        blobs.append(raw)
+        offset += len(raw)
+
+    # string table: offsets then one blob
+    padding = -offset % 8
+    if padding:
+        blobs.append(b"\x00" * padding)
+        offset += padding
+    encoded = [text.encode("utf-8") for text in strings]
+    stringOffsets = array("I", [0])
+    for text in encoded:
+        stringOffsets.append(stringOffsets[-1] + len(text))
+    stringsOffset = offset
+    blobs.append(stringOffsets.tobytes())
+    blobs.append(b"".join(encoded))
+
+    meta = json.dumps({
+        "byteorder": sys.byteorder,
+        "itemsize": {typecode: array(typecode).itemsize for typecode in "bhiqdI"},
+        "source": os.path.basename(jsonPath),
+        "columns": columns,
+        "strings": {"count": len(strings), "offset": stringsOffset},
+    }).encode("utf-8")
+
+    stat = os.stat(jsonPath)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, fileChecksum(jsonPath),
+                                  stat.st_size, stat.st_mtime_ns, len(rows), len(meta))
+
+    # column offsets are relative to the (8 byte aligned) start of the data section
+    metaPadding = -(len(header) + len(meta)) % 8
+
+    # write next to the final name and swap it in, so a reader never sees half a file
+    tempPath = snapshotPath + ".tmp"
+    with open(tempPath, "wb") as file:
+        file.write(header)
+        file.write(meta)
+        file.write(b"\x00" * metaPadding)
+        for blob in blobs:
+            file.write(blob)
+    os.replace(tempPath, snapshotPath)
+
+    return snapshotPath
+
+
+####################################
+#       LOAD                       #
+####################################
+
+class GameSnapshot(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.sourceChecksum, self.sourceSize, self.sourceMtime,
+         self.rows, metaLength) = SNAPSHOT_HEADER.unpack_from(self.data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError("not a game data snapshot (or an old format): " + path)
+
+        metaStart = SNAPSHOT_HEADER.size
+        self.meta = json.loads(self.data[metaStart:metaStart + metaLength])
+        self.base = metaStart + metaLength
+        self.base += -self.base % 8
+
+        self.columnInfo = {}
+        for info in self.meta["columns"]:
+            self.columnInfo[info["name"]] = info
+        self.columnNames = [info["name"] for info in self.meta["columns"]]
+
+        # column name -> memoryview cast, created on first use
+        self.views = {}
+        self.view = memoryview(self.data)
+
+        # string table, decoded one entry at a time on demand
+        stringCount = self.meta["strings"]["count"]
+        stringsStart = self.base + self.meta["strings"]["offset"]
+        offsetsEnd = stringsStart + (stringCount + 1) * 4
+        self.stringOffsets = self.view[stringsStart:offsetsEnd].cast("I")
+        self.stringBlob = offsetsEnd
+        self.strings = [None] * stringCount
+
+        # Number -> row, built on first use
+        self.rowByNumber = None
+
+    # True when this snapshot was written on a machine that lays arrays out the same way
+    def isNative(self):
+        if self.meta["byteorder"] != sys.byteorder:
+            return False
+        for typecode, itemsize in self.meta["itemsize"].items():
+            if array(typecode).itemsize != itemsize:
+                return False
+        return True
+
+    def close(self):
+        if getattr(self, "views", None) is not None:
+            for view in self.views.values():
+                view.release()
+            self.views = None
+            self.stringOffsets.release()
+            self.view.release()
+        self.data.close()
+        self.file.close()
+
+    # the raw typed column (row major, width slots per row for folded columns)
+    def column(self, name):
+        view = self.views.get(name)
+        if view is None:
+            info = self.columnInfo[name]
+            start = self.base + info["offset"]
+            view = self.view[start:start + info["nbytes"]].cast(info["typecode"])
+            self.views[name] = view
+        return view
+
+    def width(self, name):
+        return self.columnInfo[name]["width"]
+
+    def string(self, index):
+        if index == MISSING_STRING:
+            return None
+        text = self.strings[index]
+        if text is None:
+            start = self.stringBlob + self.stringOffsets[index]
+            end = self.stringBlob + self.stringOffsets[index + 1]
+            text = str(self.view[start:end], "utf-8")
+            self.strings[index] = text
+        return text
+
+    # one cell, slot picks the entry of a folded column (e.g. value(r, "AttMin", 2))
+    def value(self, row, name, slot=0):
+        info = self.columnInfo[name]
+        raw = self.column(name)[row * info["width"] + slot]
+        kind = info["kind"]
+        if kind == "str":
+            return self.string(raw)
+        if info["nullable"] and raw != raw:
+            return None
+        if kind == "int" and info["typecode"] == "d":
+            return int(raw)
+        return raw
+
+    # a whole row folded back out into the same dict json.loads would give
+    def record(self, row):
+        record = {}
+        for info in self.meta["columns"]:
+            name = info["name"]
+            if info["folded"]:
+                for slot in range(info["width"]):
+                    value = self.value(row, name, slot)
+                    if value is not None:
+                        record["%s-%d" % (name, slot)] = value
+            else:
+                value = self.value(row, name)
+                if value is not None:
+                    record[name] = value
+        return record
+
+    # row index for a Number, or None
+    def rowForNumber(self, number):
+        if self.rowByNumber is None:
+            numbers = self.column("Number")
+            self.rowByNumber = {numbers[row]: row for row in range(self.rows)}
+        return self.rowByNumber.get(number)
+
+
+# is the snapshot still an exact copy of the json file
+def snapshotIsFresh(snapshot, jsonPath):
+    if not snapshot.isNative():
+        return False
+    stat = os.stat(jsonPath)
+    if stat.st_size != snapshot.sourceSize:
+        return False
+    if stat.st_mtime_ns == snapshot.sourceMtime:
+        return True
+    # touched but maybe not changed, the checksum decides
+    if fileChecksum(jsonPath) != snapshot.sourceChecksum:
+        return False
+    # unchanged, remember the new mtime so the next check doesn't read the whole file again
+    snapshot.sourceMtime = stat.st_mtime_ns
+    return True
+
+
+# open the snapshot for a json table, (re)building it first if it is missing or stale
+def openSnapshot(jsonPath, snapshotPath=None):
+    if snapshotPath is None:
+        snapshotPath = os.path.splitext(jsonPath)[0] + SNAPSHOT_SUFFIX
+
+    if os.path.exists(snapshotPath):
+        try:
+            snapshot = GameSnapshot(snapshotPath)
+        except (ValueError, struct.error):
+            snapshot = None
+        if snapshot is not None:
+            if snapshotIsFresh(snapshot, jsonPath):
+                return snapshot
+            snapshot.close()
+
+    buildSnapshot(jsonPath, snapshotPath)
+    return GameSnapshot(snapshotPath)
+
+
+# build step: python gameSnapshot.py [file.json ...] (defaults to every *-v1.11p.json here)
+if __name__ == "__main__":
+    paths = sys.argv[1:]
+    if not paths:
+        here = os.path.dirname(os.path.abspath(__file__))
+        paths = sorted(os.path.join(here, name) for name in os.listdir(here) if name.endswith("-v1.11p.json"))
+
+    for path in paths:
+        snapshotPath = buildSnapshot(path)
+        print("%s -> %s (%d -> %d bytes)" % (os.path.basename(path), os.path.basename(snapshotPath),
+                                             os.path.getsize(path), os.path.getsize(snapshotPath)))
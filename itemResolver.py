@@ -0,0 +1,146 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Resolve "You notice" tokens to currency and item records with quantities
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# "You notice 65 gold crowns, 2 padded helm, newbie manual here." gives tokens
+# with an optional quantity in front and a name that may or may not be plural.
+# The resolver splits the two, matches the name against a precomputed index of
+# currency names and item names (plain and plural) and memoises the result, so
+# the pickup decision is one bitmask test for cash and one set lookup for items.
+
+from collections import namedtuple
+from functools import lru_cache
+
+# currency index matches the "Currency" column of items-v1.11p.json
+COPPER = 0
+SILVER = 1
+GOLD = 2
+PLATINUM = 3
+RUNIC = 4
+
+# what one coin of each currency is worth in copper
+COIN_VALUE = (1, 10, 100, 10000, 1000000)
+
+# three coins weigh one unit of encumbrance
+COINS_PER_ENCUM = 3
+
+# singular and plural names of the coins as the game prints them
+CURRENCY_NAMES = {
+    "copper farthing": COPPER, "copper farthings": COPPER,
+    "silver noble": SILVER, "silver nobles": SILVER,
+    "gold crown": GOLD, "gold crowns": GOLD,
+    "platinum piece": PLATINUM, "platinum pieces": PLATINUM,
+    "runic coin": RUNIC, "runic coins": RUNIC,
+}
+
+# one "You notice" token, resolved
+#   quantity:  how many (1 when the game didn't print a number)
+#   name:      the name as printed, without the quantity
+#   kind:      "currency", "item" or "unknown"
+#   currency:  COPPER .. RUNIC for cash, otherwise None
+#   record:    items-v1.11p.json record for items (None for cash/unknown)
+#   encum:     encumbrance of one of them (None if unknown)
+#   price:     value of one of them in copper (None if unknown)
+#   key:       what pickup policy is checked against, the singular item name
+#              (lower case) or the currency bit
+Notice = namedtuple("Notice", ["quantity", "name", "kind", "currency", "record", "encum", "price", "key"])
+
+
+# plural spellings the game (and English) uses for a name
+def pluralForms(name):
+    forms = [name + "s"]
+    if name.endswith(("s", "x", "z", "ch", "sh")):
+        forms.append(name + "es")
+    if name.endswith("y") and name[-2:-1] not in "aeiou":
+        forms.append(name[:-1] + "ies")
+    return forms
+
+
+class ItemResolver(object):
+
+    # database is a gameDatabase.GameDatabase (optional, without one only cash resolves)
+    def __init__(self, database=None, cacheSize=4096):
+        self.database = database
+        self.itemIndex = None
+        self.itemsVersion = 0 if database is None else database.version("items")
+
+        # per instance memo, token -> Notice
+        self.resolve = lru_cache(maxsize=cacheSize)(self.resolveToken)
+
+    # lower case item name (and its plurals) -> (Number, singular name)
+    # exact names win over plurals of other items
+    def buildItemIndex(self):
+        index = {}
+        items = self.database.items
+        items.load()
+
+        for name, numbers in items.names.items():
+            index[name] = (numbers[0], name)
+
+        for name, numbers in items.names.items():
+            for plural in pluralForms(name):
+                if plural not in index:
+                    index[plural] = (numbers[0], name)
+
+        self.itemIndex = index
+
+    # uncached lookup, use resolve() instead
+    def resolveToken(self, token):
+        token = token.strip()
+
+        # split a leading quantity, "65 gold crowns" -> 65, "gold crowns"
+        quantity = 1
+        count, space, rest = token.partition(' ')
+        if space and count.isdigit():
+            quantity = int(count)
+            token = rest
+
+        name = token.lower()
+
+        currency = CURRENCY_NAMES.get(name)
+        if currency is not None:
+            return Notice(quantity, token, "currency", currency, None, 1.0 / COINS_PER_ENCUM, COIN_VALUE[currency], 1 << currency)
+
+        if self.database is not None:
+            if self.itemIndex is None:
+                self.buildItemIndex()
+            entry = self.itemIndex.get(name)
+            if entry is not None:
+                record = self.database.items.get(entry[0])
+                price = record["Price"] * COIN_VALUE[record["Currency"]]
+                return Notice(quantity, token, "item", None, record, record["Encum"], price, entry[1])
+
+        return Notice(quantity, token, "unknown", None, None, None, None, name)
+
+    # bitmask of the currencies to pick up, from the collect* flags
+    def currencyMask(self, copper, silver, gold, platinum, runic):
+        mask = 0
+        for bit, wanted in enumerate((copper, silver, gold, platinum, runic)):
+            if wanted:
+                mask |= 1 << bit
+        return mask
+
+    # should we pick this up: one bit test for cash, one set lookup for items
+    def wanted(self, notice, currencyMask, itemNames):
+        if notice.kind == "currency":
+            return bool(notice.key & currencyMask)
+        return notice.key in itemNames
+
+    # reload the items table if its file changed and forget everything resolved so far
+    # if it was reloaded since (by us or anyone else, GameDatabase.reloadIfChanged)
+    def refresh(self):
+        if self.database is None:
+            return
+        self.database.reloadIfChanged("items")
+        if self.database.version("items") != self.itemsVersion:
+            self.itemsVersion = self.database.version("items")
+            self.itemIndex = None
+            self.resolve.cache_clear()
+
+    def cacheInfo(self):
+        return self.resolve.cache_info()
+
+    def clearCache(self):
+        self.resolve.cache_clear()
@@ -0,0 +1,190 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Split the comma separated room lists ("Also here:", "You notice", "Obvious exits:") into tokens
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# The three room lists share one shape: a comma separated list that can wrap
+# over several lines and ends with a known suffix:
+#
+#   Also here: Shirley, Laverne, Violet, kobold thief, small acid slime, kobold
+#   thief, carrion beast.
+#   You notice 81 silver nobles, 210 copper farthings here.
+#   Obvious exits: closed door north, up
+#
+# The game wraps at a space, so a line break inside a token stands for one
+# space ("kobold" + "thief" is "kobold thief", not "koboldthief").
+#
+# add() only works out where the list sits in the line (by index, no copies)
+# and tokens() cuts it out once. Splitting it on ", " (and interning the
+# tokens) is memoised on that text, since the same room prints the same list
+# refresh after refresh: a one line list costs one slice and a cache lookup,
+# and every refresh of the same room hands out the same tuple of the same
+# interned strings. Wrapped lists keep their line pieces in a reused list and
+# are joined once, with the space the line break stood for, when the last
+# line arrives.
+#
+#   python listTokenizer.py       compares time, peak temporary memory and blocks kept per room refresh
+
+import sys
+from functools import lru_cache
+
+# what's left of a line once the newline (and trailing spaces) are gone
+WHITESPACE = " \r\n"
+
+# distinct lists remembered by splitList()
+SPLIT_CACHE_SIZE = 1024
+
+
+# a list's text (suffix already cut off) as a tuple of interned tokens
+@lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def splitList(text):
+    tokens = text.split(', ')
+
+    # the game puts exactly one space after each comma, anything else takes the slow path
+    if text.count(',') != len(tokens) - 1 or '  ' in text or ' ,' in text or text[:1] == ' ' or text[-1:] == ' ':
+        tokens = [token.strip(' ') for part in tokens for token in part.split(',')]
+        tokens = [token for token in tokens if token]
+
+    return tuple(map(sys.intern, tokens))
+
+
+class ListTokenizer(object):
+    __slots__ = ("suffix", "pending", "text", "start", "end")
+
+    # suffix: what the last line ends with ("." / " here."), None for lists that
+    #         instead carry on as long as a line ends with a ','
+    # (a list with a suffix also ends at any line ending in '.', so an odd sentence can't leave it open)
+    def __init__(self, suffix=None):
+        self.suffix = suffix
+        self.pending = []       # pieces of a wrapped list, reused
+
+        # the complete list is text[start:end] (suffix already cut off)
+        self.text = ""
+        self.start = 0
+        self.end = 0
+
+    # True while part of a wrapped list is waiting for its next line
+    def isPending(self):
+        return bool(self.pending)
+
+    def reset(self):
+        del self.pending[:]
+        self.text = ""
+        self.start = self.end = 0
+
+    # add a line, the list starts at line[start:] (after the "Also here: " prefix)
+    # returns True once the list is complete and tokens() can be read
+    def add(self, line, start=0):
+        end = len(line)
+        while end > start and line[end - 1] in WHITESPACE:
+            end -= 1
+
+        suffix = self.suffix
+        if suffix is None:
+            complete = end == start or line[end - 1] != ','
+        else:
+            complete = end > start and line[end - 1] == '.'
+
+        if not complete:
+            self.pending.append(line[start:end])
+            return False
+
+        if suffix:
+            end -= len(suffix) if line.endswith(suffix, start, end) else 1
+
+        pending = self.pending
+        if pending:
+            pending.append(line[start:end])
+            self.text = " ".join(pending)
+            self.start = 0
+            self.end = len(self.text)
+            del pending[:]
+        else:
+            self.text = line
+            self.start = start
+            self.end = end
+        return True
+
+    # the tokens of the complete list, interned, in order (a shared tuple, don't change it)
+    def tokens(self):
+        text = self.text
+        if self.start or self.end != len(text):
+            text = text[self.start:self.end]
+        return splitList(text)
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+# what processAlsoHere did before, kept here to compare against
+def concatenatingTokens(lines):
+    buffer = ""
+    for line in lines:
+        if 'Also here:' in line:
+            line = line[11:]
+        if '.' in line:
+            line = line.rstrip()
+            line = buffer + " " + line
+            line = line.replace('\n', '')
+            tokens = []
+            for x in line.split(','):
+                if x[0] == " ":
+                    x = x[1:]
+                if x[-1] == ".":
+                    x = x[:-1]
+                tokens.append(x)
+            return tokens
+        buffer += line
+    return []
+
+
+def tokenizerTokens(tokenizer, lines):
+    for line in lines:
+        if tokenizer.add(line, 11 if line.startswith('Also here: ') else 0):
+            return tokenizer.tokens()
+    return []
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    refreshes = {
+        "one line": ["Also here: Shirley, Laverne, Violet, kobold thief, small acid slime.\n"],
+        "wrapped": ["Also here: Shirley, Laverne, Violet, kobold thief, small acid slime, kobold\n",
+                    "thief, carrion beast.\n"],
+    }
+    tokenizer = ListTokenizer(".")
+    rounds = 100000
+    kept = 1000     # results held on to while counting the blocks they keep allocated
+
+    for name, lines in refreshes.items():
+        print("%s: old %s" % (name, concatenatingTokens(lines)))
+        print("%s: new %s" % (name, tokenizerTokens(tokenizer, lines)))
+
+        for label, run in (("concatenating", lambda: concatenatingTokens(lines)),
+                           ("tokenizer", lambda: tokenizerTokens(tokenizer, lines))):
+            run()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            run()
+            peak = tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+
+            results = [None] * kept
+            blocks = sys.getallocatedblocks()
+            for index in range(kept):
+                results[index] = run()
+            blocks = (sys.getallocatedblocks() - blocks) / kept
+            del results
+
+            began = time.perf_counter()
+            for _ in range(rounds):
+                run()
+            elapsed = time.perf_counter() - began
+
+            print("  %-14s %6.2f us/refresh  peak temporary %5d bytes  %5.1f blocks kept"
+                  % (label, elapsed / rounds * 1e6, peak, blocks))
@@ -0,0 +1,182 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Replay archives of session captures through majormudParser on every CPU core
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Batch mode for mining old captures offline:
+#
+#   python logReplay.py captures/*.log --workers 8 --out events.jsonl
+#
+# Every capture is cut into shards and the shards are spread over a process
+# pool, one majormudParser per shard. Big files are split too, but only right
+# before an HP prompt line: a prompt closes whatever block the parser has open
+# (a who-list, a look, a stat block or a wrapped "Also here:"/"You notice"
+# list, see majormudParser.process_line), so a shard starting at one parses the
+# same as it would have in the middle of the whole file.
+#
+# Each worker sends back the parser's events (in capture order) plus its line count and
+# time, the results are merged back in file/offset order and a lines/sec
+# figure is reported per worker process.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from gameDatabase import GameDatabase
+from majormudParser import majormudParser
+
+# shards smaller than this aren't worth a trip to another process
+MIN_SHARD_BYTES = 1 << 20
+
+# a line starting with this is a safe place to cut a capture
+SAFE_BOUNDARY = b"\n[HP="
+
+
+# (path, start, end) byte ranges covering a file, cut at safe boundaries only
+def shardFile(path, shardBytes):
+    size = os.path.getsize(path)
+    shards = []
+    start = 0
+
+    with open(path, "rb") as file:
+        while start < size:
+            target = start + shardBytes
+            if target >= size:
+                shards.append((path, start, size))
+                break
+
+            # read forward from the target until the next prompt line
+            file.seek(target)
+            window = file.read(64 * 1024)
+            cut = -1
+            while window:
+                found = window.find(SAFE_BOUNDARY)
+                if found != -1:
+                    cut = target + found + 1
+                    break
+                target += len(window) - len(SAFE_BOUNDARY)
+                file.seek(target)
+                window = file.read(64 * 1024)
+                if len(window) <= len(SAFE_BOUNDARY):
+                    break
+
+            if cut == -1:
+                shards.append((path, start, size))
+                break
+
+            shards.append((path, start, cut))
+            start = cut
+
+    return shards
+
+
+# every shard of every file, sized so each worker gets a few of them
+def planShards(paths, workers):
+    total = sum(os.path.getsize(path) for path in paths)
+    shardBytes = max(MIN_SHARD_BYTES, total // (workers * 4) + 1)
+
+    shards = []
+    for path in paths:
+        shards.extend(shardFile(path, shardBytes))
+    return shards
+
+
+# one read-only game database per worker process, opened by its first shard
+workerDatabase = None
+
+
+# subscribes to a parser's events and keeps them as plain dicts
+class EventCollector(object):
+
+    def __init__(self, parser):
+        self.events = []
+        parser.subscribeAll(self)
+
+    def __call__(self, event):
+        fields = event.asDict()
+
+        # resolved Also here / You notice entries carry whole records, keep the short form
+        if "entries" in fields:
+            fields["entries"] = [[match.kind, match.name] for match in fields["entries"]]
+        if "items" in fields:
+            fields["items"] = [[notice.quantity, notice.name, notice.kind] for notice in fields["items"]]
+
+        self.events.append(fields)
+
+
+# worker: parse one byte range of one capture
+def replayShard(shard):
+    path, start, end = shard
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    global workerDatabase
+    if workerDatabase is None:
+        workerDatabase = GameDatabase()
+
+    parser = majormudParser(database=workerDatabase)
+    collector = EventCollector(parser)
+
+    began = time.perf_counter()
+    parser.feed(data)
+    parser.flush()
+
+    return {
+        "path": path,
+        "start": start,
+        "pid": os.getpid(),
+        "lines": data.count(b"\n"),
+        "bytes": len(data),
+        "seconds": time.perf_counter() - began,
+        "events": collector.events,
+    }
+
+
+def replay(paths, workers=None):
+    workers = workers or os.cpu_count() or 1
+    shards = planShards(paths, workers)
+
+    began = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(replayShard, shards))
+    elapsed = time.perf_counter() - began
+
+    # pool.map keeps shard order, which is already file then offset order
+    perWorker = {}
+    for result in results:
+        stats = perWorker.setdefault(result["pid"], {"lines": 0, "bytes": 0, "seconds": 0.0, "shards": 0})
+        stats["lines"] += result["lines"]
+        stats["bytes"] += result["bytes"]
+        stats["seconds"] += result["seconds"]
+        stats["shards"] += 1
+
+    return results, perWorker, elapsed
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Replay capture files through the parser in parallel")
+    args.add_argument("captures", nargs="+")
+    args.add_argument("--workers", type=int, default=None)
+    args.add_argument("--out", default=None, help="write the merged events here as JSON lines")
+    args = args.parse_args()
+
+    results, perWorker, elapsed = replay(args.captures, args.workers)
+
+    if args.out:
+        with open(args.out, "w") as out:
+            for result in results:
+                for event in result["events"]:
+                    event["file"] = result["path"]
+                    out.write(json.dumps(event) + "\n")
+
+    totalLines = sum(result["lines"] for result in results)
+    print("shards: %d  workers: %d  lines: %d  wall: %.3f s  total: %.0f lines/s"
+          % (len(results), len(perWorker), totalLines, elapsed, totalLines / elapsed if elapsed else 0))
+    for pid, stats in sorted(perWorker.items()):
+        rate = stats["lines"] / stats["seconds"] if stats["seconds"] else 0
+        print("  worker %-7d shards %-4d lines %-10d %.0f lines/s" % (pid, stats["shards"], stats["lines"], rate))
@@ -6,16 +6,9 @@
 
 # TODOS:
 # ------
-# Parse Obvious exits, store them in a list similar to my "stuff" variable for items on the ground (you notice...)
-# Parse "Also here: " for players and monsters
-# Add a python class to store characters:
-#   can get class from 'who' along with estimating the level
-#   can get race and stats (if needed) from looking at them
-#   can get a detalied inventory list (if needed) from looking at them
-# Convert this into a python class/object that gets fed a stream (like that of telnet) and keeps track of state and updates data internally
-# Add JSON files to "known players", "items", "Monsters", etc. and load them on startup
+# Characters: estimate the level from the 'who' title, race and stats from looking at them
+# Add JSON files to "known players" and load them on startup
 #   e.g. auto collect money, certain items, flag some monsters as non-hostile, etc.
-# [SEPARATELY] figure out combat, path planning, exp/hr, round timing, etc.
 
 
 # DONE:
@@ -24,31 +17,93 @@
 # Parses parse the 'who' command for name, gang (if applicable) and alignment
 # Parses the current room, also trying to use the megamud parlance of "known room" vs "unknown" room
 # Parses "You notice XYZ here." for items in the room and stores them in a list
+# Loads the v1.11p items/monsters/spells/shops/classes/races JSON files on demand (gameDatabase.py)
+# Resolves "Also here: " to players and monsters, stripping the monster adjectives (monsterMatcher.py)
+# Precomputes threat/exp numbers for every monster against our character and skips the ones to avoid (monsterThreat.py)
+# Resolves "You notice" to cash and item records with quantity, encumbrance and price (itemResolver.py)
+# Hands rooms, who entries, look equipment, Also here, You notice and suggested commands to subscribers as events (parserEvents.py)
+# Parses Obvious exits and the movement command that led there, and builds a room graph from them (roomGraph.py)
+# Parses combat (engaged/off, hits, experience, the damage tally) and keeps per-round/exp-hr meters (combatTracker.py)
+# Parses the "stat" block and the "exp" line, and keeps a registry of players from who/look/stat/exp (characterRegistry.py)
+# Splits the wrapped "Also here", "You notice" and "Obvious exits" lists with one shared tokenizer (listTokenizer.py)
+# Strips telnet negotiation and ANSI colour codes from a live stream before parsing it (telnetFilter.py)
+# Parses the HP prompt and the party list into vitals and fires heal/rest/flee thresholds (vitalsTracker.py)
+# Attacks/picks up/reacts from declarative rules (triggers.json) compiled into one matcher, hot reloaded (triggerEngine.py)
+# Parses gossip/auction/telepath/gangpath/broadcast/say traffic into a searchable on-disk archive (commsArchive.py)
+# Checkpoints/restores the parser's session state, mid-block and mid-line, as a small versioned blob (parserCheckpoint.py)
+# Infers the combat round clock and sends suggested commands by priority, de-duplicated, to land in the next round (roundScheduler.py)
+# Gets fed a raw byte stream (like that of telnet) with feed() and assembles the lines itself, HP prompt included
+
+import re
+import time
+
+import parserCheckpoint
+from itemResolver import ItemResolver
+from listTokenizer import ListTokenizer
+from monsterMatcher import MonsterMatcher
+from parserEvents import (ALL_EVENTS, AlsoHere, CombatHit, CombatState, Command, Communication, DamageTally, ExperienceGained,
+                          ExpStatus, LookedAt, LookEquipment, ObviousExits, PartyMember, RoomChanged, StatBlock, Vitals,
+                          WhoEntry, YouNotice)
+from roomGraph import MOVEMENT_COMMANDS
+from parserStats import ParserProfiler
+from telnetFilter import TelnetFilter
+from triggerEngine import TriggerEngine
 
 class majormudParser(object):
     
-    def __init__(self):
+    # database is an optional (shared, read-only) gameDatabase.GameDatabase
+    # profile=True turns on per-handler timing (parserStats.py), see statsSnapshot()
+    # telnet=True strips telnet commands and ANSI codes from everything fed in (telnetFilter.py)
+    # triggers is a rules file path, a triggerEngine.RuleFile (shared, hot reloaded) or RuleSet, None for the defaults
+    def __init__(self, encoding="cp437", database=None, profile=False, telnet=False, triggers=None):
         # some constants
         self.BLANK_LINE = "\n"
+        self.HP_PROMPT_START = b"[HP="
+        self.HP_PROMPT_END = b"]:"
         self.CURRENTADVENTURERSBANNER = "         ===================\n"
+        self.DAMAGE_ENDINGS = (" damage!\n", " damage!")
+        self.WITH_OWNERS = ("its ", "his ", "her ", "their ")
+
+        # what follows the speaker's name on a line of channel traffic -> channel
+        self.COMMS_VERBS = ("gossips: ", "auctions: ", "telepaths: ", "gangpaths: ", "broadcasts: ", "says ")
+        self.COMMS_CHANNELS = {"gossips:": "gossip", "auctions:": "auction", "telepaths:": "telepath",
+                               "gangpaths:": "gangpath", "broadcasts:": "broadcast", "says": "say"}
+
+        # "Armour Class:   1/0" -> ("Armour Class", "1/0"), the columns of the stat block are 2+ spaces apart
+        self.STAT_FIELD = re.compile(r"([A-Z][A-Za-z/ ]*?):\s+(\S+(?: \S+)*)")
         self.KNOWN_ROOMS = ["Newhaven, Arena", "Newhaven, General Store", "Newhaven, Village Entrance", "Newhaven, Armour Shop", "Newhaven, Spell Shop"]
 
         # some variables for current status
         self.currentRoom = "NONE"
-        self.alsoHereList = []
-        self.youNoticeList = []
+        self.roomItems = []     # itemResolver.Notice for everything in the last "You notice"
+        self.roomOccupants = [] # monsterMatcher.Match for everything in the last "Also here"
 
         # variables for picking up cash
         self.collectCopper = True
         self.collectSilver = True
+        self.collectGold = True
         self.collectPlatinum = True
         self.collectRunic = True
 
-        # test variable to pick up items
-        self.pickUpItemList = ["padded vest"]
+        # game data (monsters, items, spells, shops, ...), loaded lazily
+        self.database = database
+
+        # what to attack, pick up or send when a line matches (triggerEngine.py), the cooldowns are per parser
+        self.triggers = TriggerEngine(triggers)
+        self.lineTriggers = self.triggers.rules.linePattern is not None
+
+        # edited rules and game data are looked for at most this often (seconds), from processPrompt
+        self.REFRESH_INTERVAL = 1.0
+        self.nextRefresh = 0.0
+
+        # resolves "You notice" tokens to cash/items with quantities, memoised per token
+        self.itemResolver = ItemResolver(database)
+
+        # resolves "Also here" tokens to players/monsters, memoised per token
+        self.monsterMatcher = MonsterMatcher(database)
 
-        # test variable for monsters
-        self.monsterList = ["carrion beast"]
+        # optional monsterThreat.ThreatTable, monsters it says to avoid are never attacked
+        self.threatTable = None
 
         # variables for current adventurers list
         self.currentAdventurersContinued = False
@@ -56,51 +111,289 @@ class majormudParser(object):
 
 
         # variables for looking at someone
+        self.lookingAt = None
         self.lookingContinued = False
         self.lookingBlankLineCount = 0
+        self.lookingEquipment = {}  # slot -> item seen so far in this look
 
         # variables for You notice...
         self.youNoticeContinued = False
-        self.youNoticeCompleted = False
-        self.youNoticeBuf = ""
+        self.youNoticeTokens = ListTokenizer(" here.")
+
+        # variables for Obvious exits: (and the movement that got us here)
+        self.exitsContinued = False
+        self.exitsTokens = ListTokenizer()
+        self.roomExits = ()
+        self.pendingMove = None
+        self.awaitingCommand = False
+
+        # variables for the stat block (Name: ... through Willpower: ...)
+        self.statContinued = False
+        self.statFields = {}
 
         # variables for Also here:
         self.alsoHereContinued = False
-        self.alsoHereBuf = ""
-        self.alsoHereCompleted = False
-        
+        self.alsoHereTokens = ListTokenizer(".")
+
+        # event type -> callbacks, see subscribe()
+        self.subscribers = {}
+
+        # dispatch table for process_line, first character -> ((prefix, handler name), ...)
+        self.dispatchTable = {
+            'A': (("Also here: ", "processAlsoHere"),),
+            'Y': (("You notice ", "processYouNotice"), ("You gain ", "processExperience")),
+            'O': (("Obvious exits: ", "processObviousExits"),),
+            'N': (("Name: ", "processStatBlock"),),
+            'E': (("Exp: ", "processExpStatus"),),
+            '[': (("[HP=", "processPrompt"), ("[ ", "processLookingAtPlayer")),
+            ' ': ((self.CURRENTADVENTURERSBANNER, "processCurrentAdventurers"), ("  ", "processPartyMember")),
+            '*': (("*Combat ", "processCombat"),),
+            '(': (("(Dmg:", "processDamageTally"),),
+        }
+
+        # handlers whose prefix isn't enough on its own, handler name -> text the line must also contain
+        self.DISPATCH_REQUIRES = {
+            "processLookingAtPlayer": " ]",
+            "processPartyMember": "[H:",
+        }
+
+        # handler name -> the flag it keeps set while its multi-line block is open
+        self.BLOCK_FLAGS = {
+            "processCurrentAdventurers": "currentAdventurersContinued",
+            "processLookingAtPlayer": "lookingContinued",
+            "processAlsoHere": "alsoHereContinued",
+            "processYouNotice": "youNoticeContinued",
+            "processObviousExits": "exitsContinued",
+            "processStatBlock": "statContinued",
+        }
+
+        # the handler that owns the currently open block (None if no block is open)
+        self.openBlock = None
+        self.openBlockFlag = None
+
+        # variables for the byte stream fed in from telnet (see feed())
+        self.encoding = encoding
+        self.feedBuf = bytearray()
+        self.feedAfterPrompt = False
+        self.telnetFilter = TelnetFilter() if telnet else None
+
+        # instrumentation, only wraps the handlers when asked for
+        self.profiler = None
+        if profile:
+            self.profiler = ParserProfiler(self)
+
 
     def process_line(self, line):
-        ####################################
-        #       DETERMINING ROOM           #
-        ####################################
-        if line.count(',') == 1 and len(line) <= 30 and line[0:4] != 'Also' and ord(line[0]) < 90:
-            self.processRoom(line)
+        # line rules see every line, blocks included, one regex pass for all of them
+        if self.lineTriggers:
+            self.processLineTriggers(line)
 
         ####################################
-        #        CURRENT ADVENTURERS       #
-        ####################################
-        if line == self.CURRENTADVENTURERSBANNER or self.currentAdventurersContinued:
-            self.processCurrentAdventurers(line)
-   
-        ####################################
-        #       LOOKING AT PLAYER          #
+        #       OPEN MULTI-LINE BLOCK      #
         ####################################
-        if (('[ ' in line and ' ]' in line) or self.lookingContinued):
-            self.processLookingAtPlayer(line)
+        # fast path: while a who-list, look, "Also here" or "You notice" block
+        # is open every line belongs to it, so skip classification entirely
+        # except a prompt: the block is over whether or not its end turned up
+        if self.openBlock is not None:
+            if not line.startswith('[HP='):
+                self.openBlock(line)
+                if not getattr(self, self.openBlockFlag):
+                    self.openBlock = None
+                return
+            self.closeOpenBlock()
 
         ####################################
-        #       Also here:                 #
+        #       CLASSIFY THE LINE ONCE     #
         ####################################
-        if 'Also here: ' in line or self.alsoHereContinued:
-            self.processAlsoHere(line)
+        handler = self.classifyLine(line)
+        if handler is None:
+            return
+
+        handler(line)
+
+        # remember the block if the handler left it open
+        flag = self.BLOCK_FLAGS.get(handler.__name__)
+        if flag is not None and getattr(self, flag):
+            self.openBlock = handler
+            self.openBlockFlag = flag
+
+    # a block cut short (missing blank line, disconnect mid-"who", ...) by a prompt:
+    # a stat block hands over what it has, the wrapped lists drop their pieces
+    def closeOpenBlock(self):
+        if self.openBlockFlag == "statContinued":
+            self.finishStatBlock()
+        if self.profiler is not None:
+            self.profiler.blockClosed(self.openBlock.__name__)
+        setattr(self, self.openBlockFlag, False)
+        self.openBlock = None
+        self.openBlockFlag = None
+
+        self.currentAdventurersBlankLineCount = 0
+        self.lookingBlankLineCount = 0
+        self.lookingEquipment = {}
+        for tokenizer in (self.alsoHereTokens, self.youNoticeTokens, self.exitsTokens):
+            tokenizer.reset()
+
+    ####################################
+    #       RAW BYTE STREAM            #
+    ####################################
+    # feed raw bytes straight off the socket, chunks can split lines anywhere
+    # complete lines are decoded and handed to process_line, a trailing partial
+    # line stays in feedBuf until the rest of it arrives
+    # the HP prompt (e.g. "[HP=49 (Resting) ]:") never gets a newline from the
+    # server so it is treated as a line of its own
+    def feed(self, data):
+        if self.telnetFilter is not None:
+            data = self.telnetFilter.filter(data)
+
+        buf = self.feedBuf
+        buf += data
+
+        # the prompt already ended its line, so a newline straight after
+        # it must not turn into an extra blank line
+        if self.feedAfterPrompt and buf:
+            if buf == b"\r":
+                return
+            self.feedAfterPrompt = False
+            if buf.startswith(b"\r\n"):
+                del buf[:2]
+            elif buf[0] == 10:
+                del buf[:1]
+
+        # every complete line in one decode, the partial line stays in feedBuf
+        newline = buf.rfind(b"\n")
+        if newline != -1:
+            text = buf[:newline].decode(self.encoding, "replace")
+            del buf[:newline + 1]
+
+            # split on \n only (splitlines would also break on \r, \x0c, \x1c, ...)
+            for line in text.split("\n"):
+
+                # telnet sends \r\n, the handlers expect a bare \n
+                if line.endswith("\r"):
+                    line = line[:-1]
+
+                # prompt: everything up to and including "]:" is a line of its own,
+                # a prompt with nothing after it has already ended its line
+                if line.startswith("[HP="):
+                    line = self.feedPrompts(line)
+                    if not line:
+                        continue
+
+                self.process_line(line + "\n")
+
+        # a prompt waiting for input, there won't be a newline after it
+        while buf.startswith(self.HP_PROMPT_START):
+            promptEnd = buf.find(self.HP_PROMPT_END)
+            if promptEnd == -1:
+                break
+            promptEnd += 2
+            self.process_line(buf[:promptEnd].decode(self.encoding, "replace"))
+            del buf[:promptEnd]
+            self.feedAfterPrompt = buf == b"" or buf == b"\r"
+
+    # hand the prompts at the start of a line to process_line, returns what's left of the line
+    def feedPrompts(self, line):
+        while line.startswith("[HP="):
+            promptEnd = line.find("]:")
+            if promptEnd == -1:
+                break
+            promptEnd += 2
+            self.process_line(line[:promptEnd])
+            line = line[promptEnd:]
+        return line
+
+    # same thing, for callers that think in chunks rather than bytes
+    feed_chunk = feed
+
+    # hand whatever is left in the byte buffer to the parser (e.g. on disconnect)
+    def flush(self):
+        if self.feedBuf:
+            line = str(self.feedBuf, self.encoding, "replace")
+            self.feedBuf.clear()
+            self.feedAfterPrompt = False
+            self.process_line(line)
+
+    # single pass classifier, returns the process* handler for a line (or None)
+    # the first character picks the only prefix test that can possibly match,
+    # so most lines cost one dict lookup and one startswith
+    def classifyLine(self, line):
+        if not line:
+            return None
+
+        # the line straight after a bare prompt is the echo of what was typed
+        if self.awaitingCommand:
+            self.awaitingCommand = False
+            if line.rstrip().lower() in MOVEMENT_COMMANDS:
+                return self.processCommand
+
+        first = line[0]
+        entries = self.dispatchTable.get(first)
+        if entries is not None:
+            for prefix, name in entries:
+                if line.startswith(prefix):
+                    # e.g. a "[ Name ]" look header also needs the closing bracket
+                    required = self.DISPATCH_REQUIRES.get(name)
+                    if required is None or required in line:
+                        return getattr(self, name)
+
+        # "... for 12 damage!" can start with anything (You, a player, The monster)
+        if line.endswith(self.DAMAGE_ENDINGS):
+            return self.processHit
+
+        # "Bloodrock gossips: ...", "Violet says (to you) ...", the speaker can be anyone
+        if 'A' <= first <= 'Z':
+            space = line.find(' ')
+            if space != -1 and line.startswith(self.COMMS_VERBS, space + 1):
+                return self.processCommunication
 
         ####################################
-        #       You notice                 #
+        #       DETERMINING ROOM           #
         ####################################
-        if 'You notice ' in line or self.youNoticeContinued:
-            self.processYouNotice(line)
+        # cheapest tests first, the comma count only runs on short lines
+        if len(line) <= 30 and first < 'Z' and line.count(',') == 1 and line[0:4] != 'Also':
+            return self.processRoom
 
+        return None
+
+
+    # per-handler call counts, timings and block lengths (None unless profile=True)
+    def statsSnapshot(self):
+        if self.profiler is None:
+            return None
+        return self.profiler.snapshot()
+
+    # session state as a versioned binary blob, and back (parserCheckpoint.py)
+    # restore into a parser built with the same options, e.g. telnet=True
+    def checkpoint(self):
+        return parserCheckpoint.checkpoint(self)
+
+    def restore(self, blob):
+        parserCheckpoint.restore(self, blob)
+        self.lineTriggers = self.triggers.rules.linePattern is not None
+
+    ####################################
+    #       EVENTS                     #
+    ####################################
+    # call callback(event) for every event of this type (see parserEvents.py)
+    def subscribe(self, eventType, callback):
+        self.subscribers.setdefault(eventType, []).append(callback)
+
+    def unsubscribe(self, eventType, callback):
+        callbacks = self.subscribers.get(eventType)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self.subscribers[eventType]
+
+    # subscribe one callback to every event type
+    def subscribeAll(self, callback):
+        for eventType in ALL_EVENTS:
+            self.subscribe(eventType, callback)
+
+    def emit(self, callbacks, event):
+        for callback in callbacks:
+            callback(event)
 
     # helper function to strip out gang names, character name, item slot, etc.
     def getValueBetweenDelims(self, text, start_delimiter, end_delimiter):
@@ -131,22 +424,27 @@ class majormudParser(object):
         room = line.strip()
         self.currentRoom = room
 
+        callbacks = self.subscribers.get(RoomChanged)
+        if callbacks:
+            self.emit(callbacks, RoomChanged(room, room in self.KNOWN_ROOMS))
+
     def processCurrentAdventurers(self, line): 
             # state to say we are in Current Adventurers
             self.currentAdventurersContinued = True
 
-            # if we hit both blank lines, we are done with the processing
-            if self.currentAdventurersBlankLineCount == 2:
-                self.currentAdventurersBlankLineCount = 0
-                self.currentAdventurersContinued = False
-
             # determine if we have a blank line/carriage return
             if line == self.BLANK_LINE:
                 self.currentAdventurersBlankLineCount += 1
 
+                # if we hit both blank lines, we are done with the processing
+                # (the line after it goes back through process_line's classifier)
+                if self.currentAdventurersBlankLineCount == 2:
+                    self.currentAdventurersBlankLineCount = 0
+                    self.currentAdventurersContinued = False
+
             # this is a don't care line for the "========" banner
             elif line == self.CURRENTADVENTURERSBANNER:
-                x = 1
+                pass
             elif self.currentAdventurersBlankLineCount == 1:
 
                 # ok now we have the data
@@ -161,7 +459,7 @@ class majormudParser(object):
                 # for [0], we need to strip out the characters
                 #alignmentName = toks[0].join()
                 alignmentName = "".join(toks[0])
-                alignment = alignmentName[1:9].replace(' ','')
+                alignment = alignmentName[0:9].replace(' ','')
                 
                 #if alignment == "":
                 #    print("ALIGNMENT: NEUTRAL")
@@ -172,18 +470,21 @@ class majormudParser(object):
                 #print("NAME: " + characterName)
 
 
-                # for [1], we split on 'of' for title and gang
+                # for [1], we split on '  of ' for title and gang (two spaces, titles
+                # like "Voice of God" and "Master of the Hit" have a plain ' of ' in them)
                 titleGang = "".join(toks[1])
-                if 'of' in titleGang:
-                    title = titleGang.split('of')[0].strip()
-                #    print("TITLE: " + title)
-                    gang = titleGang.split('of')[1].strip()
+                title, of, gang = titleGang.partition('  of ')
+                title = title.strip()
+                #print("TITLE: " + title)
+                if of:
+                    gang = gang.strip()
                 #    print("GANG: " + gang)
-                #    print("--------------------")
                 else:
-                    title = titleGang.split('of')[0].strip()
-                #    print("TITLE: " + title)
-                #    print("--------------------")
+                    gang = None
+
+                callbacks = self.subscribers.get(WhoEntry)
+                if callbacks:
+                    self.emit(callbacks, WhoEntry(alignment or "Neutral", characterName, title, gang))
  
     def processLookingAtPlayer(self, line):
 
@@ -206,6 +507,8 @@ class majormudParser(object):
             if '[ ' in line:
                 name = self.getValueBetweenDelims(line, '[ ', ' ]')
                 #print("LOOKING AT: " + name)
+                self.lookingAt = name
+                self.lookingEquipment = {}
 
             # blank line counter
             if line == self.BLANK_LINE:
@@ -216,6 +519,12 @@ class majormudParser(object):
                     self.lookingBlankLineCount = 0
                     #print("DONE LOOKING")
 
+                    # the whole equipment list, so whoever keeps it can drop what was taken off
+                    callbacks = self.subscribers.get(LookedAt)
+                    if callbacks:
+                        self.emit(callbacks, LookedAt(self.lookingAt, self.lookingEquipment))
+                    self.lookingEquipment = {}
+
             # else we don't have a blank line and should process it
             else:
 
@@ -229,126 +538,345 @@ class majormudParser(object):
                     #print("SLOT: " + slot)
                     item = line.split('(')[0].strip()
                     #print("ITEM: " + item)
+                    self.lookingEquipment[slot] = item
 
+                    callbacks = self.subscribers.get(LookEquipment)
+                    if callbacks:
+                        self.emit(callbacks, LookEquipment(self.lookingAt, slot, item))
 
                     #TODO: Build a character and add equipped items to the slots?
     
     def processAlsoHere(self, line):
-        
-        # chop off Also here if this is the first line
-        if 'Also here:' in line:
-                line = line[11:]
-
-        # if we have a '.', we've ended
-        if '.' in line:
-            line = line.rstrip()
-
-            # rebuild the line with all values, strip whitespace/newlines
-            line = self.alsoHereBuf + " " + line
-            line = line.replace('\n','')
-
-            # tokenize on ','
-            toks = line.split(',')
-
-            # iterate over the tokens
-            for x in toks:
-                # get rid of leading whitespace if it exists
-                if x[0] == " ":
-                    x = x[1:]
-                # get rid of '.' if it is there
-                if x[-1] == ".":
-                    x = x[:-1]
-
-                # add item to the list
-                self.alsoHereList.append(x)
-
-            # zero out the buffer and set flags for "done processing"
-            self.alsoHereBuf = ""
-            self.alsoHereCompleted = True
-            self.alsoHereContinued = False
-        else:
-                # we need to buffer
-                self.alsoHereBuf += line
-                self.alsoHereContinued = True
 
-        if self.alsoHereCompleted and len(self.alsoHereList) > 0:
-            #print("Also here stuff: " + str(self.alsoHereList))
+        # Also here: Shirley, Laverne, Violet, kobold thief, small acid slime, kobold
+        # thief, carrion beast.
+        # the list can wrap, listTokenizer.py puts it back together and splits it
 
+        # chop off Also here if this is the first line
+        start = 11 if line.startswith('Also here: ') else 0
 
-            # TODO: ADD LOGIC TO HANDLE THIS LIST - attack monsters, players, etc.
+        # keep buffering until the line ending in '.'
+        if not self.alsoHereTokens.add(line, start):
+            self.alsoHereContinued = True
+            return
+        self.alsoHereContinued = False
 
-            # example, iterate through the list:
-            for x in self.alsoHereList:
-                
-                # TODO:
-                # get rid of the annoying adjectives added to the monsters:
-                # small, nasty, fierce, angry, thin, fat, short
-                # Maybe do this in the processing above to save time?
+        self.roomOccupants = []
+        commandCallbacks = self.subscribers.get(Command)
+        monsterRules = self.triggers.rules.monsters
+        candidates = []
+        for x in self.alsoHereTokens.tokens():
+
+            # players come back as players, monsters lose their adjectives
+            # (small, nasty, fierce, ...) and get their record if we have a database
+            match = self.monsterMatcher.match(x)
+            self.roomOccupants.append(match)
+
+            if match.kind == "monster" and commandCallbacks:
+                rules = monsterRules.get(match.name)
+                if rules is None:
+                    continue
+                if self.threatTable is not None and match.record is not None and self.threatTable.avoid(match.record["Number"]):
+                    continue
+                for rule in rules:
+                    candidates.append((rule, x, match.name))
+
+        # by priority, minus the ones cooling down
+        if candidates:
+            for command, rule, x in self.triggers.commands(candidates):
+                self.emit(commandCallbacks, Command(command, rule.action, x))
+
+        callbacks = self.subscribers.get(AlsoHere)
+        if callbacks and self.roomOccupants:
+            self.emit(callbacks, AlsoHere(self.roomOccupants))
 
-                if x in self.monsterList:
-                    print("Ok, monster " + x + " is here. I should have the program respond with: {ATTACK_TYPE} " + x)
+    def processYouNotice(self, line):
 
+        # You notice 81 silver nobles, 210 copper farthings here.
 
+        # chop off 'You notice ' if this is the first line
+        start = 11 if line.startswith('You notice ') else 0
 
-            
-            # zero out our list
-            self.alsoHereList = []
+        # keep buffering until the line ending in ' here.'
+        if not self.youNoticeTokens.add(line, start):
+            self.youNoticeContinued = True
+            return
+        self.youNoticeContinued = False
 
-    def processYouNotice(self, line):
-        
-        # chop off 'You notice ' if this is the first line
-        if 'You notice ' in line:
-                line = line[11:]
-
-        # if we have a '.', we've ended
-        if '.' in line:
-            line = line.rstrip()
-
-            # rebuild the line with all values, strip whitespace/newlines
-            line = self.youNoticeBuf + " " + line
-            line = line.replace('\n','')
-
-            # tokenize on ','
-            toks = line.split(',')
-
-            # iterate over the tokens
-            for x in toks:
-                # get rid of leading whitespace if it exists
-                if x[0] == " ":
-                    x = x[1:]
-                # get rid of "here." ending characters
-                if ' here.' in x:
-                    x = x[:-6]
-
-                # add item to the list
-                self.youNoticeList.append(x)
-
-            # zero out the buffer and set flags for "done processing"
-            self.youNoticeBuf = ""
-            self.youNoticeCompleted = True
-            self.youNoticeContinued = False
+        # cash by the collect* flags, items by the item rules
+        currencyMask = self.itemResolver.currencyMask(self.collectCopper, self.collectSilver, self.collectGold,
+                                                      self.collectPlatinum, self.collectRunic)
+        self.roomItems = []
+        commandCallbacks = self.subscribers.get(Command)
+        itemRules = self.triggers.rules.items
+        candidates = []
+        for x in self.youNoticeTokens.tokens():
+
+            # quantity + currency/item record (with Encum and Price), memoised per token
+            notice = self.itemResolver.resolve(x)
+            self.roomItems.append(notice)
+
+            if commandCallbacks and self.itemResolver.wanted(notice, currencyMask, itemRules):
+                if notice.kind == "currency":
+                    self.emit(commandCallbacks, Command("g " + x, "get", x))
+                else:
+                    for rule in itemRules[notice.key]:
+                        candidates.append((rule, x, notice.key))
+
+        if candidates:
+            for command, rule, x in self.triggers.commands(candidates):
+                self.emit(commandCallbacks, Command(command, rule.action, x))
+
+        callbacks = self.subscribers.get(YouNotice)
+        if callbacks and self.roomItems:
+            self.emit(callbacks, YouNotice(self.roomItems))
+
+    def processPrompt(self, line):
+
+        # [HP=49 (Resting) ]:e   <- what follows the prompt is what was typed
+        # (when fed raw bytes the prompt arrives on its own and the echo is the next line)
+
+        # a new prompt means whatever move we were waiting on didn't show us a room
+        self.pendingMove = None
+
+        # pick up edited rules and game data, at most once every REFRESH_INTERVAL
+        # (prompts come several times a round, the files almost never change)
+        now = time.monotonic()
+        if now >= self.nextRefresh:
+            self.nextRefresh = now + self.REFRESH_INTERVAL
+            self.triggers.refresh()
+            self.lineTriggers = self.triggers.rules.linePattern is not None
+            self.itemResolver.refresh()
+            self.monsterMatcher.refresh()
+
+        end = line.find(']:')
+
+        # [HP=49 (Resting) ]:  [HP=39]:  [HP=31/MA=12]:
+        callbacks = self.subscribers.get(Vitals)
+        if callbacks and end != -1:
+            stamp = time.perf_counter()
+            body = line[4:end]
+            hp, _, mana = body.split(' ', 1)[0].partition('/MA=')
+            state = None
+            if '(' in body:
+                state = body[body.find('(') + 1:body.find(')')]
+            if hp.isdigit():
+                self.emit(callbacks, Vitals(int(hp), int(mana) if mana.isdigit() else None, state, stamp))
+
+        command = line[end + 2:].strip()
+        if command.startswith('(Dmg:'):
+            self.processDamageTally(command)
+        elif command:
+            self.processCommand(command)
         else:
-                # we need to buffer
-                self.youNoticeBuf += line
-                self.youNoticeContinued = True
+            self.awaitingCommand = True
 
-        if self.youNoticeCompleted and len(self.youNoticeList) > 0:
-            #print("You notice stuff: " + str(self.youNoticeList))
+    def processCommand(self, line):
 
+        # only movement matters for now, it tells us which exit the next room is behind
+        direction = MOVEMENT_COMMANDS.get(line.strip().lower())
+        if direction is not None:
+            self.pendingMove = direction
 
-            # TODO: ADD LOGIC TO HANDLE THIS LIST - pick up items?
+    def processObviousExits(self, line):
 
-            # Example to pick up items/cash
-            for x in self.youNoticeList:
+        # Obvious exits: north, east, west, down
+        # Obvious exits: closed door north, up
+        # long lists wrap, a line ending in ',' means there is more to come
 
-                if 'copper farthing' in x and self.collectCopper:
-                    print("Ok, I should have the program respond with: g " + x)
+        # chop off Obvious exits if this is the first line
+        start = 15 if line.startswith('Obvious exits: ') else 0
 
-                if 'silver noble' in x and self.collectSilver:
-                    print("Ok, I should have the program respond with: g " + x)
+        if not self.exitsTokens.add(line, start):
+            self.exitsContinued = True
+            return
+        self.exitsContinued = False
 
-                if x in self.pickUpItemList:
-                    print("Ok, the program should respond with: g " + x)
+        exits = []
+        closed = []
+        for x in self.exitsTokens.tokens():
+            words = x.split()
 
-            # zero out our list
-            self.youNoticeList = []
\ No newline at end of file
+            # the direction is the last word, anything before it is a door/gate description
+            direction = words[-1]
+            exits.append(direction)
+            if words[0] == "closed":
+                closed.append(direction)
+
+        self.roomExits = tuple(exits)
+        moved = self.pendingMove
+        self.pendingMove = None
+
+        callbacks = self.subscribers.get(ObviousExits)
+        if callbacks:
+            self.emit(callbacks, ObviousExits(self.currentRoom, self.roomExits, tuple(closed), moved))
+
+    def processCombat(self, line):
+
+        # *Combat Engaged*
+        # *Combat Off*
+        if line.startswith('*Combat Engaged*'):
+            engaged = True
+        elif line.startswith('*Combat Off*'):
+            engaged = False
+        else:
+            return
+
+        callbacks = self.subscribers.get(CombatState)
+        if callbacks:
+            self.emit(callbacks, CombatState(engaged))
+
+    def processHit(self, line):
+
+        # Laverne slams kobold thief for 12 damage!
+        # Shirley critically slashes small acid slime for 25 damage!
+        # The nasty thug smashes you for 10 damage!
+        callbacks = self.subscribers.get(CombatHit)
+        if not callbacks:
+            return
+
+        head, _, amount = line.rstrip()[:-8].rpartition(' for ')
+        if not head or not amount.isdigit():
+            return
+
+        # "The small filthbug rips Laverne with its claws", what it hit with isn't the target
+        clause = head.find(' with ')
+        if clause != -1 and head.startswith(self.WITH_OWNERS, clause + 6):
+            head = head[:clause]
+
+        if head.startswith('The '):
+            # a monster: its name can be several words, but what it hits is you or a player (one word)
+            attacker, _, target = head[4:].rpartition(' ')
+            attacker, _, verb = attacker.rpartition(' ')
+            critical = attacker.endswith(' critically')
+            if critical:
+                attacker = attacker[:-11]
+        else:
+            # us or a player (one word), the target is whatever is left
+            attacker, _, rest = head.partition(' ')
+            verb, _, target = rest.partition(' ')
+            critical = verb == 'critically'
+            if critical:
+                verb, _, target = target.partition(' ')
+
+        if attacker and verb and target:
+            self.emit(callbacks, CombatHit(attacker, verb, target, int(amount), critical))
+
+    def processExperience(self, line):
+
+        # You gain 3 experience.
+        amount = line[9:].split(' ', 1)[0]
+        callbacks = self.subscribers.get(ExperienceGained)
+        if callbacks and amount.isdigit():
+            self.emit(callbacks, ExperienceGained(int(amount)))
+
+    def processDamageTally(self, line):
+
+        # (Dmg:2 Tot:9)   <- can also come straight after the prompt, see processPrompt
+        callbacks = self.subscribers.get(DamageTally)
+        if not callbacks:
+            return
+
+        damage = self.getValueBetweenDelims(line, '(Dmg:', ' ')
+        total = self.getValueBetweenDelims(line, 'Tot:', ')')
+        if damage is not None and total is not None and damage.isdigit() and total.isdigit():
+            self.emit(callbacks, DamageTally(int(damage), int(total)))
+
+    def processStatBlock(self, line):
+
+        # Name: Snake Plant                      Lives/CP:      9/2
+        # Race: Dwarf       Exp: 96              Perception:     45
+        # ...
+        # Willpower: 60     Charm:   40          MagicRes:       65   <- always the last line
+
+        self.statContinued = True
+        for name, value in self.STAT_FIELD.findall(line):
+            self.statFields[name] = value
+
+        if line.startswith('Willpower:'):
+            self.statContinued = False
+            self.finishStatBlock()
+
+    def finishStatBlock(self):
+        fields = self.statFields
+        self.statFields = {}
+
+        callbacks = self.subscribers.get(StatBlock)
+        if callbacks and fields:
+            self.emit(callbacks, StatBlock(fields))
+
+    def processExpStatus(self, line):
+
+        # Exp: 96 Level: 1 Exp needed for next level: 2404 (2500) [3%]
+        callbacks = self.subscribers.get(ExpStatus)
+        if not callbacks:
+            return
+
+        words = line.split()
+        try:
+            exp = int(words[1])
+            level = int(words[3])
+            needed = int(words[9])
+            nextLevel = int(words[10].strip('()'))
+            percent = int(words[11].strip('[%]'))
+        except (IndexError, ValueError):
+            return
+
+        self.emit(callbacks, ExpStatus(exp, level, needed, nextLevel, percent))
+
+    def processPartyMember(self, line):
+
+        #   Violet Plant                   (Priest)     [M:100%] [H:100%]   - Frontrank
+        #   Snake Plant                    (Warrior)             [H:100%] R - Frontrank
+        callbacks = self.subscribers.get(PartyMember)
+        if not callbacks:
+            return
+        stamp = time.perf_counter()
+
+        paren = line.find('(')
+        close = line.find(')', paren)
+        if paren == -1 or close == -1:
+            return
+
+        name = line[:paren].strip()
+        className = line[paren + 1:close]
+        mana = self.getValueBetweenDelims(line, '[M:', '%]')
+        health = self.getValueBetweenDelims(line, '[H:', '%]')
+        if health is None or not health.isdigit():
+            return
+
+        # what's after the health is "R - Frontrank" or "  - Frontrank"
+        status, _, rank = line[line.find('%]', line.find('[H:')) + 2:].partition('-')
+        self.emit(callbacks, PartyMember(name, className, int(mana) if mana and mana.isdigit() else None, int(health),
+                                         status.strip() == 'R', rank.strip(), stamp))
+
+    def processCommunication(self, line):
+
+        # Bloodrock gossips: sun robes added to gear shop in naz gold and platinum
+        # Violet telepaths: der
+        # Violet says (to you) "{ok}"
+        callbacks = self.subscribers.get(Communication)
+        if not callbacks:
+            return
+
+        space = line.find(' ')
+        verb, _, text = line[space + 1:].rstrip('\r\n').partition(' ')
+        target = None
+        if verb == 'says':
+            if text.startswith('(to '):
+                close = text.find(')')
+                target = text[4:close]
+                text = text[close + 1:].lstrip()
+            if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+                text = text[1:-1]
+
+        self.emit(callbacks, Communication(self.COMMS_CHANNELS[verb], line[:space], text, target))
+
+    def processLineTriggers(self, line):
+
+        # line rules (triggerEngine.py), all of them in one regex pass
+        commandCallbacks = self.subscribers.get(Command)
+        if not commandCallbacks:
+            return
+        for command, rule, match in self.triggers.lineCommands(line):
+            self.emit(commandCallbacks, Command(command, rule.action, match))
@@ -0,0 +1,93 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Resolve "Also here:" tokens to players and monster records
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# The game sticks a random adjective in front of monster names ("small acid
+# slime", "fierce orc rogue", "short kobold thief"), so the token has to be
+# normalised before it can be looked up. Real names win though: "large yeti"
+# and "small gibbering horror" are monsters in their own right, so the
+# adjective is only dropped when the full token isn't a known monster.
+#
+# A room refresh repeats the same handful of tokens over and over, so every
+# token is memoised (LRU) and the second time it shows up it costs one dict hit.
+
+from collections import namedtuple
+from functools import lru_cache
+
+# the adjectives the game puts in front of monster names
+MONSTER_ADJECTIVES = frozenset(["small", "nasty", "fierce", "angry", "thin", "fat", "short", "big", "large", "tall"])
+
+# what an "Also here" token turned out to be
+#   kind:   "player", "monster" or "unknown"
+#   name:   player name, or the normalised (lower case, adjective free) monster name
+#   record: the monsters-v1.11p.json record (None for players, or without a database)
+Match = namedtuple("Match", ["kind", "name", "record"])
+
+
+class MonsterMatcher(object):
+
+    # database is a gameDatabase.GameDatabase (optional, without one monsters are
+    # only normalised, never resolved to records)
+    def __init__(self, database=None, cacheSize=4096):
+        self.database = database
+        self.names = None
+        self.monstersVersion = 0 if database is None else database.version("monsters")
+
+        # per instance memo, token -> Match
+        self.match = lru_cache(maxsize=cacheSize)(self.resolve)
+
+    # name index of the monsters table (lower case name -> [Number, ...])
+    def monsterNames(self):
+        if self.names is None:
+            monsters = self.database.monsters
+            monsters.load()
+            self.names = monsters.names
+        return self.names
+
+    # uncached lookup, use match() instead
+    def resolve(self, token):
+
+        # players (and named NPCs like Betram) are capitalised, monsters aren't
+        if token[:1].isupper():
+            return Match("player", token, None)
+
+        name = token.lower()
+
+        if self.database is None:
+            first, space, rest = name.partition(' ')
+            if space and first in MONSTER_ADJECTIVES:
+                name = rest
+            return Match("monster", name, None)
+
+        names = self.monsterNames()
+        numbers = names.get(name)
+        if numbers is None:
+            first, space, rest = name.partition(' ')
+            if space and first in MONSTER_ADJECTIVES:
+                numbers = names.get(rest)
+                if numbers is not None:
+                    name = rest
+
+        if numbers is None:
+            return Match("unknown", name, None)
+
+        return Match("monster", name, self.database.monsters.get(numbers[0]))
+
+    # reload the monsters table if its file changed and forget everything matched so far
+    # if it was reloaded since (by us or anyone else, GameDatabase.reloadIfChanged)
+    def refresh(self):
+        if self.database is None:
+            return
+        self.database.reloadIfChanged("monsters")
+        if self.database.version("monsters") != self.monstersVersion:
+            self.monstersVersion = self.database.version("monsters")
+            self.names = None
+            self.match.cache_clear()
+
+    def cacheInfo(self):
+        return self.match.cache_info()
+
+    def clearCache(self):
+        self.match.cache_clear()
@@ -0,0 +1,200 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Precomputed threat/reward numbers for every monster against our character (NumPy)
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Every monster row has up to five attacks (AttType/AttAcc/AttTrue%/AttMin/
+# AttMax/AttEnergy-0..4) plus HP, ArmourClass, DamageResist and EXP. Working
+# out "how much will this hurt and how long will it take" per encounter is a
+# pile of python loops, so ThreatTable does it for all 1101 monsters at once
+# with NumPy, straight off the columnar snapshot (gameSnapshot.py), and keeps
+# the results as arrays indexed by snapshot row:
+#
+#   damagePerRound    what the monster is expected to do to us each round
+#   expPerHP          EXP * ExpMulti / HP
+#   roundsToKill      rounds we need to kill it
+#   damageToKill      what we expect to take while doing that
+#   expPerRound       exp per round spent on it
+#
+# setCharacter() recomputes everything in one batched pass (call it whenever
+# AC/DR/HP/weapon change), and threat(number) / avoid(number) are a dict hit
+# and a few array reads, cheap enough for every "Also here" refresh. Attached
+# to a parser, the table is the one the parser checks before attacking, and
+# every "stat" block updates armour class, damage resist and max hits (and
+# recomputes, if any of them changed). Accuracy and weapon damage aren't in
+# the stat block, the first setCharacter() supplies those.
+#
+# The formulas are approximations of the game's, good enough for ranking:
+#   hit chance        accuracy / (accuracy + armour class), clamped to [5%, 99%]
+#   damage per hit    mean of max(0, uniform(min, max) - damage resist)
+#   swings per round  Energy / expected AttEnergy of the chosen attack
+# Only physical attacks (AttType 1) count, spell attacks (2) go through
+# AttHitSpell and robbing (3) does no damage.
+#
+#   table = ThreatTable(database)
+#   table.setCharacter(CharacterStats(armourClass=20, damageResist=2, hitPoints=49, accuracy=40,
+#                                     minDamage=2, maxDamage=9))
+#   table.threat(14)    # guardsman
+#   table.attach(parser)
+
+from collections import namedtuple
+
+from characterRegistry import numberPair
+from parserEvents import StatBlock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ATTACK_PHYSICAL = 1
+
+MIN_HIT_CHANCE = 0.05
+MAX_HIT_CHANCE = 0.99
+
+# what we bring to a fight, swings is attacks per round
+CharacterStats = namedtuple("CharacterStats", ["armourClass", "damageResist", "hitPoints", "accuracy",
+                                               "minDamage", "maxDamage", "swings"])
+CharacterStats.__new__.__defaults__ = (1,)
+
+# one monster's numbers against the current character
+Threat = namedtuple("Threat", ["number", "name", "damagePerRound", "expPerHP", "roundsToKill", "damageToKill",
+                               "expPerRound"])
+
+
+# chance to hit, element-wise
+def hitChance(accuracy, armourClass):
+    accuracy = numpy.asarray(accuracy, dtype=numpy.float64)
+    total = accuracy + armourClass
+    chance = numpy.divide(accuracy, total, out=numpy.ones_like(total), where=total > 0)
+    return numpy.clip(chance, MIN_HIT_CHANCE, MAX_HIT_CHANCE)
+
+
+# mean of max(0, uniform(low, high) - resist), element-wise
+def damageAfterResist(low, high, resist):
+    low, high, resist = numpy.broadcast_arrays(*(numpy.asarray(value, dtype=numpy.float64) for value in (low, high, resist)))
+    high = numpy.maximum(high, low)
+    spread = high - low
+
+    # resist below the whole range: just shifts the mean, above it: nothing gets through,
+    # in between: only the part of the range above resist counts
+    through = numpy.maximum(high - resist, 0.0)
+    partial = numpy.divide(through * through, 2.0 * spread, out=numpy.zeros_like(spread), where=spread > 0)
+    return numpy.where(resist <= low, (low + high) / 2.0 - resist, partial)
+
+
+class ThreatTable(object):
+
+    def __init__(self, database, character=None):
+        if numpy is None:
+            raise ImportError("monsterThreat needs numpy (pip install numpy)")
+
+        snapshot = database.snapshot("monsters")
+        self.snapshot = snapshot
+        self.rows = snapshot.rows
+
+        def column(name):
+            values = numpy.array(snapshot.column(name), dtype=numpy.float64)
+            width = snapshot.width(name)
+            return values.reshape(self.rows, width) if width > 1 else values
+
+        self.numbers = numpy.array(snapshot.column("Number"), dtype=numpy.int64)
+        self.hp = numpy.maximum(column("HP"), 1.0)
+        self.armourClass = column("ArmourClass")
+        self.damageResist = column("DamageResist")
+        self.exp = column("EXP") * numpy.maximum(column("ExpMulti"), 1.0)
+        self.energy = column("Energy")
+        self.inGame = column("In Game") > 0
+
+        # attacks, rows x 5
+        self.attackPhysical = column("AttType") == ATTACK_PHYSICAL
+        self.attackAccuracy = column("AttAcc")
+        self.attackChance = numpy.nan_to_num(column("AttTrue%")) / 100.0
+        self.attackMin = column("AttMin")
+        self.attackMax = column("AttMax")
+        self.attackEnergy = column("AttEnergy")
+
+        # Number -> row, the O(1) part of every lookup
+        self.rowByNumber = {int(number): row for row, number in enumerate(self.numbers)}
+
+        # swings per round doesn't depend on us, work it out once
+        expectedEnergy = (self.attackChance * self.attackEnergy).sum(axis=1)
+        self.swings = numpy.divide(self.energy, expectedEnergy, out=numpy.zeros(self.rows), where=expectedEnergy > 0)
+
+        self.expPerHP = self.exp / self.hp
+
+        self.character = None
+        self.damagePerRound = None
+        self.roundsToKill = None
+        self.damageToKill = None
+        self.expPerRound = None
+        if character is not None:
+            self.setCharacter(character)
+
+    # recompute everything that depends on us, one pass over all monsters
+    def setCharacter(self, character):
+        self.character = character
+
+        # them -> us
+        hits = hitChance(self.attackAccuracy, character.armourClass)
+        perHit = damageAfterResist(self.attackMin, self.attackMax, character.damageResist)
+        perSwing = (self.attackChance * self.attackPhysical * hits * perHit).sum(axis=1)
+        self.damagePerRound = perSwing * self.swings
+
+        # us -> them
+        ourHits = hitChance(numpy.full(self.rows, float(character.accuracy)), self.armourClass)
+        ourPerHit = damageAfterResist(character.minDamage, character.maxDamage, self.damageResist)
+        ourPerRound = ourHits * ourPerHit * character.swings
+
+        self.roundsToKill = numpy.divide(self.hp, ourPerRound, out=numpy.full(self.rows, numpy.inf), where=ourPerRound > 0)
+
+        # monsters we can't hurt: endless damage if they hit back, none if they don't
+        killable = numpy.isfinite(self.roundsToKill)
+        self.damageToKill = numpy.where(self.damagePerRound > 0, numpy.inf, 0.0)
+        numpy.multiply(self.damagePerRound, self.roundsToKill, out=self.damageToKill, where=killable)
+        self.expPerRound = numpy.divide(self.exp, self.roundsToKill, out=numpy.zeros(self.rows), where=killable)
+
+    # become the parser's threat table and follow our stat block
+    def attach(self, parser):
+        parser.threatTable = self
+        parser.subscribe(StatBlock, self.onStatBlock)
+
+    # "Hits: 49/49" and "Armour Class: 20/2", only once setCharacter() has given us the rest
+    def onStatBlock(self, event):
+        if self.character is None:
+            return
+        hits = numberPair(event.fields.get("Hits", ""))
+        armour = numberPair(event.fields.get("Armour Class", ""))
+        character = self.character
+        if hits is not None:
+            character = character._replace(hitPoints=hits[1])
+        if armour is not None:
+            character = character._replace(armourClass=armour[0], damageResist=armour[1])
+        if character != self.character:
+            self.setCharacter(character)
+
+    def row(self, number):
+        return self.rowByNumber.get(number)
+
+    # Threat for a monster Number (None if unknown or no character set yet)
+    def threat(self, number):
+        row = self.rowByNumber.get(number)
+        if row is None or self.character is None:
+            return None
+        return Threat(number, self.snapshot.value(row, "Name"), float(self.damagePerRound[row]), float(self.expPerHP[row]),
+                      float(self.roundsToKill[row]), float(self.damageToKill[row]), float(self.expPerRound[row]))
+
+    # True if killing it is expected to cost more than `margin` of our hit points
+    def avoid(self, number, margin=0.75):
+        row = self.rowByNumber.get(number)
+        if row is None or self.character is None:
+            return False
+        return self.damageToKill[row] > margin * self.character.hitPoints
+
+    # monster Numbers (in game ones only) by exp per round, best first, skipping the ones we should avoid
+    def bestTargets(self, count=10, margin=0.75):
+        safe = self.inGame & (self.damageToKill <= margin * self.character.hitPoints)
+        rows = numpy.flatnonzero(safe)
+        order = rows[numpy.argsort(-self.expPerRound[rows], kind="stable")]
+        return [int(number) for number in self.numbers[order[:count]]]
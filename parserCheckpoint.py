@@ -0,0 +1,305 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Save and restore a majormudParser's session state as a small versioned binary blob
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# A parser carries a session's state in its attributes: which multi-line block
+# is open (and the pieces of a wrapped "Also here" / "You notice" / exits list
+# it has so far), blank line counts, the stat block read so far, the room,
+# half a line (or half a telnet sequence) waiting for the next chunk, trigger
+# cooldowns. checkpoint() packs all of that into bytes and restore() puts it
+# back into a fresh parser built with the same options, so a session can move
+# to another worker process, or survive a restart, and pick up mid-block on
+# exactly the next byte.
+#
+# Layout (little endian, no pickle, nothing in it gets executed):
+#
+#   HEADER      magic, format version, crc32 and length of the body
+#   FIXED       the boolean flags as one bit field, blank line counts, which
+#               block is open, the telnet colour state
+#   STRINGS     length prefixed (u32, 0xFFFFFFFF for None) utf-8/bytes and
+#               counted lists of them, in a fixed order per version
+#
+# A blob from another version, or with a bad checksum, raises ValueError.
+#
+# What's saved is the parser's own state; subscribers (RoomGraph, CombatTracker,
+# PlayerRegistry, ...) keep theirs. Configuration (encoding, database, triggers,
+# threat table) comes from the parser the blob is restored into. roomItems and
+# roomOccupants are saved as the tokens they came from and resolved again on
+# restore (the resolvers memoise, so that's cheap).
+#
+#   blob = parser.checkpoint()
+#   ...
+#   parser = majormudParser(database=database)
+#   parser.restore(blob)
+#
+#   python parserCheckpoint.py      checkpoint size/time, and a resume check at every chunk boundary
+
+import struct
+import zlib
+from array import array
+
+CHECKPOINT_MAGIC = b"MMPC"
+CHECKPOINT_VERSION = 2
+CHECKPOINT_HEADER = struct.Struct("<4sHII")
+CHECKPOINT_FIXED = struct.Struct("<IHHbb")
+
+# bit n of the flags field
+FLAG_ATTRIBUTES = ("currentAdventurersContinued", "lookingContinued", "youNoticeContinued", "exitsContinued",
+                   "statContinued", "alsoHereContinued", "awaitingCommand", "feedAfterPrompt",
+                   "collectCopper", "collectSilver", "collectGold", "collectPlatinum", "collectRunic")
+FLAG_TELNET = 1 << len(FLAG_ATTRIBUTES)
+FLAG_TELNET_BOLD = FLAG_TELNET << 1
+
+# open block -> index stored (-1 for none), order fixed for this version
+BLOCK_HANDLERS = ("processCurrentAdventurers", "processLookingAtPlayer", "processAlsoHere", "processYouNotice",
+                  "processObviousExits", "processStatBlock")
+
+NONE_LENGTH = 0xFFFFFFFF
+U32 = struct.Struct("<I")
+
+
+####################################
+#       WRITING                    #
+####################################
+
+def packBytes(parts, value):
+    if value is None:
+        parts.append(U32.pack(NONE_LENGTH))
+    else:
+        parts.append(U32.pack(len(value)))
+        parts.append(value)
+
+
+def packString(parts, value):
+    packBytes(parts, None if value is None else value.encode("utf-8"))
+
+
+def packStrings(parts, values):
+    parts.append(U32.pack(len(values)))
+    for value in values:
+        packString(parts, value)
+
+
+def checkpoint(parser):
+    flags = 0
+    for bit, name in enumerate(FLAG_ATTRIBUTES):
+        if getattr(parser, name):
+            flags |= 1 << bit
+
+    telnet = parser.telnetFilter
+    foreground = -1
+    if telnet is not None:
+        flags |= FLAG_TELNET
+        if telnet.bold:
+            flags |= FLAG_TELNET_BOLD
+        if telnet.foreground is not None:
+            foreground = telnet.foreground
+
+    openBlock = -1
+    if parser.openBlock is not None:
+        openBlock = BLOCK_HANDLERS.index(parser.openBlock.__name__)
+
+    parts = [CHECKPOINT_FIXED.pack(flags, parser.currentAdventurersBlankLineCount, parser.lookingBlankLineCount,
+                                   openBlock, foreground)]
+
+    packString(parts, parser.currentRoom)
+    packString(parts, parser.lookingAt)
+    packString(parts, parser.pendingMove)
+    packStrings(parts, parser.roomExits)
+    packStrings(parts, [text for field in parser.statFields.items() for text in field])
+    packStrings(parts, [text for field in parser.lookingEquipment.items() for text in field])
+
+    for tokenizer in (parser.alsoHereTokens, parser.youNoticeTokens, parser.exitsTokens):
+        packStrings(parts, tokenizer.pending)
+
+    packBytes(parts, bytes(parser.feedBuf))
+
+    if telnet is not None:
+        packBytes(parts, telnet.pending)
+        packStrings(parts, [command for command, option in telnet.negotiations])
+        packBytes(parts, bytes(option for command, option in telnet.negotiations))
+
+    # cooldowns as ages, the clock in another process starts somewhere else
+    triggers = parser.triggers
+    now = triggers.clock()
+    packStrings(parts, list(triggers.lastFired))
+    packBytes(parts, array("d", (now - fired for fired in triggers.lastFired.values())).tobytes())
+
+    packStrings(parts, [notice.name if notice.quantity == 1 else "%d %s" % (notice.quantity, notice.name)
+                        for notice in parser.roomItems])
+    packStrings(parts, [match.name for match in parser.roomOccupants])
+
+    body = b"".join(parts)
+    return CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, zlib.crc32(body), len(body)) + body
+
+
+####################################
+#       READING                    #
+####################################
+
+class CheckpointReader(object):
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def fixed(self, layout):
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def bytes(self):
+        length, = U32.unpack_from(self.data, self.offset)
+        self.offset += 4
+        if length == NONE_LENGTH:
+            return None
+        value = bytes(self.data[self.offset:self.offset + length])
+        if len(value) != length:
+            raise ValueError("parser checkpoint is truncated")
+        self.offset += length
+        return value
+
+    def string(self):
+        value = self.bytes()
+        return None if value is None else value.decode("utf-8")
+
+    def strings(self):
+        count, = U32.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return [self.string() for _ in range(count)]
+
+
+def restore(parser, blob):
+    if len(blob) < CHECKPOINT_HEADER.size:
+        raise ValueError("not a parser checkpoint")
+    magic, version, checksum, length = CHECKPOINT_HEADER.unpack_from(blob, 0)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError("not a parser checkpoint")
+    if version != CHECKPOINT_VERSION:
+        raise ValueError("parser checkpoint version %d, this build reads %d" % (version, CHECKPOINT_VERSION))
+    body = memoryview(blob)[CHECKPOINT_HEADER.size:]
+    if len(body) != length or zlib.crc32(body) != checksum:
+        raise ValueError("parser checkpoint is damaged")
+
+    reader = CheckpointReader(body, 0)
+    try:
+        flags, adventurersBlank, lookingBlank, openBlock, foreground = reader.fixed(CHECKPOINT_FIXED)
+        if flags & FLAG_TELNET and parser.telnetFilter is None:
+            raise ValueError("parser checkpoint was taken with telnet=True")
+
+        for bit, name in enumerate(FLAG_ATTRIBUTES):
+            setattr(parser, name, bool(flags & (1 << bit)))
+        parser.currentAdventurersBlankLineCount = adventurersBlank
+        parser.lookingBlankLineCount = lookingBlank
+
+        parser.currentRoom = reader.string()
+        parser.lookingAt = reader.string()
+        parser.pendingMove = reader.string()
+        parser.roomExits = tuple(reader.strings())
+        fields = reader.strings()
+        parser.statFields = dict(zip(fields[0::2], fields[1::2]))
+        fields = reader.strings()
+        parser.lookingEquipment = dict(zip(fields[0::2], fields[1::2]))
+
+        for tokenizer in (parser.alsoHereTokens, parser.youNoticeTokens, parser.exitsTokens):
+            tokenizer.reset()
+            tokenizer.pending.extend(reader.strings())
+
+        parser.feedBuf = bytearray(reader.bytes())
+
+        if flags & FLAG_TELNET:
+            telnet = parser.telnetFilter
+            telnet.pending = reader.bytes()
+            commands = reader.strings()
+            telnet.negotiations = list(zip(commands, reader.bytes()))
+            telnet.foreground = None if foreground < 0 else foreground
+            telnet.bold = bool(flags & FLAG_TELNET_BOLD)
+
+        triggers = parser.triggers
+        now = triggers.clock()
+        names = reader.strings()
+        ages = array("d")
+        ages.frombytes(reader.bytes())
+        triggers.lastFired = {name: now - age for name, age in zip(names, ages)}
+
+        parser.roomItems = [parser.itemResolver.resolve(token) for token in reader.strings()]
+        parser.roomOccupants = [parser.monsterMatcher.match(token) for token in reader.strings()]
+    except (struct.error, UnicodeDecodeError) as error:
+        raise ValueError("parser checkpoint is damaged: %s" % error)
+
+    if openBlock < 0:
+        parser.openBlock = None
+        parser.openBlockFlag = None
+    else:
+        name = BLOCK_HANDLERS[openBlock]
+        parser.openBlock = getattr(parser, name)
+        parser.openBlockFlag = parser.BLOCK_FLAGS[name]
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+if __name__ == "__main__":
+    import time
+
+    from majormudParser import majormudParser
+    from telnetFilter import colourise
+
+    with open("2025-03-31_10-56-19.log", "rb") as file:
+        capture = file.read()
+
+    # small chunks, so plenty of cuts land inside a line, a block or a telnet sequence
+    chunkSize = 97
+
+    # events as dicts, without the perf_counter() stamps Vitals/PartyMember carry
+    def record(events):
+        def add(event):
+            fields = event.asDict()
+            fields.pop("stamp", None)
+            events.append(fields)
+        return add
+
+    def run(data, telnet, cutAt=None):
+        events = []
+        parser = majormudParser(telnet=telnet)
+        parser.subscribeAll(record(events))
+        for index, start in enumerate(range(0, len(data), chunkSize)):
+            if index == cutAt:
+                blob = parser.checkpoint()
+                parser = majormudParser(telnet=telnet)
+                parser.subscribeAll(record(events))
+                parser.restore(blob)
+            parser.feed(data[start:start + chunkSize])
+        parser.flush()
+        return events
+
+    for label, data, telnet in (("clean", capture, False), ("telnet/ansi", colourise(capture), True)):
+        expected = run(data, telnet)
+        chunks = (len(data) + chunkSize - 1) // chunkSize
+        mismatches = sum(1 for cut in range(chunks) if run(data, telnet, cut) != expected)
+        print("%-12s resumed at each of %d chunk boundaries: %d differ from the uninterrupted run (%d events)"
+              % (label, chunks, mismatches, len(expected)))
+
+    # a parser in the middle of a wrapped "Also here" with a stat block read so far
+    parser = majormudParser()
+    for line in ("Name: Violet Plant                   Lives/CP:      9/0\n",
+                 "Race: Human      Exp: 1630           Perception:     32\n",
+                 "Also here: Shirley, Laverne, Violet, kobold thief, small acid slime, kobold\n"):
+        parser.process_line(line)
+    parser.feed(b"thief, carrion be")
+
+    rounds = 20000
+    began = time.perf_counter()
+    for _ in range(rounds):
+        blob = checkpoint(parser)
+    saved = time.perf_counter() - began
+
+    fresh = majormudParser()
+    began = time.perf_counter()
+    for _ in range(rounds):
+        restore(fresh, blob)
+    restored = time.perf_counter() - began
+    print("checkpoint %d bytes, %.1f us to take, %.1f us to restore" % (len(blob), saved / rounds * 1e6, restored / rounds * 1e6))
@@ -0,0 +1,259 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Typed events that majormudParser hands to whoever subscribed to them
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# The handlers used to print what they found (or throw it away). Now they build
+# one of these small __slots__ objects and pass it to the callbacks subscribed
+# to that event type. The parser checks for subscribers before it builds an
+# event, so an event nobody listens to costs one dict lookup.
+#
+#   parser.subscribe(Command, lambda event: client.send(event.command))
+#
+# For pull style consumers an EventQueue can be subscribed instead and drained
+# whenever it suits them:
+#
+#   queue = EventQueue()
+#   parser.subscribe(WhoEntry, queue)
+#   ...
+#   for event in queue.drain(): ...
+
+from collections import deque
+
+
+class ParserEvent(object):
+    __slots__ = ()
+
+    # plain dict of the fields (for json, logging, ...)
+    def asDict(self):
+        fields = {"type": type(self).__name__}
+        for name in self.__slots__:
+            fields[name] = getattr(self, name)
+        return fields
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+
+# a room title was shown (every time, so walking between two rooms with the same name still counts)
+class RoomChanged(ParserEvent):
+    __slots__ = ("room", "known")
+
+    def __init__(self, room, known):
+        self.room = room
+        self.known = known
+
+
+# the "Obvious exits:" line of the room we're in
+#   exits:  full direction names ("north", "up", ...)
+#   closed: the ones behind a closed door/gate
+#   moved:  the direction we walked to get here, None if we didn't (e.g. a look)
+class ObviousExits(ParserEvent):
+    __slots__ = ("room", "exits", "closed", "moved")
+
+    def __init__(self, room, exits, closed, moved):
+        self.room = room
+        self.exits = exits
+        self.closed = closed
+        self.moved = moved
+
+
+# one row of the 'who' list, gang is None for players without one
+class WhoEntry(ParserEvent):
+    __slots__ = ("alignment", "name", "title", "gang")
+
+    def __init__(self, alignment, name, title, gang):
+        self.alignment = alignment
+        self.name = name
+        self.title = title
+        self.gang = gang
+
+
+# one equipped item from looking at a player
+class LookEquipment(ParserEvent):
+    __slots__ = ("player", "slot", "item")
+
+    def __init__(self, player, slot, item):
+        self.player = player
+        self.slot = slot
+        self.item = item
+
+
+# a look at a player that ran to the end: everything they have equipped, slot -> item
+# (each item was already handed out on its own as a LookEquipment)
+class LookedAt(ParserEvent):
+    __slots__ = ("player", "equipment")
+
+    def __init__(self, player, equipment):
+        self.player = player
+        self.equipment = equipment
+
+
+# the whole "Also here:" list, resolved (monsterMatcher.Match per entry)
+class AlsoHere(ParserEvent):
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+# the whole "You notice ... here." list, resolved (itemResolver.Notice per entry)
+class YouNotice(ParserEvent):
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+
+# a command the parser suggests sending to the game
+#   kind:   "attack" or "get"
+#   target: what it is aimed at, as the game printed it
+class Command(ParserEvent):
+    __slots__ = ("command", "kind", "target")
+
+    def __init__(self, command, kind, target):
+        self.command = command
+        self.kind = kind
+        self.target = target
+
+
+# "*Combat Engaged*" (engaged=True) / "*Combat Off*" (engaged=False)
+class CombatState(ParserEvent):
+    __slots__ = ("engaged",)
+
+    def __init__(self, engaged):
+        self.engaged = engaged
+
+
+# "Laverne slams kobold thief for 12 damage!"
+#   attacker/target: "You"/"you" for us, monsters without the leading "The "
+class CombatHit(ParserEvent):
+    __slots__ = ("attacker", "verb", "target", "damage", "critical")
+
+    def __init__(self, attacker, verb, target, damage, critical):
+        self.attacker = attacker
+        self.verb = verb
+        self.target = target
+        self.damage = damage
+        self.critical = critical
+
+
+# "You gain 3 experience."
+class ExperienceGained(ParserEvent):
+    __slots__ = ("amount",)
+
+    def __init__(self, amount):
+        self.amount = amount
+
+
+# "(Dmg:2 Tot:9)", our damage this round and this fight
+class DamageTally(ParserEvent):
+    __slots__ = ("damage", "total")
+
+    def __init__(self, damage, total):
+        self.damage = damage
+        self.total = total
+
+
+# the whole "stat" block, field name as the game prints it -> value text
+#   {"Name": "Snake Plant", "Lives/CP": "9/2", "Race": "Dwarf", "Hits": "49/49", "Armour Class": "1/0", ...}
+class StatBlock(ParserEvent):
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+
+# "Exp: 96 Level: 1 Exp needed for next level: 2404 (2500) [3%]"
+class ExpStatus(ParserEvent):
+    __slots__ = ("exp", "level", "needed", "nextLevel", "percent")
+
+    def __init__(self, exp, level, needed, nextLevel, percent):
+        self.exp = exp
+        self.level = level
+        self.needed = needed
+        self.nextLevel = nextLevel
+        self.percent = percent
+
+
+# some fields of a known player changed (characterRegistry.py)
+#   changes: field -> (old value, new value), old is None the first time a player is seen
+class CharacterUpdated(ParserEvent):
+    __slots__ = ("name", "changes")
+
+    def __init__(self, name, changes):
+        self.name = name
+        self.changes = changes
+
+
+# the HP prompt: "[HP=49 (Resting) ]:", "[HP=39]:", "[HP=31/MA=12]:"
+#   mana:  None when the prompt has no MA=
+#   state: "Resting", "Meditating", ... or None
+#   stamp: time.perf_counter() when the prompt was parsed, for measuring how long reacting to it took
+class Vitals(ParserEvent):
+    __slots__ = ("hp", "mana", "state", "stamp")
+
+    def __init__(self, hp, mana, state, stamp):
+        self.hp = hp
+        self.mana = mana
+        self.state = state
+        self.stamp = stamp
+
+
+# one member line of "par": "  Violet Plant   (Priest)   [M:100%] [H:100%]   - Frontrank"
+#   mana/health: percentages, mana is None for classes without it
+#   resting:     the R before the rank
+class PartyMember(ParserEvent):
+    __slots__ = ("name", "className", "mana", "health", "resting", "rank", "stamp")
+
+    def __init__(self, name, className, mana, health, resting, rank, stamp):
+        self.name = name
+        self.className = className
+        self.mana = mana
+        self.health = health
+        self.resting = resting
+        self.rank = rank
+        self.stamp = stamp
+
+
+# someone talking: "Bloodrock gossips: ...", "Violet telepaths: der", 'Violet says (to you) "{ok}"'
+#   channel: gossip, auction, telepath, gangpath, broadcast or say
+#   target:  who a say was directed at ("you"), None otherwise
+class Communication(ParserEvent):
+    __slots__ = ("channel", "speaker", "text", "target")
+
+    def __init__(self, channel, speaker, text, target=None):
+        self.channel = channel
+        self.speaker = speaker
+        self.text = text
+        self.target = target
+
+
+ALL_EVENTS = (RoomChanged, ObviousExits, WhoEntry, LookEquipment, LookedAt, AlsoHere, YouNotice, Command,
+              CombatState, CombatHit, ExperienceGained, DamageTally, StatBlock, ExpStatus, CharacterUpdated,
+              Vitals, PartyMember, Communication)
+
+
+# subscriber that just keeps events until somebody pulls them
+class EventQueue(object):
+
+    def __init__(self, maxlen=None):
+        self.events = deque(maxlen=maxlen)
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    # yield (and remove) everything queued so far
+    def drain(self):
+        events = self.events
+        while events:
+            yield events.popleft()
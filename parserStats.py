@@ -0,0 +1,217 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Optional per-handler instrumentation for majormudParser
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# majormudParser(profile=True) hands itself to a ParserProfiler, which swaps each
+# process* handler (and process_line) for a timing wrapper on that one
+# instance. Without the flag nothing is wrapped, so the unprofiled parser runs
+# exactly the same code as before.
+#
+# Per handler it keeps call counts, total time, bytes seen, a ring of the last
+# SAMPLE_SIZE call times for p50/p99, and for the multi-line handlers how long
+# (seconds and lines) each block stayed open. A handler's time leaves out the
+# handlers it calls itself (processPrompt -> processCommand), those count it,
+# and a block the parser closes from outside (a prompt cutting it short) ends
+# its timing there.
+#
+#   parser = majormudParser(profile=True)
+#   parser.profiler.dumpEvery(60, sys.stderr)
+#   ...
+#   parser.statsSnapshot()
+
+import functools
+import json
+import sys
+import time
+from array import array
+
+# how many recent samples the percentiles are computed over
+SAMPLE_SIZE = 4096
+
+# the handlers that get wrapped
+HANDLERS = ("processRoom", "processCurrentAdventurers", "processLookingAtPlayer", "processAlsoHere", "processYouNotice",
+            "processObviousExits", "processPrompt", "processCommand", "processCombat", "processHit", "processExperience",
+            "processDamageTally", "processStatBlock", "processExpStatus", "processPartyMember",
+            "processLineTriggers", "processCommunication")
+
+
+# p-th percentile of an already sorted sequence
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+# a fixed size ring of floats
+class SampleRing(object):
+    __slots__ = ("samples", "next", "count")
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.samples = array("d", bytes(8 * size))
+        self.next = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.next] = value
+        self.next = (self.next + 1) % len(self.samples)
+        if self.count < len(self.samples):
+            self.count += 1
+
+    def sorted(self):
+        return sorted(self.samples[:self.count])
+
+
+class HandlerStats(object):
+    __slots__ = ("calls", "seconds", "bytes", "times", "blocks", "blockSeconds", "blockLines",
+                 "blockTimes", "blockStarted", "blockLineCount")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.times = SampleRing()
+
+        # multi-line blocks
+        self.blocks = 0
+        self.blockSeconds = 0.0
+        self.blockLines = 0
+        self.blockTimes = SampleRing()
+        self.blockStarted = None
+        self.blockLineCount = 0
+
+    def snapshot(self):
+        times = self.times.sorted()
+        stats = {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "bytes": self.bytes,
+            "p50": percentile(times, 50),
+            "p99": percentile(times, 99),
+        }
+        if self.blocks or self.blockStarted is not None:
+            blockTimes = self.blockTimes.sorted()
+            stats["blocks"] = self.blocks
+            stats["blockOpen"] = self.blockStarted is not None
+            stats["blockSeconds"] = self.blockSeconds
+            stats["blockLinesAvg"] = self.blockLines / float(self.blocks) if self.blocks else 0.0
+            stats["blockP50"] = percentile(blockTimes, 50)
+            stats["blockP99"] = percentile(blockTimes, 99)
+        return stats
+
+
+class ParserProfiler(object):
+
+    def __init__(self, parser, clock=time.perf_counter):
+        self.parser = parser
+        self.clock = clock
+        self.stats = {}
+
+        # periodic dump, see dumpEvery()
+        self.dumpInterval = None
+        self.dumpStream = None
+        self.lastDump = clock()
+
+        # time spent in handlers called from the one running (processPrompt -> processCommand),
+        # they count it for themselves so the caller leaves it out
+        self.inner = 0.0
+
+        for name in HANDLERS:
+            self.stats[name] = HandlerStats()
+            setattr(parser, name, self.wrapHandler(name, getattr(parser, name), parser.BLOCK_FLAGS.get(name)))
+
+        self.stats["process_line"] = HandlerStats()
+        parser.process_line = self.wrapLine(parser.process_line)
+
+    def wrapHandler(self, name, handler, flag):
+        stats = self.stats[name]
+        clock = self.clock
+        parser = self.parser
+
+        @functools.wraps(handler)
+        def timed(line):
+            wasOpen = flag is not None and getattr(parser, flag)
+
+            outer = self.inner
+            self.inner = 0.0
+            start = clock()
+            handler(line)
+            now = clock()
+
+            elapsed = now - start - self.inner
+            self.inner = outer + now - start
+            stats.calls += 1
+            stats.seconds += elapsed
+            stats.bytes += len(line)
+            stats.times.add(elapsed)
+
+            if flag is not None:
+                isOpen = getattr(parser, flag)
+                if isOpen and not wasOpen:
+                    stats.blockStarted = start
+                    stats.blockLineCount = 0
+                if isOpen or wasOpen:
+                    stats.blockLineCount += 1
+                if wasOpen and not isOpen:
+                    self.endBlock(stats, now)
+
+        return timed
+
+    def endBlock(self, stats, now):
+        blockTime = now - stats.blockStarted
+        stats.blocks += 1
+        stats.blockSeconds += blockTime
+        stats.blockLines += stats.blockLineCount
+        stats.blockTimes.add(blockTime)
+        stats.blockStarted = None
+
+    # the parser closed a block without its handler (a prompt cut it short), it ends here
+    def blockClosed(self, name):
+        stats = self.stats[name]
+        if stats.blockStarted is not None:
+            self.endBlock(stats, self.clock())
+
+    def wrapLine(self, processLine):
+        stats = self.stats["process_line"]
+        clock = self.clock
+
+        @functools.wraps(processLine)
+        def timed(line):
+            self.inner = 0.0
+            start = clock()
+            processLine(line)
+            now = clock()
+
+            elapsed = now - start
+            stats.calls += 1
+            stats.seconds += elapsed
+            stats.bytes += len(line)
+            stats.times.add(elapsed)
+
+            if self.dumpInterval is not None and now - self.lastDump >= self.dumpInterval:
+                self.lastDump = now
+                self.dump(self.dumpStream)
+
+        return timed
+
+    # handler name -> dict of its numbers
+    def snapshot(self):
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    # one json line with a timestamp
+    def dump(self, stream=None):
+        stream = stream or sys.stderr
+        stream.write(json.dumps({"time": time.time(), "stats": self.snapshot()}) + "\n")
+        stream.flush()
+
+    # dump every `seconds` (checked as lines come in), None turns it off
+    def dumpEvery(self, seconds, stream=None):
+        self.dumpInterval = seconds
+        self.dumpStream = stream
+        self.lastDump = self.clock()
+
+    # start counting from zero (in place, the wrappers hold on to these objects)
+    def reset(self):
+        for stats in self.stats.values():
+            stats.__init__()
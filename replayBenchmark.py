@@ -0,0 +1,403 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Benchmark the parser on big synthetic captures and fail on performance regressions
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# test-parser.py replays one 1077 line capture with no timing at all. This
+# generates captures of any size (millions of lines) with the same mix a real
+# session has: prompts and movement, rooms with wrapped "You notice"/"Also
+# here" lists, who-lists, gossip and combat spam, all built from real monster,
+# item and player names (the *-v1.11p.json files and the bundled capture).
+#
+# Every engine runs in a fresh process so its peak RSS is its own:
+#
+#   process_line    majormudParser.process_line on pre-split lines
+#   feed            majormudParser.feed on 4096 byte chunks
+#   splitlines      the same chunks through the obvious alternative to feed():
+#                   an incremental decoder and splitlines(), then process_line
+#   telnet          the same capture with ANSI colour and telnet GA added,
+#                   through majormudParser(telnet=True)
+#
+# and reports lines/sec, speed relative to process_line, peak RSS and (from a
+# second, profiled pass) the time spent in each handler. More engines can be
+# added to ENGINES.
+#
+# Lines/sec depends on the machine, so baselines store it relative to a fixed
+# bit of pure python string work timed in the same process (calibrate()).
+# With --check every engine is compared against its baseline and anything
+# more than --tolerance slower (or bigger), or without a baseline at all, is
+# reported as a REGRESSION and the exit status is 1. benchmarkBaselines.json
+# holds the default run (1M lines, seed 1):
+#
+#   python replayBenchmark.py --lines 2000000 --save      record a baseline
+#   python replayBenchmark.py --lines 2000000 --check     compare against it
+
+import argparse
+import codecs
+import json
+import os
+import random
+import resource
+import sys
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from gameDatabase import GameDatabase
+from majormudParser import majormudParser
+from monsterMatcher import MONSTER_ADJECTIVES
+from telnetFilter import colourise
+
+BASELINE_FILE = "benchmarkBaselines.json"
+CHUNK_SIZE = 4096
+
+# the game wraps lists at 79 columns
+LINE_WIDTH = 79
+
+# (alignment, name, title, gang) pool for who-lists, gossip and "Also here", from the bundled capture
+PLAYERS = (
+    ("Good", "Albion", "Nature's Fury", "Jokers Wild"), ("", "Azraehl", "Knave", None),
+    ("Good", "Bastich", "Exalted Shield", "The Black Hand"), ("Lawful", "Bloodrock", "Dragonslayer", None),
+    ("Good", "Boromir", "Exalted Shield", "Jokers Wild"), ("Lawful", "Bytor", "Grand Exemplar", None),
+    ("", "Conan Rerun", "Master", "MetalMonsters"), ("", "Doomsday", "Supreme Archmagi", "MetalMonsters"),
+    ("Good", "Dredd", "Cavalier", "Dark Knights"), ("Good", "Eddie Vedder", "Troubadour", "-=<WoToN>=-"),
+    ("Good", "Elindel", "Conjurer", "Dark Knights"), ("", "Laverne", "Apprentice", None),
+    ("", "Lucifer", "Knave", None), ("", "Shirley", "Apprentice", None), ("", "Slayer", "Knave", None),
+    ("", "Snake Plant", "Apprentice", None), ("", "Violet Plant", "Apprentice", None),
+    ("Villain", "Vivia", "Nature's Spirit", "The Black Hand"), ("Lawful", "Worf SonOfMogh", "Monk Lord", "-=<WoToN>=-"),
+    ("Good", "Xerxes GodOfWar", "God's Hand", "The Black Hand"), ("Lawful", "Ynot", "Master of the Hit", None),
+)
+
+ROOM_TITLES = ("Newhaven, Arena", "Newhaven, General Store", "Newhaven, Village Entrance", "Newhaven, Narrow Road",
+               "Newhaven, Spell Shop", "Newhaven, Healer", "Cave, Dark Tunnel", "Forest, Twisted Path",
+               "Town Square, Fountain", "Sewers, Drainage Pipe")
+
+DESCRIPTION = ("This narrow road is quite plain save for the various lanterns hanging from the trees around, and a "
+               "large stone stairwell leading downwards. You hear the clash of steel below you, and cries of pain "
+               "and triumph accompanying it. Stone buildings lie to your north and west.")
+
+GOSSIP = ("anyone selling a longsword?", "lf party in the arena", "kay", "sun robes added to gear shop",
+          "where do I train?", "grats!", "brb", "emerald bracers fix to be better than armbands of haste")
+
+EXITS = ("north", "south", "east", "west", "northeast", "northwest", "southeast", "southwest", "up", "down")
+COMMANDS = ("n", "s", "e", "w", "ne", "nw", "se", "sw", "u", "d")
+VERBS = ("slashes", "slams", "whaps", "smashes", "beats", "slices", "smacks", "stabs")
+OUR_VERBS = ("slash", "slam", "whap", "smash", "beat", "slice", "smack", "stab")
+COINS = ("copper farthings", "silver nobles", "gold crowns", "platinum pieces")
+
+
+def wrap(text):
+    return textwrap.wrap(text, LINE_WIDTH, break_long_words=False, break_on_hyphens=False)
+
+
+def firstName(player):
+    return player[1].split(" ", 1)[0]
+
+
+class CaptureGenerator(object):
+
+    def __init__(self, database=None, seed=1):
+        database = database or GameDatabase()
+        self.random = random.Random(seed)
+
+        monsters = database.monsters
+        monsters.load()
+        self.monsters = sorted(name for name in monsters.names if name.islower())
+
+        items = database.items
+        items.load()
+        self.items = sorted(name for name in items.names if name.islower())
+
+    def prompt(self, command=""):
+        return "[HP=%d]:%s" % (self.random.randint(20, 49), command)
+
+    def room(self):
+        random = self.random
+        lines = [self.prompt(random.choice(COMMANDS)) + "\n", random.choice(ROOM_TITLES) + "\n"]
+
+        if random.random() < 0.3:
+            lines.extend("    " + line + "\n" if index == 0 else line + "\n" for index, line in enumerate(wrap(DESCRIPTION)))
+
+        if random.random() < 0.6:
+            things = ["%d %s" % (random.randint(1, 300), random.choice(COINS)) for _ in range(random.randint(0, 2))]
+            things += random.sample(self.items, random.randint(0, 4))
+            if things:
+                lines.extend(line + "\n" for line in wrap("You notice " + ", ".join(things) + " here."))
+
+        if random.random() < 0.7:
+            here = [firstName(player) for player in random.sample(PLAYERS, random.randint(0, 4))]
+            for _ in range(random.randint(1, 6)):
+                name = random.choice(self.monsters)
+                if random.random() < 0.4:
+                    name = random.choice(sorted(MONSTER_ADJECTIVES)) + " " + name
+                here.append(name)
+            lines.extend(line + "\n" for line in wrap("Also here: " + ", ".join(here) + "."))
+
+        exits = random.sample(EXITS, random.randint(1, 5))
+        if random.random() < 0.1:
+            exits[0] = "closed door " + exits[0]
+        lines.append("Obvious exits: " + ", ".join(exits) + "\n")
+        return lines
+
+    def whoList(self):
+        lines = [self.prompt("who") + "\n", "         Current Adventurers\n", "         ===================\n", "\n"]
+        for alignment, name, title, gang in PLAYERS:
+            row = "%8s %-22s-  %s" % (alignment, name, title)
+            if gang:
+                row += "  of " + gang
+            lines.append(row + "\n")
+        lines.append("\n")
+        return lines
+
+    def gossip(self):
+        player = self.random.choice(PLAYERS)
+        return [firstName(player) + " gossips: " + self.random.choice(GOSSIP) + "\n"]
+
+    def combat(self):
+        random = self.random
+        monster = random.choice(self.monsters)
+        party = [firstName(player) for player in random.sample(PLAYERS, 2)]
+        lines = [self.prompt("a " + monster) + "\n", "*Combat Engaged*\n"]
+
+        total = 0
+        for _ in range(random.randint(1, 5)):
+            for name in party:
+                lines.append("%s %s %s for %d damage!\n" % (name, random.choice(VERBS), monster, random.randint(1, 30)))
+            damage = random.randint(1, 12)
+            total += damage
+            lines.append("You %s %s for %d damage!\n" % (random.choice(OUR_VERBS), monster, damage))
+            if random.random() < 0.5:
+                lines.append("The %s %s you for %d damage!\n" % (monster, random.choice(VERBS), random.randint(1, 10)))
+            lines.append(self.prompt("(Dmg:%d Tot:%d)" % (damage, total)) + "\n")
+
+        lines.append("You gain %d experience.\n" % random.randint(1, 200))
+        lines.append("*Combat Off*\n")
+        return lines
+
+    # roughly `lineCount` lines of capture as bytes
+    def generate(self, lineCount):
+        random = self.random
+        pieces = []
+        lines = 0
+        kinds = (self.room, self.room, self.room, self.combat, self.combat, self.gossip, self.gossip)
+        while lines < lineCount:
+            # a who-list is ~25 lines, 2% of the blocks makes it ~5% of the lines
+            block = random.choice(kinds)() if random.random() > 0.02 else self.whoList()
+            pieces.extend(block)
+            lines += len(block)
+        return "".join(pieces).encode("cp437", "replace")
+
+
+# build (or reuse) a synthetic capture file
+def syntheticCapture(lineCount, seed=1, path=None):
+    path = path or "synthetic-%d-%d.log" % (lineCount, seed)
+    if not os.path.exists(path):
+        data = CaptureGenerator(seed=seed).generate(lineCount)
+        with open(path, "wb") as file:
+            file.write(data)
+    return path
+
+
+# the same capture the way a live game sends it (ANSI colour, IAC GA), built once next to it
+def colouredCapture(capturePath):
+    path = os.path.splitext(capturePath)[0] + "-ansi.log"
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(capturePath):
+        with open(capturePath, "rb") as file:
+            data = colourise(file.read())
+        with open(path, "wb") as file:
+            file.write(data)
+    return path
+
+
+####################################
+#       ENGINES                    #
+####################################
+
+def runProcessLine(parser, data):
+    lines = data.decode(parser.encoding, "replace").splitlines(True)
+    began = time.perf_counter()
+    processLine = parser.process_line
+    for line in lines:
+        processLine(line)
+    return time.perf_counter() - began
+
+
+# the obvious client side alternative to feed(): decode each chunk incrementally and
+# splitlines() it, a line the chunk cut in half waits for the rest
+def runSplitLines(parser, data):
+    decoder = codecs.getincrementaldecoder(parser.encoding)("replace")
+    began = time.perf_counter()
+    processLine = parser.process_line
+    partial = ""
+    for start in range(0, len(data), CHUNK_SIZE):
+        lines = (partial + decoder.decode(data[start:start + CHUNK_SIZE])).splitlines(True)
+        partial = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        for line in lines:
+            processLine(line)
+    if partial:
+        processLine(partial)
+    return time.perf_counter() - began
+
+
+def runFeed(parser, data):
+    began = time.perf_counter()
+    feed = parser.feed
+    for start in range(0, len(data), CHUNK_SIZE):
+        feed(data[start:start + CHUNK_SIZE])
+    parser.flush()
+    return time.perf_counter() - began
+
+
+# name -> (parser keyword arguments, wants the coloured capture, run)
+ENGINES = {
+    "process_line": ({}, False, runProcessLine),
+    "feed": ({}, False, runFeed),
+    "splitlines": ({}, False, runSplitLines),
+    "telnet": ({"telnet": True}, True, runFeed),
+}
+
+
+def peakRSS():
+    # kilobytes on linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# lines/s of a fixed bit of string work much like a handler's (find, split,
+# startswith over short lines), best of a few runs, to measure the machine by
+def calibrate(rounds=10):
+    lines = ["Also here: Shirley, Laverne, Violet, kobold thief, small acid slime.\n",
+             "[HP=49 (Resting) ]:e\n", "Shirley slashes kobold thief for 4 damage!\n",
+             "You notice 81 silver nobles, 210 copper farthings here.\n"] * 25000
+    best = None
+    for _ in range(rounds):
+        began = time.perf_counter()
+        for line in lines:
+            if line.startswith("[HP="):
+                line[4:line.find("]:")].split(" ", 1)
+            elif " for " in line:
+                line[:line.find(" for ")].rsplit(" ", 2)
+            else:
+                line[line.find(":") + 1:].rstrip(".\n").split(", ")
+        elapsed = time.perf_counter() - began
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+# runs in its own process, so the peak RSS belongs to this engine alone
+def runEngine(name, capturePath):
+    options, _, run = ENGINES[name]
+    with open(capturePath, "rb") as file:
+        data = file.read()
+    lines = data.count(b"\n")
+
+    # measured either side of the run, the better one counts (a cold start or a busy moment only ever slows it)
+    calibration = calibrate()
+    seconds = run(majormudParser(**options), data)
+    peak = peakRSS()
+    calibration = max(calibration, calibrate())
+
+    # a second pass with the profiler on for the per-handler split (slower, so not timed above)
+    profiled = majormudParser(profile=True, **options)
+    run(profiled, data)
+    handlers = {handler: stats["seconds"] for handler, stats in profiled.statsSnapshot().items() if stats["calls"]}
+
+    return {
+        "engine": name,
+        "lines": lines,
+        "bytes": len(data),
+        "seconds": seconds,
+        "linesPerSecond": lines / seconds if seconds else 0.0,
+        "relativeSpeed": lines / seconds / calibration if seconds else 0.0,
+        "peakRSS": peak,
+        "handlers": handlers,
+    }
+
+
+def benchmark(capturePath, engines):
+    results = []
+    for name in engines:
+        path = colouredCapture(capturePath) if ENGINES[name][1] else capturePath
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results.append(pool.submit(runEngine, name, path).result())
+    return results
+
+
+####################################
+#       BASELINES                  #
+####################################
+
+def loadBaselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def saveBaselines(path, results):
+    baselines = loadBaselines(path)
+    for result in results:
+        baselines[result["engine"]] = {"lines": result["lines"], "relativeSpeed": result["relativeSpeed"],
+                                       "peakRSS": result["peakRSS"]}
+    with open(path, "w") as file:
+        json.dump(baselines, file, indent=2, sort_keys=True)
+
+
+# list of regression messages, empty if everything is within tolerance
+# an engine without a baseline fails too, otherwise a missing file would pass every check
+def compareBaselines(results, baselines, tolerance):
+    regressions = []
+    for result in results:
+        baseline = baselines.get(result["engine"])
+        if baseline is None:
+            regressions.append("%s: no baseline to compare against (record one with --save)" % result["engine"])
+            continue
+
+        slowest = baseline["relativeSpeed"] * (1.0 - tolerance)
+        if result["relativeSpeed"] < slowest:
+            regressions.append("%s: relative speed %.3f, baseline %.3f (more than %d%% slower)"
+                               % (result["engine"], result["relativeSpeed"], baseline["relativeSpeed"], tolerance * 100))
+
+        # peak RSS only means something for the same capture size
+        if baseline["lines"] == result["lines"] and result["peakRSS"] > baseline["peakRSS"] * (1.0 + tolerance):
+            regressions.append("%s: peak RSS %.1f MB, baseline %.1f MB (more than %d%% bigger)"
+                               % (result["engine"], result["peakRSS"] / 1e6, baseline["peakRSS"] / 1e6, tolerance * 100))
+    return regressions
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Benchmark the parser on a synthetic capture")
+    args.add_argument("--lines", type=int, default=1000000, help="size of the synthetic capture")
+    args.add_argument("--seed", type=int, default=1)
+    args.add_argument("--capture", default=None, help="benchmark this capture instead of a synthetic one")
+    args.add_argument("--engines", default=",".join(ENGINES))
+    args.add_argument("--baseline", default=BASELINE_FILE)
+    args.add_argument("--save", action="store_true", help="record these results as the new baseline")
+    args.add_argument("--check", action="store_true", help="fail if slower/bigger than the baseline")
+    args.add_argument("--tolerance", type=float, default=0.2)
+    args = args.parse_args()
+
+    capturePath = args.capture or syntheticCapture(args.lines, args.seed)
+    results = benchmark(capturePath, args.engines.split(","))
+
+    reference = next((result["linesPerSecond"] for result in results if result["engine"] == "process_line"), None)
+    for result in results:
+        print("%-13s %9d lines  %8.0f lines/s%s  %6.1f MB/s  relative %.3f  peak RSS %7.1f MB"
+              % (result["engine"], result["lines"], result["linesPerSecond"],
+                 " (x%.2f)" % (result["linesPerSecond"] / reference) if reference else "",
+                 result["bytes"] / result["seconds"] / 1e6, result["relativeSpeed"], result["peakRSS"] / 1e6))
+        handlers = sorted(result["handlers"].items(), key=lambda item: -item[1])
+        print("              " + "  ".join("%s %.3fs" % item for item in handlers))
+
+    if args.save:
+        saveBaselines(args.baseline, results)
+        print("baseline saved to " + args.baseline)
+
+    if args.check:
+        regressions = compareBaselines(results, loadBaselines(args.baseline), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against " + args.baseline)
@@ -0,0 +1,208 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Map of the rooms we've walked through, learned from room titles, exits and movement
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Room titles aren't unique ("Newhaven, Narrow Road" is more than one room), so
+# a room is identified by its title plus the set of exits it shows. Each room
+# gets a small integer id the first time it's seen and everything else lives in
+# flat arrays indexed by that id:
+#
+#   exitMask[id]              bit per direction the room has an exit in
+#   closedMask[id]            bit per exit that was behind a closed door last time
+#   links[id * 10 + d]        id of the room through direction d, -1 if unknown
+#
+# The graph learns from the parser's ObviousExits events: the exits line closes
+# off the room description, and the movement command typed before it says
+# which exit of the previous room leads here.
+#
+# save()/load() write the titles and the arrays out as raw bytes behind a small
+# header, so a big mapped world comes back with a few frombytes() calls.
+
+import struct
+import sys
+from array import array
+from collections import deque
+
+from parserEvents import ObviousExits
+
+# the ten directions, in the order of the link slots
+DIRECTIONS = ("north", "south", "east", "west", "northeast", "northwest", "southeast", "southwest", "up", "down")
+DIRECTION_INDEX = {name: index for index, name in enumerate(DIRECTIONS)}
+OPPOSITE = (1, 0, 3, 2, 7, 6, 5, 4, 9, 8)
+
+# what can be typed to walk somewhere -> direction
+MOVEMENT_COMMANDS = {
+    "n": "north", "s": "south", "e": "east", "w": "west",
+    "ne": "northeast", "nw": "northwest", "se": "southeast", "sw": "southwest",
+    "u": "up", "d": "down",
+}
+for name in DIRECTIONS:
+    MOVEMENT_COMMANDS[name] = name
+
+# the short form of each direction, what we type to walk it
+DIRECTION_COMMANDS = ("n", "s", "e", "w", "ne", "nw", "se", "sw", "u", "d")
+
+NO_ROOM = -1
+
+# how many of the latest link changes are kept for caches to catch up on
+LINK_LOG_SIZE = 4096
+
+GRAPH_MAGIC = b"MMROOMS\x01"
+GRAPH_HEADER = struct.Struct("<8sIIII")
+
+
+# bitmask of a list of direction names (unknown words are ignored)
+def directionMask(directions):
+    mask = 0
+    for name in directions:
+        index = DIRECTION_INDEX.get(name)
+        if index is not None:
+            mask |= 1 << index
+    return mask
+
+
+class RoomGraph(object):
+
+    def __init__(self):
+        self.rooms = {}                 # (title, exitMask) -> id
+        self.titles = []                # id -> interned title
+        self.exitMask = array("H")
+        self.closedMask = array("H")
+        self.links = array("i")
+
+        # bumped on every change, lets caches (e.g. route planning) know they're stale
+        self.version = 0
+
+        # the latest link changes as (from room, to room, room it led to before), and how
+        # many there have been, so a cache can apply just what it missed
+        self.linkLog = deque(maxlen=LINK_LOG_SIZE)
+        self.linkChanges = 0
+
+        # where we are, NO_ROOM until the first exits line
+        self.currentRoom = NO_ROOM
+
+    def __len__(self):
+        return len(self.titles)
+
+    # id for a room, adding it if we haven't seen it before
+    def intern(self, title, exitMask):
+        key = (title, exitMask)
+        roomId = self.rooms.get(key)
+        if roomId is None:
+            roomId = len(self.titles)
+            title = sys.intern(title)
+            self.rooms[(title, exitMask)] = roomId
+            self.titles.append(title)
+            self.exitMask.append(exitMask)
+            self.closedMask.append(0)
+            self.links.extend((NO_ROOM,) * len(DIRECTIONS))
+            self.version += 1
+        return roomId
+
+    # id of a room, or None if we've never been there
+    def find(self, title, exits):
+        return self.rooms.get((title, directionMask(exits)))
+
+    # every room with this title
+    def findAll(self, title):
+        return [roomId for key, roomId in self.rooms.items() if key[0] == title]
+
+    def link(self, fromRoom, direction, toRoom):
+        slot = fromRoom * len(DIRECTIONS) + direction
+        if self.links[slot] != toRoom:
+            self.linkLog.append((fromRoom, toRoom, self.links[slot]))
+            self.linkChanges += 1
+            self.links[slot] = toRoom
+            self.version += 1
+
+    # room through an exit (direction index or name), NO_ROOM if not mapped yet
+    def neighbour(self, roomId, direction):
+        if not isinstance(direction, int):
+            direction = DIRECTION_INDEX[direction]
+        return self.links[roomId * len(DIRECTIONS) + direction]
+
+    # (direction index, room id) for every mapped exit of a room
+    def neighbours(self, roomId):
+        base = roomId * len(DIRECTIONS)
+        links = self.links
+        return [(direction, links[base + direction]) for direction in range(len(DIRECTIONS)) if links[base + direction] != NO_ROOM]
+
+    def isClosed(self, roomId, direction):
+        return bool(self.closedMask[roomId] >> direction & 1)
+
+    # record a room we just saw, returns its id
+    #   moved: the direction we walked from the previous room, None if we didn't move
+    def observe(self, title, exits, closed=(), moved=None):
+        roomId = self.intern(title, directionMask(exits))
+
+        closedMask = directionMask(closed)
+        if self.closedMask[roomId] != closedMask:
+            self.closedMask[roomId] = closedMask
+            self.version += 1
+
+        previous = self.currentRoom
+        direction = DIRECTION_INDEX.get(moved) if moved is not None else None
+        if previous != NO_ROOM and direction is not None:
+            self.link(previous, direction, roomId)
+
+            # exits nearly always go both ways, fill in the way back unless we know better
+            back = OPPOSITE[direction]
+            if self.exitMask[roomId] >> back & 1 and self.neighbour(roomId, back) == NO_ROOM:
+                self.link(roomId, back, previous)
+
+        self.currentRoom = roomId
+        return roomId
+
+    # learn from a parser's events
+    def attach(self, parser):
+        parser.subscribe(ObviousExits, self.onExits)
+
+    def onExits(self, event):
+        self.observe(event.room, event.exits, event.closed, event.moved)
+
+    ####################################
+    #       SAVE / LOAD                #
+    ####################################
+
+    def save(self, path):
+        # titles never contain a newline, so they go out as one newline separated blob
+        blob = "\n".join(self.titles).encode("utf-8")
+
+        with open(path, "wb") as file:
+            file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, len(self.titles), len(DIRECTIONS), len(blob),
+                                         1 if sys.byteorder == "little" else 0))
+            file.write(blob)
+            file.write(self.exitMask.tobytes())
+            file.write(self.closedMask.tobytes())
+            file.write(self.links.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            data = file.read()
+
+        magic, count, width, blobSize, little = GRAPH_HEADER.unpack_from(data, 0)
+        if magic != GRAPH_MAGIC or width != len(DIRECTIONS):
+            raise ValueError("not a room graph file: " + path)
+
+        graph = cls()
+        swap = bool(little) != (sys.byteorder == "little")
+        position = GRAPH_HEADER.size
+
+        titles = data[position:position + blobSize].decode("utf-8").split("\n") if count else []
+        position += blobSize
+
+        for target, size in ((graph.exitMask, count), (graph.closedMask, count), (graph.links, count * width)):
+            nbytes = size * target.itemsize
+            target.frombytes(data[position:position + nbytes])
+            if swap:
+                target.byteswap()
+            position += nbytes
+
+        # all C loops from here, no per-room python
+        graph.titles = list(map(sys.intern, titles))
+        graph.rooms = dict(zip(zip(graph.titles, graph.exitMask), range(count)))
+
+        return graph
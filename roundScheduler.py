@@ -0,0 +1,572 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Infer the server's combat round clock and send commands so they land in the next round
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# The server resolves combat in rounds on its own clock, and a command only
+# counts for a round if it got there in time; one that arrives while the round
+# is being resolved waits for the one after. Sending every suggested Command
+# the moment the parser emits it (what printing them amounted to) also sends
+# the same "g 7 silver nobles" every time the pile is listed, in whatever
+# order the lines came, and the server works through all of it first in first
+# out, one action a round.
+#
+# RoundClock works out when the rounds tick from what the parser sees:
+#
+#   a tick          the first line of a burst of round output (a CombatHit or
+#                   a DamageTally, nothing from the same round for burstGap
+#                   seconds before it); a prompt on its own counts as a tick
+#                   while engaged (rounds where everybody missed still end in
+#                   a prompt) unless it's the reply to a command we just sent,
+#                   "*Combat Engaged*" seeds the phase before anything better
+#                   is known
+#   period          a running estimate from the intervals between ticks
+#                   (missed rounds counted out), starting from the ~5 s rounds
+#                   and kept within PERIOD_RANGE of that; a burst sooner than
+#                   (1 - tolerance) of a period after the last tick is never a
+#                   tick (rounds don't come that quick, replies and stragglers
+#                   do), so the estimate can't slide onto a fraction of a round
+#   locked          after LOCK_TICKS ticks in a row where predicted; once
+#                   locked a burst off the predicted phase (a reply to one of
+#                   our commands) isn't taken for a tick, LOCK_TICKS of those
+#                   in a row drop the lock so a shifted phase gets picked up
+#
+# Times are as seen here, so they lag the server by the downstream latency;
+# that's fine, a command sent now reaches the server roundTrip later in the
+# same frame of reference.
+#
+# CommandScheduler queues commands, one entry per command text (a repeat
+# only refreshes it, and one already sent is held until the round it lands in
+# has been seen), highest priority first (attack, cast, get). On asyncio timers
+# it sends up to perRound of them per round: now, if they'd arrive safely
+# ahead of the next tick, otherwise just after that tick (guard/margin), so
+# what's sent lands in the next round instead of racing the tick and spilling
+# into a later one. roundTrip comes from the prompt that answers a command,
+# only when that's unambiguous: one command in flight, the prompt not near a
+# tick, and within ROUND_TRIP_RANGE of the current estimate.
+# Without a locked clock everything goes out straight away.
+#
+#   rounds = RoundClock()
+#   rounds.attach(parser)
+#   scheduler = CommandScheduler(lambda command: writer.write(command.encode() + b"\r\n"), rounds)
+#   scheduler.attach(parser)        # suggested Commands go through the scheduler
+#
+# RoundServer is a stand-in for the game to measure that against (see its
+# comment), like sessionHost.ReplayServer:
+#
+#   python roundScheduler.py [--rounds 100]     actions per round sending straight away vs scheduled
+
+import argparse
+import asyncio
+import random
+import time
+from collections import deque
+
+from parserEvents import CombatHit, CombatState, Command, DamageTally, Vitals
+
+ROUND_SECONDS = 5.0
+
+# the lines of one round arrive within this many seconds of each other
+BURST_GAP = 0.5
+
+# ticks in a row on the predicted phase before the clock is trusted
+LOCK_TICKS = 3
+
+# how far (fraction of a round) a tick may be off the prediction and still count
+TOLERANCE = 0.25
+
+# how fast the period estimate follows new intervals, before and after locking
+LEARN_WEIGHT = 0.5
+LOCKED_WEIGHT = 0.2
+
+# the period estimate stays within these fractions of the one the clock started with
+PERIOD_RANGE = (0.5, 2.0)
+
+# higher first, by Command.kind
+PRIORITIES = {"attack": 30, "cast": 20, "get": 10}
+
+# seconds: initial round trip guess, how close to a tick an arrival is too close,
+# how long after a tick to aim for when holding a command back
+ROUND_TRIP = 0.2
+GUARD = 0.5
+MARGIN = 0.1
+
+# rounds a queued command waits without being suggested again before it's dropped
+STALE_ROUNDS = 3
+
+# rounds of slack after the one a sent command should land in before it may be sent again
+# (0: as soon as that round's output has shown it's still wanted)
+HOLD_ROUNDS = 0
+
+# weight of a new round trip sample, and how far off the estimate (as a factor) one may be
+ROUND_TRIP_WEIGHT = 0.25
+ROUND_TRIP_RANGE = 4.0
+
+
+class RoundClock(object):
+
+    def __init__(self, period=ROUND_SECONDS, burstGap=BURST_GAP, tolerance=TOLERANCE, clock=time.monotonic):
+        self.period = period
+        self.minPeriod = period * PERIOD_RANGE[0]
+        self.maxPeriod = period * PERIOD_RANGE[1]
+        self.burstGap = burstGap
+        self.tolerance = tolerance
+        self.clock = clock
+
+        self.engaged = False
+        self.lastTick = None        # clock() of the last tick
+        self.lastLine = None        # clock() of the last round line, bursts are what's within burstGap of it
+        self.burstIsTick = False    # whether the current burst was taken for a tick
+        self.matched = 0            # ticks in a row on the predicted phase
+        self.missed = 0             # bursts in a row off it while locked
+        self.replyUntil = None      # prompts before this clock() answer a command, see expectReply
+        self.ticks = 0
+
+    def attach(self, parser):
+        parser.subscribe(CombatState, self.onCombatState)
+        parser.subscribe(CombatHit, self.onRoundLine)
+        parser.subscribe(DamageTally, self.onRoundLine)
+        parser.subscribe(Vitals, self.onVitals)
+
+    def locked(self):
+        return self.matched >= LOCK_TICKS
+
+    def onCombatState(self, event):
+        self.engaged = event.engaged
+        if event.engaged and self.lastTick is None:
+            self.lastTick = self.clock()
+
+    def onRoundLine(self, event):
+        self.observe(self.clock(), True)
+
+    def onVitals(self, event):
+        now = self.clock()
+        # once locked the phase check tells a round's prompt from a reply, before that the reply window does
+        self.observe(now, self.engaged and (self.locked() or self.replyUntil is None or now > self.replyUntil))
+
+    # a command went out, the prompt answering it (until `until`) isn't a round's
+    def expectReply(self, until):
+        self.replyUntil = until
+
+    # a round line (or prompt) at `now`, True if it started a tick
+    def observe(self, now, candidate):
+        last = self.lastLine
+        if last is not None and now - last <= self.burstGap:
+            self.lastLine = now
+            return False
+
+        self.lastLine = now
+        self.burstIsTick = candidate and self.tick(now)
+        return self.burstIsTick
+
+    def tick(self, now):
+        if self.lastTick is None:
+            self.lastTick = now
+            self.ticks += 1
+            return True
+
+        elapsed = now - self.lastTick
+        if elapsed < (1.0 - self.tolerance) * self.period:
+            return False
+
+        rounds = max(1, int(elapsed / self.period + 0.5))
+        onPhase = abs(elapsed - rounds * self.period) <= self.tolerance * self.period
+
+        if self.locked() and not onPhase:
+            self.missed += 1
+            if self.missed >= LOCK_TICKS:
+                self.matched = 0
+            return False
+
+        self.missed = 0
+        self.matched = self.matched + 1 if onPhase else 0
+        weight = LOCKED_WEIGHT if self.locked() else LEARN_WEIGHT
+        period = self.period + weight * (elapsed / rounds - self.period)
+        self.period = min(max(period, self.minPeriod), self.maxPeriod)
+        self.lastTick = now
+        self.ticks += 1
+        return True
+
+    # whether what arrives at `now` is part of a burst taken for a tick
+    def inTick(self, now):
+        return self.burstIsTick and self.lastLine is not None and now - self.lastLine <= self.burstGap
+
+    # whether `when` is too close to a predicted tick to tell a reply from the round's own output
+    def nearTick(self, when):
+        if not self.locked():
+            return False
+        offset = (when - self.lastTick) % self.period
+        return min(offset, self.period - offset) <= self.tolerance * self.period
+
+    # the first predicted tick after `when`, None until the clock is locked
+    def nextTick(self, when=None):
+        if not self.locked():
+            return None
+        if when is None:
+            when = self.clock()
+        return self.lastTick + (int((when - self.lastTick) // self.period) + 1) * self.period
+
+
+class QueuedCommand(object):
+    __slots__ = ("command", "priority", "order", "seen")
+
+    def __init__(self, command, priority, order, seen):
+        self.command = command
+        self.priority = priority
+        self.order = order
+        self.seen = seen
+
+
+class CommandScheduler(object):
+
+    # send(command) writes one command to the game
+    def __init__(self, send, roundClock, perRound=1, roundTrip=ROUND_TRIP, guard=GUARD, margin=MARGIN,
+                 staleRounds=STALE_ROUNDS, holdRounds=HOLD_ROUNDS):
+        self.send = send
+        self.roundClock = roundClock
+        self.clock = roundClock.clock
+        self.perRound = perRound
+        self.roundTrip = roundTrip
+        self.guard = guard
+        self.margin = margin
+        self.staleRounds = staleRounds
+        self.holdRounds = holdRounds
+
+        self.queue = {}             # key -> QueuedCommand
+        self.held = {}              # key -> clock() until which it counts as sent
+        self.order = 0
+        self.timer = None
+        self.roundTick = None       # the tick the commands sent this round land on (the end of the round, unlocked)
+        self.roundSent = 0
+        self.inFlight = deque()     # clock() of each send whose prompt hasn't come back
+
+        # stats
+        self.submitted = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def attach(self, parser):
+        parser.subscribe(Command, self.onCommand)
+        parser.subscribe(Vitals, self.onVitals)
+
+    def onCommand(self, event):
+        self.submit(event.command, PRIORITIES.get(event.kind, 0))
+
+    # the prompt that answers a command gives the round trip (a tick's prompt doesn't)
+    def onVitals(self, event):
+        inFlight = self.inFlight
+        if not inFlight:
+            return
+        now = self.clock()
+
+        # replies that never came (or were taken for a tick's prompt) stop counting
+        longest = self.roundTrip * ROUND_TRIP_RANGE
+        while inFlight and now - inFlight[0] > longest:
+            inFlight.popleft()
+        if not inFlight or self.roundClock.inTick(now) or self.roundClock.nearTick(now):
+            return
+
+        sample = now - inFlight.popleft()
+        # with more than one in flight it's not clear which this answers
+        if not inFlight and sample >= self.roundTrip / ROUND_TRIP_RANGE:
+            self.roundTrip += ROUND_TRIP_WEIGHT * (sample - self.roundTrip)
+
+    # queue a command, False if it's a repeat of one queued or just sent
+    def submit(self, command, priority=0, key=None):
+        key = command if key is None else key
+        now = self.clock()
+        self.submitted += 1
+
+        held = self.held.get(key)
+        if held is not None:
+            if now < held:
+                self.duplicates += 1
+                return False
+            del self.held[key]
+
+        entry = self.queue.get(key)
+        if entry is not None:
+            entry.seen = now
+            entry.priority = max(entry.priority, priority)
+            self.duplicates += 1
+            return False
+
+        self.order += 1
+        self.queue[key] = QueuedCommand(command, priority, self.order, now)
+        if self.timer is None:
+            self.timer = asyncio.get_running_loop().call_soon(self.flush)
+        return True
+
+    # send what can go this round, then wait for the next tick if anything is left
+    def flush(self):
+        self.timer = None
+        now = self.clock()
+        roundClock = self.roundClock
+
+        if self.staleRounds:
+            stale = now - self.staleRounds * roundClock.period
+            for key in [key for key, entry in self.queue.items() if entry.seen < stale]:
+                del self.queue[key]
+                self.dropped += 1
+        for key in [key for key, until in self.held.items() if until <= now]:
+            del self.held[key]
+
+        while self.queue:
+            arrival = now + self.roundTrip
+            tick = roundClock.nextTick(arrival)
+            if tick is None:
+                # no clock yet, perRound a period's worth of time so the server's queue can't pile up
+                if self.roundTick is None or now >= self.roundTick:
+                    self.roundTick = now + roundClock.period
+                    self.roundSent = 0
+                elif self.roundSent >= self.perRound:
+                    self.wait(self.roundTick - now)
+                    return
+                lands = arrival + roundClock.period
+            else:
+                if tick - arrival < self.guard:
+                    # it would race the tick, send it so it lands just after
+                    self.wait(tick + self.margin - self.roundTrip - now)
+                    return
+                if self.roundTick is not None and abs(tick - self.roundTick) < roundClock.period / 2:
+                    if self.roundSent >= self.perRound:
+                        self.wait(tick + self.margin - self.roundTrip - now)
+                        return
+                else:
+                    self.roundTick = tick
+                    self.roundSent = 0
+                lands = tick
+            self.roundSent += 1
+
+            key, entry = max(self.queue.items(), key=lambda item: (item[1].priority, -item[1].order))
+            del self.queue[key]
+            # suggesting it again before the round it lands in (and holdRounds more) has shown is old news
+            self.held[key] = lands + self.holdRounds * roundClock.period - self.guard
+            self.inFlight.append(now)
+            roundClock.expectReply(now + 2 * self.roundTrip)
+            self.sent += 1
+            self.send(entry.command)
+
+    def wait(self, delay):
+        self.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self.flush)
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "queued": len(self.queue),
+            "roundTrip": self.roundTrip,
+            "period": self.roundClock.period,
+            "locked": self.roundClock.locked(),
+        }
+
+
+####################################
+#       SIMULATED SERVER           #
+####################################
+# A stand-in for the game's round handling, enough to compare sending
+# strategies on one box:
+#   every `period` seconds a round ticks and the oldest queued command that got
+#   there at least `cutoff` before the tick is carried out (one action a round)
+#   "a <monster>" hits it (a few hits kill it), "g <pile>" takes the pile, either
+#   on something that isn't there any more is a wasted round
+#   each tick sends the round's output, the room's Also here / You notice, and a prompt
+#   monsters turn up and piles get dropped at random times mid-round
+#   every command is answered with a prompt as soon as it arrives
+#   everything is delayed `latency` seconds each way
+
+MONSTERS = ("kobold thief", "giant rat", "carrion beast", "cave bear")
+COINS = ("copper farthings", "silver nobles", "gold crowns")
+MONSTER_HITS = 3
+
+
+class SimulatedRoom(object):
+
+    def __init__(self):
+        self.monsters = {}          # name -> [hits left, spawned at]
+        self.piles = {}             # "7 silver nobles" -> dropped at
+        self.pending = []           # (arrived at, command)
+        self.useful = 0
+        self.wasted = 0
+        self.idle = 0
+        self.delays = []            # rounds from something turning up to acting on it
+
+    def listing(self):
+        lines = []
+        if self.monsters:
+            lines.append("Also here: %s.\r\n" % ", ".join(self.monsters))
+        if self.piles:
+            lines.append("You notice %s here.\r\n" % ", ".join(self.piles))
+        return lines
+
+
+class RoundServer(object):
+
+    def __init__(self, rounds=100, period=0.3, latency=0.03, cutoff=0.05, seed=1):
+        self.rounds = rounds
+        self.period = period
+        self.latency = latency
+        self.cutoff = cutoff
+        self.seed = seed
+        self.server = None
+        self.rooms = []
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        room = SimulatedRoom()
+        self.rooms.append(room)
+        chance = random.Random(self.seed)
+
+        def send(text):
+            loop.call_later(self.latency, writer.write, text.encode("cp437"))
+
+        def arrive(command):
+            room.pending.append((loop.time(), command))
+            send("[HP=49]:")
+
+        async def commands():
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                loop.call_later(self.latency, arrive, line.decode("cp437").strip())
+
+        listener = asyncio.ensure_future(commands())
+        start = loop.time()
+        send("*Combat Engaged*\r\n")
+        try:
+            for number in range(1, self.rounds + 1):
+                tick = start + number * self.period
+
+                # something turns up mid-round
+                if chance.random() < 0.5:
+                    await asyncio.sleep(max(0.0, start + (number - 1 + chance.random()) * self.period - loop.time()))
+                    if chance.random() < 0.5:
+                        name = chance.choice(MONSTERS)
+                        if name not in room.monsters:
+                            room.monsters[name] = [MONSTER_HITS, loop.time()]
+                    else:
+                        pile = "%d %s" % (chance.randint(2, 99), chance.choice(COINS))
+                        room.piles.setdefault(pile, loop.time())
+                    send("".join(room.listing()))
+
+                await asyncio.sleep(max(0.0, tick - loop.time()))
+                self.resolve(room, tick, send)
+        finally:
+            listener.cancel()
+            await asyncio.sleep(self.latency * 2)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def resolve(self, room, tick, send):
+        output = []
+        for index, (arrived, command) in enumerate(room.pending):
+            if arrived <= tick - self.cutoff:
+                del room.pending[index]
+                verb, _, target = command.partition(' ')
+                if verb == "a" and target in room.monsters:
+                    monster = room.monsters[target]
+                    if monster[0] == MONSTER_HITS:
+                        room.delays.append((tick - monster[1]) / self.period)
+                    monster[0] -= 1
+                    output.append("You whap %s for 7 damage!\r\n" % target)
+                    if monster[0] == 0:
+                        del room.monsters[target]
+                        output.append("You gain 20 experience.\r\n")
+                    room.useful += 1
+                elif verb == "g" and target in room.piles:
+                    room.delays.append((tick - room.piles.pop(target)) / self.period)
+                    output.append("You picked up %s.\r\n" % target)
+                    room.useful += 1
+                else:
+                    output.append("You don't see %s here!\r\n" % target)
+                    room.wasted += 1
+                break
+        else:
+            room.idle += 1
+        output.extend(room.listing())
+        output.append("[HP=49]:")
+        send("".join(output))
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+# one client against a RoundServer, sending Commands straight away or through a CommandScheduler
+async def simulate(rounds, scheduled, period=0.3, latency=0.03):
+    from majormudParser import majormudParser
+    from triggerEngine import RuleSet
+
+    server = RoundServer(rounds, period, latency)
+    port = await server.start()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    def send(command):
+        writer.write(command.encode("cp437") + b"\r\n")
+
+    rules = RuleSet.fromDicts([{"kind": "monster", "match": name, "command": "a {token}"} for name in MONSTERS])
+    parser = majormudParser(triggers=rules)
+    scheduler = None
+    if scheduled:
+        roundClock = RoundClock(period * 1.2, burstGap=period / 10)
+        roundClock.attach(parser)
+        scheduler = CommandScheduler(send, roundClock, roundTrip=2 * latency, guard=period / 5, margin=period / 30)
+        scheduler.attach(parser)
+    else:
+        parser.subscribe(Command, lambda event: send(event.command))
+
+    # the server hangs up after the last round, possibly with commands of ours still on the way
+    while True:
+        try:
+            data = await reader.read(4096)
+        except ConnectionResetError:
+            break
+        if not data:
+            break
+        parser.feed(data)
+    parser.flush()
+
+    if scheduler is not None:
+        scheduler.close()
+    writer.close()
+    await server.stop()
+    return server.rooms[0], scheduler
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Actions per round sending commands straight away vs through the scheduler")
+    args.add_argument("--rounds", type=int, default=60)
+    args.add_argument("--period", type=float, default=0.3, help="seconds per simulated round")
+    args.add_argument("--latency", type=float, nargs="+", default=[0.03, 0.1], help="seconds each way (one run per value)")
+    args = args.parse_args()
+
+    for latency in args.latency:
+        print("latency %.0f ms each way, %.0f ms rounds:" % (latency * 1e3, args.period * 1e3))
+        for label, scheduled in (("straight away", False), ("scheduled", True)):
+            room, scheduler = asyncio.run(simulate(args.rounds, scheduled, args.period, latency))
+            delays = sorted(room.delays)
+            print("  %-14s useful actions/round %.2f  wasted %3d  idle rounds %3d  rounds to act p50 %.1f  server backlog %d"
+                  % (label, room.useful / float(args.rounds), room.wasted, room.idle,
+                     delays[len(delays) // 2] if delays else 0.0, len(room.pending)))
+            if scheduler is not None:
+                stats = scheduler.stats()
+                print("  %-14s sent %d of %d suggested (%d repeats, %d dropped stale), period %.3f s (locked %s), round trip %.3f s"
+                      % ("", stats["sent"], stats["submitted"], stats["duplicates"], stats["dropped"], stats["period"],
+                         stats["locked"], stats["roundTrip"]))
@@ -0,0 +1,369 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Shortest paths over the learned room graph, turned into movement commands
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Works straight on RoomGraph's flat link array:
+#
+#   bfs(start, goal)      fewest moves, ignores doors and danger
+#   route(start, goal)    A* with costs: every move costs 1, going through a
+#                         closed door adds closedDoorCost, walking into a
+#                         hostile room adds its cost (setHostile())
+#
+# A* gets its estimate from landmarks (the ALT trick): BFS move counts from a
+# few spread out rooms are computed once, and since
+# dist(L, goal) <= dist(L, room) + dist(room, goal) the difference is a lower
+# bound on the moves left, and every move costs at least 1.
+#
+# Finished routes are cached and thrown away as soon as the graph's version
+# changes (a new room, a new link, a door opening, ...). Landmark distances are
+# kept and caught up instead: new rooms start out unreachable and a new link
+# only ever shortens distances, so a short BFS from where it leads fixes them
+# (doors don't matter, the distances are move counts). They are only built
+# again when a link changed to lead somewhere else, the graph's link log no
+# longer reaches back far enough, or the world doubled in size since and the
+# landmarks are no longer spread out over it.
+#
+#   python routePlanner.py            benchmarks 10k/30k/100k room synthetic worlds
+
+import heapq
+import random
+import time
+from array import array
+from collections import deque
+
+from roomGraph import DIRECTION_COMMANDS, DIRECTIONS, NO_ROOM, RoomGraph
+
+INFINITY = float("inf")
+
+# BFS distances are stored as 'i', rooms we can't reach get this
+UNREACHABLE = 2**31 - 1
+
+
+class RoutePlanner(object):
+
+    def __init__(self, graph, closedDoorCost=5.0, landmarkCount=8, cacheSize=1024):
+        self.graph = graph
+        self.closedDoorCost = closedDoorCost
+        self.landmarkCount = landmarkCount
+        self.cacheSize = cacheSize
+
+        # room id -> extra cost for walking into it
+        self.hostile = {}
+
+        # caches, only valid for cacheVersion of the graph
+        self.cacheVersion = None
+        self.landmarks = None           # [(room id, array of BFS distances from it), ...]
+        self.landmarkChanges = 0        # graph.linkChanges the landmark distances include
+        self.landmarkRooms = 0          # rooms in the graph when the landmarks were picked
+        self.routes = {}                # (start, goal) -> list of direction indexes
+
+    # rooms we'd rather not walk through, e.g. {roomId: 20}
+    def setHostile(self, roomId, cost):
+        if cost:
+            self.hostile[roomId] = cost
+        else:
+            self.hostile.pop(roomId, None)
+        self.routes = {}
+
+    # throw the routes away if the graph changed since they were found, and catch
+    # the landmarks up (or drop them, route() builds them again)
+    def checkCache(self):
+        if self.cacheVersion != self.graph.version:
+            self.cacheVersion = self.graph.version
+            self.routes = {}
+            if self.landmarks is not None and not self.updateLandmarks():
+                self.landmarks = None
+
+    ####################################
+    #       BFS                        #
+    ####################################
+
+    # moves from start to every room (UNREACHABLE where there's no way)
+    def distancesFrom(self, start):
+        links = self.graph.links
+        width = len(DIRECTIONS)
+        distance = array("i", [UNREACHABLE]) * len(self.graph)
+        distance[start] = 0
+
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            nextDistance = distance[room] + 1
+            base = room * width
+            for slot in range(base, base + width):
+                neighbour = links[slot]
+                if neighbour != NO_ROOM and distance[neighbour] == UNREACHABLE:
+                    distance[neighbour] = nextDistance
+                    queue.append(neighbour)
+        return distance
+
+    # fewest moves from start to goal, as direction indexes (None if there's no way)
+    def bfs(self, start, goal):
+        if start == goal:
+            return []
+
+        links = self.graph.links
+        width = len(DIRECTIONS)
+        cameFrom = {start: None}
+
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            base = room * width
+            for direction in range(width):
+                neighbour = links[base + direction]
+                if neighbour == NO_ROOM or neighbour in cameFrom:
+                    continue
+                cameFrom[neighbour] = (room, direction)
+                if neighbour == goal:
+                    return self.unwind(cameFrom, goal)
+                queue.append(neighbour)
+        return None
+
+    def unwind(self, cameFrom, goal):
+        path = []
+        step = cameFrom[goal]
+        while step is not None:
+            room, direction = step
+            path.append(direction)
+            step = cameFrom[room]
+        path.reverse()
+        return path
+
+    ####################################
+    #       LANDMARKS                  #
+    ####################################
+
+    # pick landmarks far apart (each one the room furthest from the ones so far)
+    def buildLandmarks(self):
+        rooms = len(self.graph)
+        landmarks = []
+        if rooms == 0:
+            self.landmarks = landmarks
+            return
+
+        # moves from each room to its nearest landmark so far
+        nearest = array("i", [UNREACHABLE]) * rooms
+
+        candidate = 0
+        for _ in range(min(self.landmarkCount, rooms)):
+            distance = self.distancesFrom(candidate)
+            landmarks.append((candidate, distance))
+            nearest = array("i", map(min, nearest, distance))
+
+            # the next landmark is the reachable room furthest from every landmark so far
+            bestDistance = max((moves for moves in nearest if moves != UNREACHABLE), default=0)
+            if bestDistance == 0:
+                break
+            candidate = nearest.index(bestDistance)
+
+        self.landmarks = landmarks
+        self.landmarkChanges = self.graph.linkChanges
+        self.landmarkRooms = rooms
+
+        # the distances are for this version of the graph, so the first route() doesn't redo them
+        if self.cacheVersion != self.graph.version:
+            self.cacheVersion = self.graph.version
+            self.routes = {}
+
+    # apply the rooms and links added since the landmarks were built, False if
+    # they have to be built again instead
+    def updateLandmarks(self):
+        graph = self.graph
+        rooms = len(graph)
+        if rooms > 2 * self.landmarkRooms:
+            return False
+
+        log = graph.linkLog
+        missed = graph.linkChanges - self.landmarkChanges
+        if missed > len(log):
+            return False
+        changes = [log[index] for index in range(len(log) - missed, len(log))]
+
+        # a link that used to lead somewhere else can make rooms further apart
+        for _, _, before in changes:
+            if before != NO_ROOM:
+                return False
+
+        for _, distance in self.landmarks:
+            if len(distance) < rooms:
+                distance.extend(array("i", [UNREACHABLE]) * (rooms - len(distance)))
+            for fromRoom, toRoom, _ in changes:
+                if distance[fromRoom] != UNREACHABLE and distance[fromRoom] + 1 < distance[toRoom]:
+                    distance[toRoom] = distance[fromRoom] + 1
+                    self.shorten(distance, toRoom)
+
+        self.landmarkChanges = graph.linkChanges
+        return True
+
+    # BFS on from a room whose distance just went down, lowering every distance that can go with it
+    def shorten(self, distance, start):
+        links = self.graph.links
+        width = len(DIRECTIONS)
+
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            nextDistance = distance[room] + 1
+            base = room * width
+            for slot in range(base, base + width):
+                neighbour = links[slot]
+                if neighbour != NO_ROOM and nextDistance < distance[neighbour]:
+                    distance[neighbour] = nextDistance
+                    queue.append(neighbour)
+
+    # lower bound on the moves from room to goal
+    def estimate(self, room, goal):
+        best = 0
+        for _, distance in self.landmarks:
+            toGoal = distance[goal]
+            toRoom = distance[room]
+            if toGoal != UNREACHABLE and toRoom != UNREACHABLE and toGoal - toRoom > best:
+                best = toGoal - toRoom
+        return best
+
+    ####################################
+    #       A*                         #
+    ####################################
+
+    # cheapest route from start to goal as direction indexes (None if there's no way)
+    def route(self, start, goal):
+        self.checkCache()
+        key = (start, goal)
+        cached = self.routes.get(key)
+        if cached is not None:
+            return cached
+
+        if self.landmarks is None:
+            self.buildLandmarks()
+
+        path = self.astar(start, goal)
+        if path is not None:
+            if len(self.routes) >= self.cacheSize:
+                self.routes.pop(next(iter(self.routes)))
+            self.routes[key] = path
+        return path
+
+    def astar(self, start, goal):
+        if start == goal:
+            return []
+
+        graph = self.graph
+        links = graph.links
+        closedMask = graph.closedMask
+        hostile = self.hostile
+        doorCost = self.closedDoorCost
+        estimate = self.estimate
+        width = len(DIRECTIONS)
+
+        cost = {start: 0.0}
+        cameFrom = {start: None}
+        heap = [(estimate(start, goal), 0.0, start)]
+
+        while heap:
+            _, spent, room = heapq.heappop(heap)
+            if room == goal:
+                return self.unwind(cameFrom, goal)
+            if spent > cost[room]:
+                continue
+
+            base = room * width
+            closed = closedMask[room]
+            for direction in range(width):
+                neighbour = links[base + direction]
+                if neighbour == NO_ROOM:
+                    continue
+
+                step = spent + 1.0
+                if closed >> direction & 1:
+                    step += doorCost
+                if hostile:
+                    step += hostile.get(neighbour, 0)
+
+                if step < cost.get(neighbour, INFINITY):
+                    cost[neighbour] = step
+                    cameFrom[neighbour] = (room, direction)
+                    heapq.heappush(heap, (step + estimate(neighbour, goal), step, neighbour))
+        return None
+
+    # the commands to type for a path of direction indexes
+    def commands(self, path):
+        return [DIRECTION_COMMANDS[direction] for direction in path]
+
+    # commands to walk from start to goal (None if there's no way)
+    def routeCommands(self, start, goal):
+        path = self.route(start, goal)
+        if path is None:
+            return None
+        return self.commands(path)
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+# a width x height grid of rooms, with some exits missing and some doors closed
+def syntheticGraph(width, height, missing=0.1, closed=0.05, seed=1):
+    randomizer = random.Random(seed)
+    graph = RoomGraph()
+    moves = ((0, -1, 0), (0, 1, 1), (1, 0, 2), (-1, 0, 3))
+
+    for y in range(height):
+        for x in range(width):
+            mask = 0
+            for dx, dy, direction in moves:
+                if 0 <= x + dx < width and 0 <= y + dy < height:
+                    mask |= 1 << direction
+            graph.intern("Room %d,%d" % (x, y), mask)
+
+    for y in range(height):
+        for x in range(width):
+            room = y * width + x
+            for dx, dy, direction in moves:
+                if graph.exitMask[room] >> direction & 1 and randomizer.random() >= missing:
+                    graph.link(room, direction, (y + dy) * width + (x + dx))
+                    if randomizer.random() < closed:
+                        graph.closedMask[room] |= 1 << direction
+    return graph
+
+
+if __name__ == "__main__":
+    for width, height in ((100, 100), (200, 150), (400, 250)):
+        graph = syntheticGraph(width, height)
+        rooms = len(graph)
+        planner = RoutePlanner(graph)
+        randomizer = random.Random(2)
+        pairs = [(randomizer.randrange(len(graph)), randomizer.randrange(len(graph))) for _ in range(50)]
+
+        began = time.perf_counter()
+        for start, goal in pairs:
+            planner.bfs(start, goal)
+        bfsTime = (time.perf_counter() - began) / len(pairs)
+
+        began = time.perf_counter()
+        planner.buildLandmarks()
+        landmarkTime = time.perf_counter() - began
+
+        began = time.perf_counter()
+        for start, goal in pairs:
+            planner.route(start, goal)
+        astarTime = (time.perf_counter() - began) / len(pairs)
+
+        began = time.perf_counter()
+        for start, goal in pairs:
+            planner.route(start, goal)
+        cachedTime = (time.perf_counter() - began) / len(pairs)
+
+        # exploring: a new room linked into the world, then the next route
+        start, goal = pairs[0]
+        began = time.perf_counter()
+        room = graph.intern("Newly found room", 1 << 9)
+        graph.link(room, 9, goal)
+        graph.link(goal, 8, room)
+        planner.route(start, goal)
+        exploreTime = time.perf_counter() - began
+
+        print("%6d rooms: bfs %7.2f ms  landmarks %7.1f ms (once)  A* %7.2f ms  cached %6.2f us  after a new room %7.2f ms"
+              % (rooms, bfsTime * 1e3, landmarkTime * 1e3, astarTime * 1e3, cachedTime * 1e6, exploreTime * 1e3))
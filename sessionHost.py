@@ -0,0 +1,191 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Run many MajorMUD characters (parser sessions) in one process with asyncio
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# Every session gets its own majormudParser (its own state) fed straight from an
+# asyncio StreamReader with feed(), while all of them share one read-only
+# GameDatabase. Backpressure comes from asyncio itself: a session only reads its
+# next chunk once the previous one is parsed, and the StreamReader pauses the
+# socket once more than `limit` bytes are waiting, so a slow session can't make
+# the process buffer without bound.
+#
+# ReplayServer is a stand-in for the game: a local telnet-ish server that sends
+# a capture (like 2025-03-31_10-56-19.log) to every client that connects, so
+# hundreds of sessions can be load tested on one box:
+#
+#   python sessionHost.py --sessions 300 --capture 2025-03-31_10-56-19.log
+
+import argparse
+import asyncio
+import time
+
+from gameDatabase import GameDatabase
+from majormudParser import majormudParser
+from parserStats import SampleRing, percentile
+
+READ_SIZE = 4096
+READ_LIMIT = 64 * 1024
+
+
+class ParserSession(object):
+
+    def __init__(self, name, database=None):
+        self.name = name
+        self.parser = majormudParser(database=database)
+
+        # stats
+        self.bytesIn = 0
+        self.chunks = 0
+        self.latencies = SampleRing()   # seconds spent parsing each of the last SAMPLE_SIZE chunks
+        self.maxLatency = 0.0
+        self.started = None
+        self.finished = None
+
+    # read until EOF, parsing every chunk as it arrives
+    async def run(self, reader):
+        self.started = time.perf_counter()
+        parser = self.parser
+        latencies = self.latencies
+
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                break
+
+            start = time.perf_counter()
+            parser.feed(data)
+            latency = time.perf_counter() - start
+            latencies.add(latency)
+            if latency > self.maxLatency:
+                self.maxLatency = latency
+
+            self.bytesIn += len(data)
+            self.chunks += 1
+
+        parser.flush()
+        self.finished = time.perf_counter()
+
+    # connect to a server and run until it hangs up
+    async def connect(self, host, port):
+        reader, writer = await asyncio.open_connection(host, port, limit=READ_LIMIT)
+        try:
+            await self.run(reader)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    def stats(self):
+        latencies = self.latencies.sorted()
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        return {
+            "name": self.name,
+            "bytes": self.bytesIn,
+            "chunks": self.chunks,
+            "elapsed": elapsed,
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "max": self.maxLatency,
+        }
+
+
+class SessionHost(object):
+
+    # database is shared (read-only) by every session, one is created if not given
+    def __init__(self, database=None):
+        if database is None:
+            database = GameDatabase()
+        self.database = database
+        self.sessions = []
+
+    def addSession(self, name):
+        session = ParserSession(name, self.database)
+        self.sessions.append(session)
+        return session
+
+    # run every session against host:port concurrently
+    async def run(self, host, port):
+        await asyncio.gather(*[session.connect(host, port) for session in self.sessions])
+
+    # totals plus latency percentiles over the recent chunks of every session
+    def report(self):
+        latencies = sorted(latency for session in self.sessions for latency in session.latencies.sorted())
+        return {
+            "sessions": len(self.sessions),
+            "bytes": sum(session.bytesIn for session in self.sessions),
+            "chunks": sum(session.chunks for session in self.sessions),
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "max": max([session.maxLatency for session in self.sessions] or [0.0]),
+            "perSession": [session.stats() for session in self.sessions],
+        }
+
+
+class ReplayServer(object):
+
+    # capture is replayed to every client, linesPerSecond=0 sends it as fast as possible
+    def __init__(self, capturePath, linesPerSecond=0, chunkLines=20):
+        with open(capturePath, "rb") as file:
+            lines = file.read().splitlines(True)
+
+        # telnet line endings
+        lines = [line.rstrip(b"\r\n") + b"\r\n" if line.endswith(b"\n") else line for line in lines]
+        self.chunks = [b"".join(lines[i:i + chunkLines]) for i in range(0, len(lines), chunkLines)]
+        self.delay = chunkLines / float(linesPerSecond) if linesPerSecond else 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            for chunk in self.chunks:
+                writer.write(chunk)
+
+                # drain() blocks while the client's socket is full, that's the backpressure
+                await writer.drain()
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def loadTest(capturePath, sessionCount, linesPerSecond):
+    server = ReplayServer(capturePath, linesPerSecond)
+    port = await server.start()
+
+    host = SessionHost()
+    for index in range(sessionCount):
+        host.addSession("session%d" % index)
+
+    start = time.perf_counter()
+    await host.run("127.0.0.1", port)
+    elapsed = time.perf_counter() - start
+
+    await server.stop()
+    return host.report(), elapsed
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="Load test many parser sessions against a replayed capture")
+    args.add_argument("--capture", default="2025-03-31_10-56-19.log")
+    args.add_argument("--sessions", type=int, default=100)
+    args.add_argument("--rate", type=int, default=0, help="lines per second per session (0 = as fast as possible)")
+    args = args.parse_args()
+
+    report, elapsed = asyncio.run(loadTest(args.capture, args.sessions, args.rate))
+
+    print("sessions:        %d" % report["sessions"])
+    print("bytes parsed:    %d (%.1f MB/s)" % (report["bytes"], report["bytes"] / elapsed / 1e6))
+    print("wall time:       %.3f s" % elapsed)
+    print("chunk latency:   p50 %.1f us  p99 %.1f us  max %.1f us" % (report["p50"] * 1e6, report["p99"] * 1e6, report["max"] * 1e6))
+    slowest = max(report["perSession"], key=lambda stats: stats["p99"])
+    print("slowest session: %s p99 %.1f us" % (slowest["name"], slowest["p99"] * 1e6))
@@ -0,0 +1,239 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Precomputed index of what every shop sells, for how much, and to whom
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# A shop row lists its stock in twenty slots (Item-N, Max-N, Time-N, Amount-N,
+# %-N) next to Markup%, MinLVL/MaxLVL and ClassRest, and the price lives on
+# the item (Price in its Currency, ClassRest-0..9 for who may use it). Asking
+# "where can a Priest buy a torch cheapest" by walking all that per question
+# doesn't scale, so ShopIndex walks it once, straight off the columnar
+# snapshots (gameSnapshot.py), into ShopOffers:
+#
+#   offersByItem        item Number -> offers, cheapest first
+#   offersByShop        shop Number -> offers, in slot order
+#   offersByClass       (item Number, class Number) -> offers that class may buy, cheapest first
+#   buyableByClass      class Number -> the cheapest offer of every item it may buy
+#
+# so the gear planning questions are a dict hit (plus a level check on what
+# is usually the first offer). Class 0 in the class keyed maps means "any".
+#
+# The snapshots are rebuilt whenever their json changes, and refresh() asks
+# the database whether shops or items changed and rebuilds the index if so,
+# so a long running bot can pick up edited data files.
+#
+#   shops = ShopIndex(database)
+#   shops.cheapest(175, "Priest", level=3)      # torch
+#   shops.offersByShop[3]                       # the General Store
+#
+#   python shopIndex.py [item name] [class] [level]     build time, lookup time, an example query
+
+from collections import namedtuple
+
+from itemResolver import COIN_VALUE
+
+# one slot of one shop
+#   price:            what the shop asks, after markup, in `currency` (itemResolver.COPPER ... RUNIC)
+#   copper:           the same in copper, for comparing across currencies
+#   maxStock:         most the shop holds
+#   restockMinutes:   how often it restocks, restockAmount of them with restockChance %
+#   minLevel/maxLevel the shop's level range, None for the (vast majority of) shops with a placeholder
+#                     there (1/1, 0/0, 500/500) instead of a real range
+#   shopClass:        the only class the shop serves, 0 for all of them
+#   itemClasses:      classes that may use the item, () for all of them
+ShopOffer = namedtuple("ShopOffer", ["item", "itemName", "shop", "shopName", "slot", "price", "currency", "copper",
+                                     "maxStock", "restockMinutes", "restockAmount", "restockChance",
+                                     "minLevel", "maxLevel", "shopClass", "itemClasses"])
+
+# class Number standing for "whoever"
+ANY_CLASS = 0
+
+
+def levelAllows(offer, level):
+    return offer.minLevel is None or offer.minLevel <= level <= offer.maxLevel
+
+
+class ShopIndex(object):
+
+    def __init__(self, database):
+        self.database = database
+        self.build()
+
+    # True (and the index rebuilt) if shops-v1.11p.json or items-v1.11p.json changed since the last build
+    def refresh(self):
+        changed = self.database.reloadIfChanged("shops")
+        changed = self.database.reloadIfChanged("items") or changed
+        if changed:
+            self.build()
+        return changed
+
+    def build(self):
+        shops = self.database.snapshot("shops")
+        items = self.database.snapshot("items")
+
+        # class name (lower case) -> Number
+        classes = self.database.snapshot("classes")
+        classNumbers = classes.column("Number")
+        self.classNumbers = {classes.value(row, "Name").lower(): classNumbers[row] for row in range(classes.rows)}
+
+        price = items.column("Price")
+        currency = items.column("Currency")
+        itemClassRest = items.column("ClassRest")
+        classWidth = items.width("ClassRest")
+
+        shopNumbers = shops.column("Number")
+        inGame = shops.column("In Game")
+        markup = shops.column("Markup%")
+        minLevel = shops.column("MinLVL")
+        maxLevel = shops.column("MaxLVL")
+        shopClassRest = shops.column("ClassRest")
+        slots = shops.column("Item")
+        maxStock = shops.column("Max")
+        restockTime = shops.column("Time")
+        restockAmount = shops.column("Amount")
+        restockChance = shops.column("%")
+        width = shops.width("Item")
+
+        offersByItem = {}
+        offersByShop = {}
+        for row in range(shops.rows):
+            if not inGame[row]:
+                continue
+            shop = shopNumbers[row]
+            shopName = shops.value(row, "Name")
+            offers = []
+            for slot in range(width):
+                cell = row * width + slot
+                item = slots[cell]
+                if not item:
+                    continue
+                itemRow = items.rowForNumber(item)
+                if itemRow is None:
+                    continue
+
+                levels = (minLevel[row], maxLevel[row]) if maxLevel[row] > minLevel[row] else (None, None)
+                # Markup% 0 (the General Store, the spell shops, ...) means the list price, not free
+                cost = price[itemRow] * markup[row] // 100 if markup[row] else price[itemRow]
+                coins = currency[itemRow]
+                allowed = tuple(number for number in itemClassRest[itemRow * classWidth:(itemRow + 1) * classWidth] if number)
+                offer = ShopOffer(item, items.value(itemRow, "Name"), shop, shopName, slot, cost, coins,
+                                  cost * COIN_VALUE[coins] if 0 <= coins < len(COIN_VALUE) else cost,
+                                  maxStock[cell], restockTime[cell], restockAmount[cell], restockChance[cell],
+                                  levels[0], levels[1], shopClassRest[row], allowed)
+                offers.append(offer)
+                offersByItem.setdefault(item, []).append(offer)
+            if offers:
+                offersByShop[shop] = tuple(offers)
+
+        cheapestFirst = lambda offer: (offer.copper, offer.shop, offer.slot)
+        self.offersByItem = {item: tuple(sorted(offers, key=cheapestFirst)) for item, offers in offersByItem.items()}
+        self.offersByShop = offersByShop
+
+        # per class: which offers it may take (shop serves it and it may use the item)
+        self.offersByClass = {}
+        self.buyableByClass = {}
+        for classNumber in [ANY_CLASS] + sorted(self.classNumbers.values()):
+            buyable = []
+            for item, offers in self.offersByItem.items():
+                allowed = tuple(offer for offer in offers if self.allows(offer, classNumber))
+                if allowed:
+                    self.offersByClass[item, classNumber] = allowed
+                    buyable.append(allowed[0])
+            self.buyableByClass[classNumber] = buyable
+
+    def allows(self, offer, classNumber):
+        if classNumber == ANY_CLASS:
+            return True
+        if offer.shopClass and offer.shopClass != classNumber:
+            return False
+        return not offer.itemClasses or classNumber in offer.itemClasses
+
+    # class name or Number -> Number (ANY_CLASS for None)
+    def classNumber(self, className):
+        if className is None:
+            return ANY_CLASS
+        if isinstance(className, int):
+            return className
+        number = self.classNumbers.get(className.lower())
+        if number is None:
+            raise KeyError("unknown class %r" % (className,))
+        return number
+
+    # item name or Number -> Number (None if there's no such item)
+    def itemNumber(self, item):
+        if isinstance(item, int):
+            return item
+        record = self.database.items.byName(item)
+        return None if record is None else record["Number"]
+
+    ####################################
+    #       QUERIES                    #
+    ####################################
+
+    # every offer for an item a class may take, cheapest first (level: only shops serving that level)
+    def offers(self, item, className=None, level=None):
+        offers = self.offersByClass.get((self.itemNumber(item), self.classNumber(className)), ())
+        if level is None:
+            return offers
+        return tuple(offer for offer in offers if levelAllows(offer, level))
+
+    # the cheapest place a class can buy an item, None if nowhere
+    def cheapest(self, item, className=None, level=None):
+        for offer in self.offersByClass.get((self.itemNumber(item), self.classNumber(className)), ()):
+            if level is None or levelAllows(offer, level):
+                return offer
+        return None
+
+    # what a shop sells
+    def inventory(self, shop):
+        return self.offersByShop.get(shop, ())
+
+    # the cheapest offer of everything a class can buy (at a level), e.g. to plan gear upgrades
+    def buyable(self, className=None, level=None):
+        offers = self.buyableByClass.get(self.classNumber(className), ())
+        if level is None:
+            return offers
+        # the cheapest offer may be at a shop out of our level range, fall back to the next
+        return [offer for offer in (self.cheapest(offer.item, className, level) for offer in offers) if offer is not None]
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from gameDatabase import GameDatabase
+    from itemResolver import CURRENCY_NAMES
+
+    itemName = sys.argv[1] if len(sys.argv) > 1 else "torch"
+    className = sys.argv[2] if len(sys.argv) > 2 else "Priest"
+    level = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    database = GameDatabase()
+    began = time.perf_counter()
+    shops = ShopIndex(database)
+    elapsed = time.perf_counter() - began
+    print("built in %.1f ms: %d shops, %d items, %d offers" % (elapsed * 1e3, len(shops.offersByShop), len(shops.offersByItem),
+                                                             sum(len(offers) for offers in shops.offersByItem.values())))
+
+    currencies = {number: name for name, number in CURRENCY_NAMES.items() if not name.endswith("s")}
+    print("%s for a %s%s:" % (itemName, className, "" if level is None else " at level %d" % level))
+    for offer in shops.offers(itemName, className, level):
+        print("  %-28s %6d %-16s restock %d every %d min (%d%%)" % (offer.shopName, offer.price, currencies.get(offer.currency, "?"),
+                                                                  offer.restockAmount, offer.restockMinutes, offer.restockChance))
+
+    number = shops.itemNumber(itemName)
+    rounds = 100000
+    began = time.perf_counter()
+    for _ in range(rounds):
+        shops.cheapest(number, className, level)
+    elapsed = time.perf_counter() - began
+    print("cheapest(): %.2f us" % (elapsed / rounds * 1e6))
+
+    began = time.perf_counter()
+    shops.refresh()
+    print("refresh() with nothing changed: %.1f us" % ((time.perf_counter() - began) * 1e6))
@@ -0,0 +1,282 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Where every monster spawns (lairs, roaming groups, fixed rooms) and which rooms are worth hunting (NumPy)
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# A monster's "Summoned By" lists the rooms it appears in, sometimes hundreds:
+#
+#   [1]Group(lair): 1/8,Group: 1/19,[2]Group(lair): 1/66,Room 1/398, Spell #12, Textblock #5(50%)
+#
+#   [N]Group(lair): map/room    a lair, up to N of them wait there
+#   Group: map/room             part of the area its group roams
+#   Room map/room               placed in that one room
+#   (spells and textblocks summon it from scripts, they don't tie it to a room)
+#
+# SpawnIndex parses all of them once, straight off the monsters snapshot
+# (gameSnapshot.py), into one table of spawn entries held as NumPy arrays
+# (room, monster row, kind, group size), kept in two orders so both
+# directions are a slice:
+#
+#   room -> monsters    entries sorted by room, roomStart[i]..roomStart[i + 1] for roomKeys[i]
+#   monster -> rooms    byMonster sorted by monster row, monsterStart[row]..monsterStart[row + 1]
+#
+# Rooms are "map/room" in the data and are kept as one int, map << 16 | room.
+#
+# Every entry also gets what it is worth to walk into its room:
+#
+#   expected count      lair/room: the group size; roaming: 1 / rooms it roams over
+#   expected exp        count * EXP * ExpMulti
+#   expected drops      count * sum(DropItem% / 100), and their shop value in copper
+#
+# summed per room with bincount, and the rooms are pre-sorted by each, so
+# "the best hunting grounds in the world" is a slice of a sorted array.
+# bestRooms(monsters=mask) re-ranks for a subset of monsters (e.g. only the
+# ones monsterThreat.ThreatTable says are safe) with one weighted bincount.
+#
+# The model ignores respawn time (a camped lair won't always be full) and
+# assumes a roaming monster is equally likely to be anywhere in its range.
+#
+#   spawns = SpawnIndex(database)
+#   spawns.monstersInRoom("1/8")
+#   spawns.bestRooms(10, by=EXP, monsters=threatTable.inGame & (threatTable.damageToKill < 40))
+#
+#   python spawnIndex.py [monster name]      build time, where it spawns, the best rooms in the world
+
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from itemResolver import COIN_VALUE
+
+# entry kinds
+ROAMING = 0
+LAIR = 1
+PLACED = 2
+KIND_NAMES = ("roaming", "lair", "room")
+
+# what to rank rooms by
+EXP = "exp"
+DROPS = "drops"
+DROP_VALUE = "dropValue"
+
+# "[2]Group(lair): 1/66", "Group: 1/19" (one has a stray '+'), "Room 1/398"
+SPAWN = re.compile(r"(?:\[(\d+)\])?Group(\(lair\))?: (\d+)/(\d+)|Room (\d+)/(\d+)")
+
+
+def roomKey(mapNumber, room):
+    return mapNumber << 16 | room
+
+
+# "1/8" <-> 65544
+def parseRoom(text):
+    mapNumber, _, room = text.partition("/")
+    return roomKey(int(mapNumber), int(room))
+
+
+def roomName(key):
+    return "%d/%d" % (key >> 16, key & 0xFFFF)
+
+
+class SpawnIndex(object):
+
+    def __init__(self, database):
+        if numpy is None:
+            raise ImportError("spawnIndex needs numpy (pip install numpy)")
+
+        monsters = database.snapshot("monsters")
+        self.snapshot = monsters
+        self.rows = monsters.rows
+
+        # parse every "Summoned By" once
+        rooms = []
+        rowsOf = []
+        kinds = []
+        sizes = []
+        summoned = monsters.column("Summoned By")
+        for row in range(monsters.rows):
+            text = monsters.string(summoned[row])
+            if not text:
+                continue
+            for match in SPAWN.finditer(text):
+                if match.group(5) is not None:
+                    rooms.append(roomKey(int(match.group(5)), int(match.group(6))))
+                    kinds.append(PLACED)
+                    sizes.append(1)
+                else:
+                    rooms.append(roomKey(int(match.group(3)), int(match.group(4))))
+                    lair = match.group(2) is not None
+                    kinds.append(LAIR if lair else ROAMING)
+                    sizes.append(int(match.group(1) or 1) if lair else 1)
+                rowsOf.append(row)
+
+        room = numpy.array(rooms, dtype=numpy.int32)
+        monster = numpy.array(rowsOf, dtype=numpy.int32)
+        kind = numpy.array(kinds, dtype=numpy.int8)
+        size = numpy.array(sizes, dtype=numpy.int8)
+
+        # room order, and the CSR offsets into it
+        order = numpy.lexsort((monster, room))
+        self.entryRoom = room[order]
+        self.entryMonster = monster[order]
+        self.entryKind = kind[order]
+        self.entrySize = size[order]
+        self.roomKeys, roomIndex = numpy.unique(self.entryRoom, return_inverse=True)
+        self.entryRoomIndex = roomIndex.astype(numpy.int32)
+        self.roomStart = numpy.searchsorted(self.entryRoom, self.roomKeys).astype(numpy.int32)
+        self.roomStart = numpy.append(self.roomStart, numpy.int32(len(order)))
+
+        # monster order over the same entries
+        self.byMonster = numpy.argsort(self.entryMonster, kind="stable").astype(numpy.int32)
+        self.monsterStart = numpy.searchsorted(self.entryMonster[self.byMonster], numpy.arange(self.rows + 1)).astype(numpy.int32)
+
+        # per monster (snapshot row): exp and drops per kill
+        def column(name):
+            values = numpy.array(monsters.column(name), dtype=numpy.float64)
+            width = monsters.width(name)
+            return values.reshape(self.rows, width) if width > 1 else values
+
+        self.numbers = column("Number").astype(numpy.int64)
+        self.rowByNumber = {int(number): row for row, number in enumerate(self.numbers)}
+        self.inGame = column("In Game") > 0
+        self.expPerKill = column("EXP") * numpy.maximum(column("ExpMulti"), 1.0)
+        dropChance = numpy.nan_to_num(column("DropItem%")) / 100.0
+        self.dropsPerKill = dropChance.sum(axis=1)
+        self.dropValuePerKill = (dropChance * self.itemValues(database, column("DropItem"))).sum(axis=1)
+
+        # expected count of each entry's monster in its room per visit
+        roamingRooms = numpy.bincount(self.entryMonster, weights=(self.entryKind == ROAMING), minlength=self.rows)
+        count = numpy.where(self.entryKind == ROAMING,
+                            1.0 / numpy.maximum(roamingRooms[self.entryMonster], 1.0), self.entrySize.astype(numpy.float64))
+        self.entryCount = numpy.where(self.inGame[self.entryMonster], count, 0.0)
+
+        # per room totals, and the rooms sorted by each
+        self.entryValues = {
+            EXP: self.entryCount * self.expPerKill[self.entryMonster],
+            DROPS: self.entryCount * self.dropsPerKill[self.entryMonster],
+            DROP_VALUE: self.entryCount * self.dropValuePerKill[self.entryMonster],
+        }
+        self.roomValues = {}
+        self.roomOrder = {}
+        for name, values in self.entryValues.items():
+            totals = numpy.bincount(self.entryRoomIndex, weights=values, minlength=len(self.roomKeys))
+            self.roomValues[name] = totals
+            self.roomOrder[name] = numpy.argsort(-totals, kind="stable")
+
+    # copper value of every item Number in `numbers` (0 for none/unknown)
+    def itemValues(self, database, numbers):
+        items = database.snapshot("items")
+        itemNumbers = numpy.array(items.column("Number"), dtype=numpy.int64)
+        coins = numpy.array([COIN_VALUE[currency] if 0 <= currency < len(COIN_VALUE) else 1
+                             for currency in items.column("Currency")], dtype=numpy.float64)
+        values = numpy.array(items.column("Price"), dtype=numpy.float64) * coins
+
+        # Number -> value through a dense lookup array
+        lookup = numpy.zeros(int(itemNumbers.max()) + 1 if len(itemNumbers) else 1)
+        lookup[itemNumbers] = values
+        numbers = numpy.nan_to_num(numbers).astype(numpy.int64)
+        known = (numbers > 0) & (numbers < len(lookup))
+        return numpy.where(known, lookup[numpy.where(known, numbers, 0)], 0.0)
+
+    def roomIndex(self, room):
+        key = parseRoom(room) if isinstance(room, str) else room
+        index = int(numpy.searchsorted(self.roomKeys, key))
+        if index < len(self.roomKeys) and self.roomKeys[index] == key:
+            return index
+        return None
+
+    ####################################
+    #       QUERIES                    #
+    ####################################
+
+    # (monster Number, name, kind name, group size) for everything that spawns in a room ("1/8" or a roomKey)
+    def monstersInRoom(self, room):
+        index = self.roomIndex(room)
+        if index is None:
+            return []
+        entries = range(self.roomStart[index], self.roomStart[index + 1])
+        return [(int(self.numbers[self.entryMonster[entry]]), self.snapshot.value(int(self.entryMonster[entry]), "Name"),
+                 KIND_NAMES[self.entryKind[entry]], int(self.entrySize[entry])) for entry in entries]
+
+    # ("map/room", kind name, group size) for every room a monster (Number) spawns in
+    def roomsForMonster(self, number):
+        row = self.rowByNumber.get(number)
+        if row is None:
+            return []
+        entries = self.byMonster[self.monsterStart[row]:self.monsterStart[row + 1]]
+        return [(roomName(int(self.entryRoom[entry])), KIND_NAMES[self.entryKind[entry]], int(self.entrySize[entry]))
+                for entry in entries]
+
+    # what a visit to a room is expected to be worth (by EXP, DROPS or DROP_VALUE)
+    def roomValue(self, room, by=EXP):
+        index = self.roomIndex(room)
+        return 0.0 if index is None else float(self.roomValues[by][index])
+
+    # the `count` best rooms as ("map/room", value)
+    #   monsters:   optional bool array over snapshot rows, only those monsters count
+    #   lairsOnly:  only rooms with a lair in them
+    def bestRooms(self, count=10, by=EXP, monsters=None, lairsOnly=False):
+        if monsters is None and not lairsOnly:
+            totals = self.roomValues[by]
+            order = self.roomOrder[by][:count]
+        else:
+            weights = self.entryValues[by]
+            if monsters is not None:
+                weights = weights * numpy.asarray(monsters, dtype=bool)[self.entryMonster]
+            totals = numpy.bincount(self.entryRoomIndex, weights=weights, minlength=len(self.roomKeys))
+            if lairsOnly:
+                hasLair = numpy.bincount(self.entryRoomIndex, weights=(self.entryKind == LAIR), minlength=len(self.roomKeys)) > 0
+                totals = numpy.where(hasLair, totals, 0.0)
+            order = numpy.argsort(-totals, kind="stable")[:count]
+        return [(roomName(int(self.roomKeys[index])), float(totals[index])) for index in order if totals[index] > 0]
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from gameDatabase import GameDatabase
+
+    name = sys.argv[1] if len(sys.argv) > 1 else "guardsman"
+
+    database = GameDatabase()
+    began = time.perf_counter()
+    spawns = SpawnIndex(database)
+    elapsed = time.perf_counter() - began
+    print("built in %.1f ms: %d spawn entries, %d rooms, %d KB of arrays"
+          % (elapsed * 1e3, len(spawns.entryRoom), len(spawns.roomKeys),
+             sum(values.nbytes for values in (spawns.entryRoom, spawns.entryMonster, spawns.entryKind, spawns.entrySize,
+                                              spawns.roomKeys, spawns.roomStart, spawns.byMonster, spawns.monsterStart)) // 1024))
+
+    record = database.monsters.byName(name)
+    if record is not None:
+        rooms = spawns.roomsForMonster(record["Number"])
+        lairs = [room for room in rooms if room[1] == "lair"]
+        print("%s: %d rooms, %d lairs, e.g. %s" % (name, len(rooms), len(lairs), lairs[:3]))
+        if lairs:
+            print("  also in %s: %s" % (lairs[0][0], spawns.monstersInRoom(lairs[0][0])))
+
+    for by in (EXP, DROP_VALUE):
+        print("best rooms by %s: %s" % (by, ", ".join("%s %.0f" % room for room in spawns.bestRooms(5, by))))
+
+    # the same with a monster filter, e.g. nothing worth more than 100 exp a kill (a low level party)
+    weak = spawns.expPerKill <= 100
+    rounds = 100
+    began = time.perf_counter()
+    for _ in range(rounds):
+        best = spawns.bestRooms(5, EXP, monsters=weak, lairsOnly=True)
+    elapsed = time.perf_counter() - began
+    print("best lairs, <= 100 exp monsters: %s" % ", ".join("%s %.0f" % room for room in best))
+    print("  re-ranked in %.2f ms" % (elapsed / rounds * 1e3))
+
+    began = time.perf_counter()
+    for _ in range(rounds * 100):
+        spawns.bestRooms(10)
+    print("presorted bestRooms(10): %.1f us" % ((time.perf_counter() - began) / (rounds * 100) * 1e6))
@@ -0,0 +1,230 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Damage/heal per mana and per round for every spell at every level, and the best one to cast (NumPy)
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# A spell's strength grows with the caster's level: MinBase/MaxBase plus
+# MinInc/MaxInc every MinIncLVLs/MaxIncLVLs levels, up to level Cap. Which
+# spells a class gets depends on its MageryType/MageryLVL (classes file) and
+# the spell's Magery/MageryLVL and Classes ("(*)" for every class of that
+# magery, "(5)" for Priests only). SpellTable works all of it out for every
+# player spell at levels 1..maxLevel in one batched NumPy pass off the
+# columnar snapshots (gameSnapshot.py):
+#
+#   amount[kind]       spells x levels, mean damage/heal of one cast (0 below ReqLevel)
+#   perMana[kind]      ... divided by ManaCost
+#   perRound[kind]     ... per 1000 energy (a combat round), from EnergyCost
+#   castable           classes x spells x levels
+#
+# and from those a lookup table per kind and metric: the best spell for
+# every class x level x mana on hand. Mana above the dearest spell's cost
+# changes nothing, so the mana axis stops there and the tables stay small.
+# best(className, level, mana) is then a dict hit and one array read, cheap
+# enough to ask every round.
+#
+# The numbers are approximations, good for ranking spells:
+#   at level L a bound is Base + Inc * (min(L, Cap) // IncLVLs)    (Cap 0: no cap, IncLVLs 0: every level)
+#   one cast is the mean of uniform(min, max)
+#   EnergyCost 0 (most heals) counts as a whole round
+# Resistances and area spells hitting several targets aren't modelled.
+#
+#   spells = SpellTable(database)
+#   spells.best("Priest", level=12, mana=30, kind=HEAL)    # -> "grhe"
+#
+#   python spellTable.py [class] [mana]       build time, lookup time, best spells by level
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ability codes of the effects we rank
+DAMAGE = 17
+HEAL = 18
+KINDS = (DAMAGE, HEAL)
+
+# what to rank by
+PER_ROUND = "round"
+PER_MANA = "mana"
+PER_CAST = "cast"
+METRICS = (PER_ROUND, PER_MANA, PER_CAST)
+
+ROUND_ENERGY = 1000
+MAX_LEVEL = 75
+
+# best-spell tables hold row indexes, this means "nothing castable"
+NO_SPELL = -1
+
+
+class SpellTable(object):
+
+    def __init__(self, database, maxLevel=MAX_LEVEL):
+        if numpy is None:
+            raise ImportError("spellTable needs numpy (pip install numpy)")
+
+        self.maxLevel = maxLevel
+        spells = database.snapshot("spells")
+
+        # player spells only, the rest are monster/item spells nobody learns
+        classesColumn = spells.column("Classes")
+        rows = [row for row in range(spells.rows) if spells.string(classesColumn[row])]
+        self.rows = numpy.array(rows, dtype=numpy.int64)
+
+        def column(name):
+            values = numpy.array(spells.column(name), dtype=numpy.float64)
+            width = spells.width(name)
+            values = values.reshape(spells.rows, width) if width > 1 else values
+            return values[self.rows]
+
+        self.numbers = column("Number").astype(numpy.int64)
+        self.shorts = [spells.value(row, "Short") for row in rows]
+        self.names = [spells.value(row, "Name") for row in rows]
+        self.rowByShort = {short: index for index, short in enumerate(self.shorts)}
+        self.reqLevel = column("ReqLevel")
+        self.manaCost = column("ManaCost")
+        self.energyCost = column("EnergyCost")
+        self.magery = column("Magery")
+        self.mageryLevel = column("MageryLVL")
+        abilities = column("Abil")
+
+        # every bound at every level, spells x levels
+        levels = numpy.arange(1, maxLevel + 1, dtype=numpy.float64)
+        cap = column("Cap")
+        scaled = numpy.where(cap[:, None] > 0, numpy.minimum(levels[None, :], cap[:, None]), levels[None, :])
+
+        def bound(base, increase, every):
+            steps = numpy.floor(scaled / numpy.maximum(column(every), 1.0)[:, None])
+            return column(base)[:, None] + column(increase)[:, None] * steps
+
+        low = bound("MinBase", "MinInc", "MinIncLVLs")
+        high = numpy.maximum(bound("MaxBase", "MaxInc", "MaxIncLVLs"), low)
+        mean = (low + high) / 2.0
+        known = self.reqLevel[:, None] <= levels[None, :]
+
+        self.amount = {}
+        self.perMana = {}
+        self.perRound = {}
+        mana = numpy.maximum(self.manaCost, 1.0)[:, None]
+        energy = numpy.where(self.energyCost > 0, self.energyCost, ROUND_ENERGY)[:, None]
+        for kind in KINDS:
+            isKind = (abilities == kind).any(axis=1)
+            amount = numpy.where(known & isKind[:, None], mean, 0.0)
+            self.amount[kind] = amount
+            self.perMana[kind] = amount / mana
+            self.perRound[kind] = amount * ROUND_ENERGY / energy
+
+        # which classes get which spells, classes x spells
+        classes = database.snapshot("classes")
+        classNumbers = [int(number) for number in classes.column("Number")]
+        self.classIndex = {}
+        eligible = numpy.zeros((len(classNumbers), len(rows)), dtype=bool)
+        for index, number in enumerate(classNumbers):
+            self.classIndex[number] = index
+            self.classIndex[classes.value(index, "Name").lower()] = index
+            mageryType = classes.value(index, "MageryType")
+            mageryLevel = classes.value(index, "MageryLVL")
+            for spell, row in enumerate(rows):
+                allowed = spells.string(classesColumn[row])
+                if allowed == "(*)":
+                    eligible[index, spell] = (mageryType > 0 and self.magery[spell] == mageryType
+                                              and self.mageryLevel[spell] <= mageryLevel)
+                else:
+                    eligible[index, spell] = allowed == "(%d)" % number
+        self.eligible = eligible
+        self.castable = eligible[:, :, None] & known[None, :, :]
+
+        self.buildBestTables()
+
+    # best spell per class x level x mana for every kind and metric
+    def buildBestTables(self):
+        order = numpy.argsort(self.manaCost, kind="stable")
+        sortedCost = self.manaCost[order]
+        self.maxMana = int(sortedCost[-1]) if len(sortedCost) else 0
+
+        # spells affordable with m mana are order[:positions[m] + 1]
+        positions = numpy.searchsorted(sortedCost, numpy.arange(self.maxMana + 1), side="right") - 1
+
+        self.bestTables = {}
+        classes, spells, levels = self.castable.shape
+        for kind in KINDS:
+            for metric, values in ((PER_ROUND, self.perRound[kind]), (PER_MANA, self.perMana[kind]),
+                                   (PER_CAST, self.amount[kind])):
+                scores = numpy.where(self.castable & (values > 0)[None, :, :], values[None, :, :], -numpy.inf)
+                scores = scores[:, order, :]
+
+                # running best over spells in cost order, batched over classes x levels
+                prefix = numpy.empty((classes, spells + 1, levels), dtype=numpy.int16)
+                prefix[:, 0, :] = NO_SPELL
+                bestScore = numpy.full((classes, levels), -numpy.inf)
+                bestSpell = numpy.full((classes, levels), NO_SPELL, dtype=numpy.int16)
+                for position in range(spells):
+                    better = scores[:, position, :] > bestScore
+                    bestScore = numpy.where(better, scores[:, position, :], bestScore)
+                    bestSpell = numpy.where(better, order[position], bestSpell)
+                    prefix[:, position + 1, :] = bestSpell
+
+                # classes x levels x mana
+                self.bestTables[kind, metric] = numpy.ascontiguousarray(prefix[:, positions + 1, :].transpose(0, 2, 1))
+
+    ####################################
+    #       QUERIES                    #
+    ####################################
+
+    # Short code of the best spell a class can cast at a level with the mana it has, None if there's none
+    #   kind:   DAMAGE or HEAL
+    #   by:     PER_ROUND (most per combat round), PER_MANA (most per point of mana) or PER_CAST
+    def best(self, className, level, mana, kind=DAMAGE, by=PER_ROUND):
+        classIndex = self.classIndex[className.lower() if isinstance(className, str) else className]
+        level = min(max(level, 1), self.maxLevel)
+        mana = min(max(int(mana), 0), self.maxMana)
+        spell = self.bestTables[kind, by][classIndex, level - 1, mana]
+        return None if spell == NO_SPELL else self.shorts[spell]
+
+    # mean damage/heal of one cast of a spell (by Short code) at a level
+    def castAmount(self, short, level, kind=DAMAGE):
+        return float(self.amount[kind][self.rowByShort[short], min(max(level, 1), self.maxLevel) - 1])
+
+    # Short codes a class knows at a level, cheapest first
+    def known(self, className, level):
+        classIndex = self.classIndex[className.lower() if isinstance(className, str) else className]
+        spells = numpy.flatnonzero(self.castable[classIndex, :, min(max(level, 1), self.maxLevel) - 1])
+        spells = spells[numpy.argsort(self.manaCost[spells], kind="stable")]
+        return [self.shorts[spell] for spell in spells]
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from gameDatabase import GameDatabase
+
+    className = sys.argv[1] if len(sys.argv) > 1 else "Priest"
+    mana = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    database = GameDatabase()
+    began = time.perf_counter()
+    spells = SpellTable(database)
+    elapsed = time.perf_counter() - began
+    size = sum(table.nbytes for table in spells.bestTables.values())
+    print("built in %.1f ms: %d player spells, levels 1-%d, mana 0-%d, best tables %.1f KB"
+          % (elapsed * 1e3, len(spells.shorts), spells.maxLevel, spells.maxMana, size / 1e3))
+
+    print("%s with %d mana:" % (className, mana))
+    print("  level  damage/round  damage/mana  heal/round  heal/mana")
+    for level in (1, 3, 5, 10, 15, 20, 30, 40, 50):
+        print("  %5d  %-12s  %-11s  %-10s  %s" % (level, spells.best(className, level, mana, DAMAGE, PER_ROUND),
+                                                  spells.best(className, level, mana, DAMAGE, PER_MANA),
+                                                  spells.best(className, level, mana, HEAL, PER_ROUND),
+                                                  spells.best(className, level, mana, HEAL, PER_MANA)))
+
+    rounds = 100000
+    began = time.perf_counter()
+    for round in range(rounds):
+        spells.best(className, 12, round % 40)
+    elapsed = time.perf_counter() - began
+    print("best(): %.2f us" % (elapsed / rounds * 1e6))
@@ -0,0 +1,213 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Strip telnet IAC negotiation and ANSI escape codes out of raw socket chunks
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# A live MajorMUD stream isn't the clean text of the bundled capture: it has
+# telnet commands (IAC WILL/WONT/DO/DONT, subnegotiation, GA after prompts)
+# and ANSI colour codes ("\x1b[1;32m") all over it, and the parser's line
+# heuristics (e.g. the room title test on the first character) fall over on
+# those. TelnetFilter sits in front of majormudParser.feed() and cleans whole
+# chunks at a time:
+#
+#   - a chunk without a single IAC (0xFF) or ESC (0x1B) byte is handed back as
+#     is, that's two C level byte scans
+#   - otherwise one sub() per kind of sequence (telnet commands if there's an
+#     IAC, escape codes if there's an ESC) removes them all, the regex engine
+#     does the scanning and there's no python loop per byte; IAC IAC turns
+#     back into one literal 0xFF
+#   - a sequence cut off by the end of a chunk is held back and glued to the
+#     front of the next one
+#
+# With colours=True the ANSI codes are still removed, but the SGR (colour)
+# ones are also kept as side-band runs for the chunk just filtered, since
+# colour is how the game tells players and monsters apart:
+#
+#   clean = telnet.filter(chunk)
+#   telnet.colours   [(offset in clean, foreground 0-7 or None, bold), ...]
+#
+# Negotiation requests (IAC DO/DONT/WILL/WONT option) are collected in
+# `negotiations` so whoever owns the socket can answer them (drainNegotiations()).
+# Only the latest NEGOTIATIONS_KEPT are kept, so nobody draining them (the
+# parser doesn't) can't make the list grow for the life of the session.
+#
+#   majormudParser(telnet=True)     filters everything fed to it
+#   python telnetFilter.py          MB/s over clean and colourised captures
+
+import re
+
+IAC = 255
+
+# telnet commands: negotiation, subnegotiation and the two byte ones (GA, NOP, ...)
+TELNET = re.compile(rb"\xff(?:[\xfb-\xfe][\x00-\xff]|\xfa(?:[^\xff]|\xff[^\xf0])*\xff\xf0|[\xf0-\xf9])")
+
+# the same plus IAC IAC, group 1 is its second 0xFF and sub(rb"\1") puts that one back
+# (slower, so only used when a chunk actually has an escaped 0xFF in it)
+TELNET_ESCAPED = re.compile(rb"\xff(?:(\xff)|[\xfb-\xfe][\x00-\xff]|\xfa(?:[^\xff]|\xff[^\xf0])*\xff\xf0|[\xf0-\xf9])")
+
+# CSI sequences (colour, cursor, ...) and two byte escapes
+ESCAPE = re.compile(rb"\x1b(?:\[[0-9;?]*[ -/]*[@-~]|[@-Z\\-_])")
+
+# a sequence that the end of the chunk cut short
+PARTIAL = re.compile(rb"(?:\xff(?:[\xfb-\xfe]|\xfa(?:[^\xff]|\xff[^\xf0])*\xff?)?|\x1b(?:\[[0-9;?]*[ -/]*)?)\Z")
+
+# IAC DO/DONT/WILL/WONT option, IAC IAC is matched too (with empty groups) so the
+# escaped 0xFF of "IAC IAC WILL" isn't taken for the start of a negotiation
+NEGOTIATION = re.compile(rb"\xff(?:\xff|([\xfb-\xfe])([\x00-\xff]))")
+
+# negotiation requests kept until drained, the oldest go first
+NEGOTIATIONS_KEPT = 64
+
+# ANSI select graphic rendition, the only escape with something worth keeping
+# split() on it gives [text, parameters, text, parameters, ..., text]
+SGR = re.compile(rb"\x1b\[([0-9;]*)m")
+
+# how far back from the end of a chunk a cut off sequence is looked for
+PARTIAL_WINDOW = 512
+
+COMMAND_NAMES = {251: "WILL", 252: "WONT", 253: "DO", 254: "DONT"}
+
+
+class TelnetFilter(object):
+
+    def __init__(self, colours=False):
+        self.keepColours = colours
+        self.colours = []           # side-band colour runs of the last filtered chunk
+        self.negotiations = []      # (command name, option) waiting to be answered
+        self.pending = b""          # start of a sequence split over two chunks
+
+        # SGR state carried over from chunk to chunk
+        self.foreground = None
+        self.bold = False
+
+    # clean one chunk of socket data, returns bytes ready for majormudParser.feed()
+    def filter(self, data):
+        if self.pending:
+            data = self.pending + data
+            self.pending = b""
+
+        if self.keepColours:
+            self.colours = []
+
+        # the common case for a scrubbed stream: nothing to do at all
+        if b"\xff" not in data and b"\x1b" not in data:
+            return data
+
+        # hold back a sequence the chunk boundary cut in half
+        partial = PARTIAL.search(data, max(0, len(data) - PARTIAL_WINDOW))
+        if partial is not None and not self.isEscapedIAC(data, partial.start()):
+            self.pending = data[partial.start():]
+            data = data[:partial.start()]
+
+        if b"\xff" in data:
+            negotiations = self.negotiations
+            for command, option in NEGOTIATION.findall(data):
+                if command:
+                    negotiations.append((COMMAND_NAMES[command[0]], option[0]))
+            if len(negotiations) > NEGOTIATIONS_KEPT:
+                del negotiations[:-NEGOTIATIONS_KEPT]
+            if b"\xff\xff" in data:
+                data = TELNET_ESCAPED.sub(rb"\1", data)
+            else:
+                data = TELNET.sub(b"", data)
+
+        if b"\x1b" in data:
+            if self.keepColours:
+                data = self.recordColours(data)
+            else:
+                data = ESCAPE.sub(b"", data)
+
+        return data
+
+    # is the 0xFF at `position` the second half of an IAC IAC pair (so not the start of anything)
+    def isEscapedIAC(self, data, position):
+        run = 0
+        while position - run - 1 >= 0 and data[position - run - 1] == IAC:
+            run += 1
+        return run % 2 == 1
+
+    # turn SGR codes into colour runs and drop every escape, offsets are into the cleaned chunk
+    def recordColours(self, data):
+        parts = SGR.split(data)
+        colours = self.colours
+        offset = 0
+
+        for index in range(0, len(parts), 2):
+            text = parts[index]
+            if b"\x1b" in text:
+                text = parts[index] = ESCAPE.sub(b"", text)
+            offset += len(text)
+
+            if index + 1 == len(parts):
+                break
+
+            for code in (parts[index + 1] or b"0").split(b";"):
+                code = int(code or 0)
+                if code == 0:
+                    self.foreground = None
+                    self.bold = False
+                elif code == 1:
+                    self.bold = True
+                elif code == 22:
+                    self.bold = False
+                elif 30 <= code <= 37:
+                    self.foreground = code - 30
+                elif 90 <= code <= 97:
+                    self.foreground = code - 90
+                    self.bold = True
+                elif code == 39:
+                    self.foreground = None
+
+            if colours and colours[-1][0] == offset:
+                colours[-1] = (offset, self.foreground, self.bold)
+            else:
+                colours.append((offset, self.foreground, self.bold))
+
+        return b"".join(parts[0::2])
+
+    # hand back (and forget) the negotiation requests seen so far
+    def drainNegotiations(self):
+        negotiations = self.negotiations
+        self.negotiations = []
+        return negotiations
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+# wrap every line of a capture in colour codes, and follow every prompt with IAC GA,
+# the way a live game would send it
+def colourise(data):
+    lines = data.split(b"\n")
+    coloured = []
+    for index, line in enumerate(lines):
+        if line.startswith(b"[HP="):
+            line = line.replace(b"]:", b"]:\xff\xf9", 1)
+        coloured.append(b"\x1b[%d;%dm" % (index % 2, 31 + index % 7) + line + b"\x1b[0m")
+    return b"\xff\xfb\x01\xff\xfb\x03" + b"\r\n".join(coloured)
+
+
+if __name__ == "__main__":
+    import time
+
+    with open("2025-03-31_10-56-19.log", "rb") as file:
+        capture = file.read()
+
+    clean = capture * 40
+    coloured = colourise(clean)
+    chunkSize = 4096
+
+    for label, data, keepColours in (("clean", clean, False), ("coloured", coloured, False),
+                                     ("coloured + side-band", coloured, True)):
+        telnet = TelnetFilter(colours=keepColours)
+        chunks = [data[i:i + chunkSize] for i in range(0, len(data), chunkSize)]
+
+        began = time.perf_counter()
+        output = b"".join(telnet.filter(chunk) for chunk in chunks)
+        elapsed = time.perf_counter() - began
+
+        assert output.replace(b"\r\n", b"\n") == clean.replace(b"\r\n", b"\n"), label
+        print("%-22s %6.1f MB  %8.1f MB/s  %6.2f ms/MB" % (label, len(data) / 1e6, len(data) / elapsed / 1e6,
+                                                           elapsed * 1e3 / (len(data) / 1e6)))
@@ -4,23 +4,70 @@
 # Contact:  mab535@gmail.com
 # Copyright (C) 2025 Mark Buchanan
 
+from gameDatabase import GameDatabase
 from majormudParser import majormudParser 
+from monsterThreat import CharacterStats, ThreatTable
+from parserEvents import CombatHit, Command
+from shopIndex import ShopIndex
 
 # instantiate an object
 mp = majormudParser()
 
-# test capture file
-with open(r"2025-03-31_10-56-19.log", "r") as file:
+# print the commands the parser suggests
+mp.subscribe(Command, lambda event: print("Ok, the program should respond with: " + event.command))
 
-    # read the first line of the capture
-    line = file.readline()
+# test capture file, read as raw bytes in socket sized chunks like a telnet client would
+with open(r"2025-03-31_10-56-19.log", "rb") as file:
 
-    while line:
+    # read the first chunk of the capture
+    chunk = file.read(4096)
 
-        # main call, feed a line to the class and let it do its thing
-        mp.process_line(line)
+    while chunk:
 
-        # grab the next while not EOF and continue processing
-        line = file.readline()
+        # main call, feed the bytes to the class and let it do its thing
+        mp.feed(chunk)
 
+        # grab the next chunk while not EOF and continue processing
+        chunk = file.read(4096)
 
+    # anything left over without a newline
+    mp.flush()
+
+# a monster hitting "with its claws" from the capture, the weapon isn't the target
+hits = []
+checker = majormudParser()
+checker.subscribe(CombatHit, hits.append)
+checker.process_line("The small filthbug rips Laverne with its claws for 3 damage!\n")
+assert hits == [CombatHit("small filthbug", "rips", "Laverne", 3, False)], hits
+
+# a who-list cut short by a prompt (no blank line after it) must not swallow what follows
+hits = []
+checker = majormudParser()
+checker.subscribe(CombatHit, hits.append)
+for line in ("         ===================\n", "Violet Plant   Hero\n", "[HP=49]:", "Shirley slashes kobold thief for 4 damage!\n"):
+    checker.process_line(line)
+assert hits == [CombatHit("Shirley", "slashes", "kobold thief", 4, False)], hits
+assert checker.openBlock is None
+
+# shops with Markup% 0 (the Newhaven General Store, ...) sell at the list price, they don't give things away
+database = GameDatabase()
+shops = ShopIndex(database)
+lantern = database.items.byName("lantern")
+newhaven = [offer for offer in shops.inventory(47) if offer.item == lantern["Number"]]
+assert [offer.price for offer in newhaven] == [lantern["Price"]], newhaven
+assert shops.cheapest("lantern").copper > 0, shops.cheapest("lantern")
+
+# a stat block with a new armour class recomputes the threat table the parser attacks by
+checker = majormudParser(database=database)
+threats = ThreatTable(database, CharacterStats(armourClass=1, damageResist=0, hitPoints=49, accuracy=40,
+                                               minDamage=2, maxDamage=9))
+threats.attach(checker)
+assert checker.threatTable is threats
+before = threats.threat(14).damagePerRound
+for line in ("Name: Snake Plant                      Lives/CP:      9/2\n",
+             "Hits:    60/60    Armour Class:  30/4  Thievery:        0\n",
+             "Willpower: 60     Charm:   40          MagicRes:       65\n",
+             "[HP=60 (Resting) ]:"):
+    checker.process_line(line)
+assert threats.character[:3] == (30, 4, 60), threats.character
+assert threats.threat(14).damagePerRound < before, (before, threats.threat(14))
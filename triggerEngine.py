@@ -0,0 +1,296 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Declarative triggers (match -> command, priority, cooldown) loaded from a rules file
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# What the bot does about what it sees used to be hardcoded in the parser
+# (a monsterList to attack, a pickUpItemList to get). It now comes from rules,
+# usually a JSON file like triggers.json:
+#
+#   [
+#     {"kind": "monster", "match": "carrion beast", "command": "a {token}"},
+#     {"kind": "item", "match": "padded vest", "command": "g {token}", "priority": 5},
+#     {"kind": "line", "match": "You feel weak", "command": "rest", "cooldown": 30}
+#   ]
+#
+#   kind       monster: a monster name in "Also here" (normalised, no adjectives, see monsterMatcher.py)
+#              item:    an item name in "You notice" (singular, lower case, see itemResolver.py)
+#              line:    text appearing anywhere in a line
+#   match      what to look for
+#   command    what to send, {token} is the entry as the game printed it ("fierce kobold thief"),
+#              {name} the normalised name, {match} the text a line rule matched
+#   priority   higher first when several rules fire off the same list/line (default 0)
+#   cooldown   seconds before the same rule can fire again (default 0, every time)
+#   action     the Command event's action (default attack/get/trigger by kind)
+#   name       identifies the rule for its cooldown (default "kind:match")
+#
+# monster and item rules are a dict lookup on the name the resolvers already
+# work out. Line rules can run into the thousands, so they are all compiled
+# into one regex shaped like a trie of the patterns (shared prefixes factored
+# out, "(?:kobold (?:thief|guard)|orc)") wrapped in a lookahead, which gives a
+# match at every position some pattern starts: one pass of the regex engine
+# per line, in C, however many rules there are. A match is the longest pattern
+# at its position, and the patterns that are prefixes of it are worked out once
+# at compile time, so overlapping patterns all still fire.
+#
+# RuleSet is the compiled, read-only form and can be shared. RuleFile watches a
+# rules file (at most one stat() per `interval` seconds) and swaps in a new
+# RuleSet when it changes, so rules can be edited while sessions run; a file
+# that fails to load leaves the old rules in place and sets `error`.
+# TriggerEngine is the per parser part: the cooldowns, which are kept by rule
+# name and so survive a reload.
+#
+#   rules = RuleFile("triggers.json")                  # one per process
+#   parser = majormudParser(triggers=rules)           # many sessions
+#
+#   python triggerEngine.py     lines/s with thousands of line rules vs scanning per rule
+
+import json
+import os
+import re
+import time
+
+MONSTER = "monster"
+ITEM = "item"
+LINE = "line"
+
+DEFAULT_ACTIONS = {MONSTER: "attack", ITEM: "get", LINE: "trigger"}
+
+# how often (seconds) a RuleFile looks at the file's mtime
+RELOAD_INTERVAL = 1.0
+
+
+class Rule(object):
+    __slots__ = ("name", "kind", "match", "command", "priority", "cooldown", "action", "order", "template")
+
+    def __init__(self, kind, match, command, priority=0, cooldown=0.0, action=None, name=None, order=0):
+        if kind not in DEFAULT_ACTIONS:
+            raise ValueError("unknown trigger kind %r (expected monster, item or line)" % (kind,))
+        if not match or not command:
+            raise ValueError("trigger needs a match and a command")
+        self.kind = kind
+        self.match = match
+        self.command = command
+        self.priority = priority
+        self.cooldown = cooldown
+        self.action = action or DEFAULT_ACTIONS[kind]
+        self.name = name or kind + ":" + match
+        self.order = order                  # position in the file, breaks priority ties
+        self.template = '{' in command
+
+    # the command with its placeholders filled in
+    def render(self, token, name, match):
+        if not self.template:
+            return self.command
+        return self.command.replace("{token}", token).replace("{name}", name).replace("{match}", match)
+
+    def __repr__(self):
+        return "Rule(%s -> %r)" % (self.name, self.command)
+
+
+# one regex for many literal patterns: a trie of them, written out as nested groups
+def trieRegex(patterns):
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for char in pattern:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node):
+        # children first so the longest pattern wins, "" (a pattern ends here) makes the rest optional
+        alternatives = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1 and "" not in node:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")" + ("?" if "" in node else "")
+
+    return emit(trie), trie
+
+
+class RuleSet(object):
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.monsters = {}      # monster name -> rules
+        self.items = {}         # item name -> rules
+        self.lineRules = {}     # pattern -> rules
+        for rule in self.rules:
+            table = self.monsters if rule.kind == MONSTER else self.items if rule.kind == ITEM else self.lineRules
+            table.setdefault(rule.match, []).append(rule)
+
+        # every line pattern in one lookahead regex, group 1 is the longest pattern starting at a position
+        self.linePattern = None
+        self.prefixRules = {}   # matched pattern -> rules of it and every pattern that's a prefix of it
+        if self.lineRules:
+            expression, trie = trieRegex(self.lineRules)
+            self.linePattern = re.compile("(?=(" + expression + "))")
+            for pattern in self.lineRules:
+                node = trie
+                rules = []
+                for length, char in enumerate(pattern, 1):
+                    node = node[char]
+                    if "" in node:
+                        rules.extend(self.lineRules[pattern[:length]])
+                self.prefixRules[pattern] = rules
+
+    def __len__(self):
+        return len(self.rules)
+
+    # rules of every line pattern in the line, each rule once
+    def lineMatches(self, line):
+        matches = []
+        seen = set()
+        for found in self.linePattern.finditer(line):
+            text = found.group(1)
+            for rule in self.prefixRules[text]:
+                if rule.name not in seen:
+                    seen.add(rule.name)
+                    matches.append((rule, rule.match))
+        return matches
+
+    @classmethod
+    def fromDicts(cls, entries):
+        rules = []
+        for order, entry in enumerate(entries):
+            try:
+                rules.append(Rule(entry["kind"], entry["match"], entry["command"], priority=entry.get("priority", 0),
+                                  cooldown=float(entry.get("cooldown", 0)), action=entry.get("action"),
+                                  name=entry.get("name"), order=order))
+            except (KeyError, TypeError, ValueError) as error:
+                raise ValueError("trigger %d: %s" % (order, error))
+        return cls(rules)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            return cls.fromDicts(json.load(file))
+
+    # what the parser did before there were rules files: attack carrion beasts, pick up padded vests
+    @classmethod
+    def defaults(cls):
+        return cls([Rule(MONSTER, "carrion beast", "a {token}"), Rule(ITEM, "padded vest", "g {token}", order=1)])
+
+
+class RuleFile(object):
+
+    def __init__(self, path, interval=RELOAD_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.interval = interval
+        self.clock = clock
+        self.error = None           # why the last reload failed, None if it didn't
+        self.version = 0            # bumped on every successful (re)load
+
+        self.signature = self.stat()
+        self.rules = RuleSet.load(path)
+        self.version = 1
+        self.checked = clock()
+
+    def stat(self):
+        info = os.stat(self.path)
+        return info.st_mtime_ns, info.st_size
+
+    # the current RuleSet, reloading it first if the file changed (checked at most every `interval`)
+    def current(self):
+        now = self.clock()
+        if now - self.checked >= self.interval:
+            self.checked = now
+            self.reload()
+        return self.rules
+
+    def reload(self, force=False):
+        try:
+            signature = self.stat()
+            if signature == self.signature and not force:
+                return False
+            self.signature = signature
+            self.rules = RuleSet.load(self.path)
+        except (OSError, ValueError) as error:
+            self.error = str(error)
+            return False
+        self.error = None
+        self.version += 1
+        return True
+
+
+class TriggerEngine(object):
+
+    # source: a RuleSet, a RuleFile (hot reloaded), a path to a rules file, or None for the defaults
+    def __init__(self, source=None, clock=time.monotonic):
+        if source is None:
+            source = RuleSet.defaults()
+        elif isinstance(source, str):
+            source = RuleFile(source)
+        self.source = source
+        self.clock = clock
+        self.rules = source.current() if isinstance(source, RuleFile) else source
+        self.lastFired = {}         # rule name -> clock() it last fired
+
+    # pick up a reloaded rules file, cheap enough for every prompt
+    def refresh(self):
+        if isinstance(self.source, RuleFile):
+            self.rules = self.source.current()
+
+    # (rule, token, name) candidates -> [(command, rule, token)], by priority, cooldowns applied
+    def commands(self, candidates):
+        if len(candidates) > 1:
+            candidates.sort(key=lambda candidate: (-candidate[0].priority, candidate[0].order))
+
+        commands = []
+        now = None
+        for rule, token, name in candidates:
+            if rule.cooldown:
+                if now is None:
+                    now = self.clock()
+                last = self.lastFired.get(rule.name)
+                if last is not None and now - last < rule.cooldown:
+                    continue
+                self.lastFired[rule.name] = now
+            commands.append((rule.render(token, name, name), rule, token))
+        return commands
+
+    # commands for the line rules that match a line
+    def lineCommands(self, line):
+        matches = self.rules.lineMatches(line)
+        if not matches:
+            return matches
+        return self.commands([(rule, match, match) for rule, match in matches])
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+if __name__ == "__main__":
+    import random
+
+    from gameDatabase import GameDatabase
+
+    with open("2025-03-31_10-56-19.log", "r", encoding="cp437") as file:
+        lines = file.readlines() * 10
+
+    # a rule for every monster and item name seen anywhere in a line, plus a few that really fire
+    database = GameDatabase()
+    names = sorted({record.get("Name") for table in (database.monsters, database.items) for record in table} - {None, ""})
+    random.seed(1)
+    entries = [{"kind": LINE, "match": name, "command": "look " + name} for name in random.sample(names, min(3000, len(names)))]
+    entries += [{"kind": LINE, "match": "You hear movement", "command": "look"},
+                {"kind": LINE, "match": "gossips:", "command": "nop", "cooldown": 5}]
+    rules = RuleSet.fromDicts(entries)
+    engine = TriggerEngine(rules)
+    print("%d line rules, regex %d chars" % (len(rules.lineRules), len(rules.linePattern.pattern)))
+
+    began = time.perf_counter()
+    fired = sum(len(engine.lineCommands(line)) for line in lines)
+    elapsed = time.perf_counter() - began
+    print("compiled:  %8.0f lines/s  (%d commands)" % (len(lines) / elapsed, fired))
+
+    # the same rules checked one at a time, the way the if chains scaled
+    patterns = list(rules.lineRules)
+    sample = lines[:len(lines) // 10]
+    began = time.perf_counter()
+    scanned = sum(1 for line in sample for pattern in patterns if pattern in line)
+    elapsed = time.perf_counter() - began
+    print("per rule:  %8.0f lines/s  (%d matches)" % (len(sample) / elapsed, scanned))
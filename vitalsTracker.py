@@ -0,0 +1,292 @@
+# Author:   Mark Buchanan
+# Date:     31 March 2025
+# Purpose:  Time series of our HP/mana and the party's health, with heal/rest/flee thresholds
+# Contact:  mab535@gmail.com
+# Copyright (C) 2025 Mark Buchanan
+
+# The game tells us how we're doing in two places:
+#
+#   [HP=49 (Resting) ]:                 the prompt, after every command and round
+#   [HP=31/MA=12]:                      (MA= for casters)
+#     Violet Plant   (Priest)   [M:100%] [H:100%]   - Frontrank
+#     Snake Plant    (Warrior)           [H:100%] R - Frontrank
+#                                       the party list ("par")
+#
+# The parser turns those into Vitals and PartyMember events, and VitalsTracker
+# keeps the last `size` samples of each in fixed arrays (one Series for us, one
+# per party member) so nothing grows however long the session runs.
+#
+# Thresholds are checked right there in the event callback, which means in the
+# same process_line()/feed() call that saw the prompt, so a bot reacting to
+# "HP below 30%" doesn't wait for anything. They're edge triggered: a threshold
+# fires once when the value drops below it and re-arms when the value comes
+# back above it plus `hysteresis`, so a prompt a second at 20% HP doesn't queue
+# twenty flee commands.
+#
+# Every prompt and party event carries the perf_counter() stamp of when the
+# parser read it, so the tracker also measures how long it took from the
+# prompt being parsed to the callback being called (latencySnapshot(), in us).
+#
+#   vitals = VitalsTracker()
+#   vitals.attach(parser)
+#   vitals.addThreshold("flee", 0.3, lambda action, who, value: send("flee"))
+#   vitals.addThreshold("heal", 0.6, healPartyMember, who=PARTY)
+#
+#   python vitalsTracker.py       prompt-to-callback latency over the bundled capture
+
+import time
+from array import array
+
+from parserEvents import PartyMember, StatBlock, Vitals
+from parserStats import SampleRing
+
+SERIES_SIZE = 1024
+
+# `who` for a threshold on anybody in the party (other than us)
+PARTY = "party"
+
+# fraction above a threshold a value has to get back to before it can fire again
+HYSTERESIS = 0.05
+
+
+# the last `size` samples of one character, in a ring
+#   hp/mana: our own prompt values, or a party member's percentages (-1 when unknown)
+class Series(object):
+    __slots__ = ("times", "hp", "mana", "resting", "next", "count")
+
+    def __init__(self, size=SERIES_SIZE):
+        self.times = array("d", bytes(8 * size))
+        self.hp = array("i", bytes(4 * size))
+        self.mana = array("i", bytes(4 * size))
+        self.resting = array("b", bytes(size))
+        self.next = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, when, hp, mana, resting):
+        index = self.next
+        self.times[index] = when
+        self.hp[index] = hp
+        self.mana[index] = -1 if mana is None else mana
+        self.resting[index] = resting
+        self.next = (index + 1) % len(self.times)
+        if self.count < len(self.times):
+            self.count += 1
+
+    # (time, hp, mana, resting) of the newest sample, None if there isn't one
+    def latest(self):
+        if not self.count:
+            return None
+        index = self.next - 1
+        return self.times[index], self.hp[index], self.mana[index], bool(self.resting[index])
+
+    # samples taken at or after `when` (the tracker's clock), oldest first
+    def since(self, when):
+        size = len(self.times)
+        samples = []
+        for offset in range(self.count, 0, -1):
+            index = (self.next - offset) % size
+            if self.times[index] >= when:
+                samples.append((self.times[index], self.hp[index], self.mana[index], bool(self.resting[index])))
+        return samples
+
+
+# armed:  False once fired, until the value is back above below + hysteresis
+# fired:  for PARTY, the members it has fired for (each of them arms on their own)
+class Threshold(object):
+    __slots__ = ("action", "below", "callback", "who", "field", "armed", "fired")
+
+    def __init__(self, action, below, callback, who, field):
+        self.action = action
+        self.below = below
+        self.callback = callback
+        self.who = who
+        self.field = field
+        self.armed = True
+        self.fired = set()
+
+
+class VitalsTracker(object):
+
+    def __init__(self, size=SERIES_SIZE, hysteresis=HYSTERESIS, clock=time.monotonic):
+        self.size = size
+        self.hysteresis = hysteresis
+        self.clock = clock
+
+        self.me = Series(size)
+        self.party = {}             # name -> Series
+        self.maxHP = None           # from the stat block, else the highest HP seen
+        self.maxMana = None
+        self.state = None           # "Resting", "Meditating", ... from the last prompt
+
+        self.thresholds = []
+        self.partyThresholds = []
+        self.latency = SampleRing()
+
+    def attach(self, parser):
+        parser.subscribe(Vitals, self.onVitals)
+        parser.subscribe(PartyMember, self.onPartyMember)
+        parser.subscribe(StatBlock, self.onStatBlock)
+
+    # callback(action, who, fraction) once `field` ("hp" or "mana") drops below `below` (a fraction of max)
+    #   who: None for us, PARTY for any party member, or one member's name
+    def addThreshold(self, action, below, callback, who=None, field="hp"):
+        threshold = Threshold(action, below, callback, who, field)
+        if who is None:
+            self.thresholds.append(threshold)
+        else:
+            self.partyThresholds.append(threshold)
+        return threshold
+
+    def removeThreshold(self, threshold):
+        for thresholds in (self.thresholds, self.partyThresholds):
+            if threshold in thresholds:
+                thresholds.remove(threshold)
+
+    # fire or re-arm a threshold against a fraction, returns whether it's armed afterwards
+    def check(self, threshold, armed, who, fraction, stamp):
+        if armed:
+            if fraction < threshold.below:
+                if stamp is not None:
+                    self.latency.add(time.perf_counter() - stamp)
+                threshold.callback(threshold.action, who, fraction)
+                return False
+        elif fraction >= threshold.below + self.hysteresis:
+            return True
+        return armed
+
+    ####################################
+    #       EVENTS                     #
+    ####################################
+
+    def onVitals(self, event):
+        hp = event.hp
+        mana = event.mana
+        self.state = event.state
+        self.me.add(self.clock(), hp, mana, event.state == "Resting")
+
+        if self.maxHP is None or hp > self.maxHP:
+            self.maxHP = hp
+        if mana is not None and (self.maxMana is None or mana > self.maxMana):
+            self.maxMana = mana
+
+        for threshold in self.thresholds:
+            if threshold.field == "mana":
+                if mana is None or not self.maxMana:
+                    continue
+                fraction = mana / self.maxMana
+            else:
+                fraction = hp / self.maxHP if self.maxHP else 0.0
+            threshold.armed = self.check(threshold, threshold.armed, None, fraction, event.stamp)
+
+    def onPartyMember(self, event):
+        name = event.name
+        series = self.party.get(name)
+        if series is None:
+            series = self.party[name] = Series(self.size)
+        series.add(self.clock(), event.health, event.mana, event.resting)
+
+        for threshold in self.partyThresholds:
+            if threshold.who != PARTY and threshold.who != name:
+                continue
+            value = event.mana if threshold.field == "mana" else event.health
+            if value is None:
+                continue
+
+            if threshold.who == PARTY:
+                if self.check(threshold, name not in threshold.fired, name, value / 100.0, event.stamp):
+                    threshold.fired.discard(name)
+                else:
+                    threshold.fired.add(name)
+            else:
+                threshold.armed = self.check(threshold, threshold.armed, name, value / 100.0, event.stamp)
+
+    # "Hits: 49/49" is the real maximum, better than the highest prompt seen
+    def onStatBlock(self, event):
+        hits = event.fields.get("Hits", "")
+        _, slash, maximum = hits.partition("/")
+        if slash and maximum.isdigit():
+            self.maxHP = int(maximum)
+        mana = event.fields.get("Mana", "")
+        _, slash, maximum = mana.partition("/")
+        if slash and maximum.isdigit():
+            self.maxMana = int(maximum)
+
+    ####################################
+    #       QUERIES                    #
+    ####################################
+
+    # our HP as a fraction of max, None before the first prompt
+    def hpFraction(self):
+        latest = self.me.latest()
+        if latest is None or not self.maxHP:
+            return None
+        return latest[1] / self.maxHP
+
+    # name -> (health %, mana % or None, resting) from the last party list
+    def partySnapshot(self):
+        snapshot = {}
+        for name, series in self.party.items():
+            latest = series.latest()
+            if latest is not None:
+                snapshot[name] = (latest[1], None if latest[2] < 0 else latest[2], latest[3])
+        return snapshot
+
+    # HP lost per second over the last `seconds` of prompts (negative while healing)
+    def hpLossRate(self, seconds=10.0):
+        samples = self.me.since(self.clock() - seconds)
+        if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+            return 0.0
+        return (samples[0][1] - samples[-1][1]) / (samples[-1][0] - samples[0][0])
+
+    # prompt parsed -> threshold callback called, in microseconds
+    def latencySnapshot(self):
+        times = self.latency.sorted()
+        if not times:
+            return {"count": 0}
+        return {
+            "count": len(times),
+            "p50": times[len(times) // 2] * 1e6,
+            "p99": times[min(len(times) - 1, int(len(times) * 0.99))] * 1e6,
+            "max": times[-1] * 1e6,
+        }
+
+
+####################################
+#       BENCHMARK                  #
+####################################
+
+if __name__ == "__main__":
+    from majormudParser import majormudParser
+
+    with open("2025-03-31_10-56-19.log", "r", encoding="cp437") as file:
+        lines = file.readlines()
+
+    # a prompt that crosses every threshold each time, so every prompt is timed
+    lines += ["[HP=5]:\n", "[HP=49]:\n"] * 5000
+
+    parser = majormudParser()
+    vitals = VitalsTracker()
+    vitals.attach(parser)
+
+    fired = {}
+
+    def react(action, who, fraction):
+        fired[action] = fired.get(action, 0) + 1
+
+    vitals.addThreshold("flee", 0.3, react)
+    vitals.addThreshold("rest", 0.8, react)
+    vitals.addThreshold("heal", 0.6, react, who=PARTY)
+
+    began = time.perf_counter()
+    for line in lines:
+        parser.process_line(line)
+    elapsed = time.perf_counter() - began
+
+    print("%d lines in %.3f s, max HP %s, party %s" % (len(lines), elapsed, vitals.maxHP, vitals.partySnapshot()))
+    print("fired %s" % fired)
+    latency = vitals.latencySnapshot()
+    print("prompt -> callback: %d samples, p50 %.2f us, p99 %.2f us, max %.2f us"
+          % (latency["count"], latency["p50"], latency["p99"], latency["max"]))